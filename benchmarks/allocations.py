@@ -0,0 +1,112 @@
+"""
+Memory allocated on the Heroku publish path, per drain line.
+
+The lines of fake drain bodies are split, formatted into their JSON message
+and published to an AMQPConnection whose channel discards them; for each
+line, tracemalloc gives the peak of the memory allocated while it is
+handled. The 'legacy' scenario builds a dict per line and a new
+BasicProperties per message, as the handler used to.
+
+    python -m benchmarks.allocations
+    python -m benchmarks.allocations --lines 100000
+"""
+import argparse
+import gc
+import json
+import random
+import tracemalloc
+from time import perf_counter
+from unittest.mock import patch
+
+import pika
+
+from src.config import TruncateConfig
+from src.handlers.heroku import drain_format
+from src.lib.AMQPConnection import AMQPConnection
+from src.lib.syslogSplitter import split
+from tools.fakelogGenerator import heroku_payload
+
+URI = '/heroku/v1/production/DummyAppName'
+ROUTING_KEY = 'heroku.v1.production.DummyAppName'
+HEADERS = {'x-request-id': '0' * 32, 'x-received-at': 0}
+
+
+class NullChannel:
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+        pass
+
+
+def legacy_format_message(uri, msg):
+    payload = dict()
+    path = uri.split('/')[1:]
+    payload['type'] = path[0]
+    payload['parser_ver'] = path[1]
+    payload['env'] = path[2]
+    payload['app'] = path[3]
+    payload['message'] = msg
+    payload['http_content_length'] = len(msg)
+    return json.dumps(payload)
+
+
+def legacy(con, lines):
+    con._properties = lambda content_encoding, headers: pika.BasicProperties(
+        delivery_mode=2, content_encoding=content_encoding, headers=headers)
+    for line in lines:
+        con.publish(ROUTING_KEY, legacy_format_message(URI, line), headers=HEADERS)
+        con._pending_confirms.clear()
+        yield
+
+
+def current(con, lines):
+    drain = drain_format(URI)
+    for line in lines:
+        con.publish(ROUTING_KEY, drain.format(line), headers=HEADERS)
+        con._pending_confirms.clear()
+        yield
+
+
+def measure(scenario, lines):
+    """
+    :return: the microseconds and the peak bytes allocated per line
+    """
+    con = AMQPConnection()
+    con._channel = NullChannel()
+    gc.collect()
+
+    start = perf_counter()
+    for _ in scenario(con, lines):
+        pass
+    elapsed = perf_counter() - start
+
+    tracemalloc.start()
+    total = 0
+    steps = scenario(con, lines)
+    while True:
+        current_size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        try:
+            next(steps)
+        except StopIteration:
+            break
+        total += tracemalloc.get_traced_memory()[1] - current_size
+    tracemalloc.stop()
+    return {'us_per_line': round(elapsed / len(lines) * 1e6, 3), 'peak_bytes_per_line': round(total / len(lines))}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--lines', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    lines = []
+    with patch('src.lib.syslogSplitter.StatsClientSingleton'):
+        while len(lines) < args.lines:
+            lines += split(heroku_payload(rng)[0], TruncateConfig)
+    results = {name: measure(scenario, lines) for name, scenario in (('legacy', legacy), ('current', current))}
+    print(json.dumps({'lines': len(lines), 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
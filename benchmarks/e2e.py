@@ -0,0 +1,259 @@
+"""
+End-to-end benchmark of the service.
+
+`main.app` is booted in a child process against a fake pika connection (no
+RabbitMQ needed), each route is driven over HTTP with a corpus of realistic
+payloads, and the in-process hot paths (split, publish) are measured alone.
+
+Messages/sec, latency percentiles and the server peak RSS are written to a
+JSON results file, named after the current commit, to be compared across commits:
+
+    python -m benchmarks.e2e
+    python -m benchmarks.e2e --compare benchmarks/results/<before>.json benchmarks/results/<after>.json
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import socket
+import subprocess
+import sys
+from datetime import datetime
+from time import perf_counter
+from unittest.mock import patch
+
+import tornado
+import tornado.web
+from tornado import gen
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+from tornado.ioloop import IOLoop
+
+from benchmarks.fake_amqp import FakeTornadoConnection, fake_amqp_connection
+from tools.fakelogGenerator import Corpus, heroku_payload
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), 'results')
+ROUTES = ('heroku', 'mobile', 'cloudtrail')
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else 0
+
+
+class StatsHandler(tornado.web.RequestHandler):
+    """
+    Report the number of messages published by the server and its peak RSS
+    """
+
+    def get(self):
+        self.write({
+            'published': sum(channel.published for channel in FakeTornadoConnection.channels),
+            'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        })
+
+
+def serve(port, ready):
+    """
+    Child process: boot main.app on a fake pika connection
+    """
+    logging.getLogger('tornado.access').setLevel(logging.ERROR)
+    # every benchmarked route is served, whatever the environment
+    os.environ['ENABLED_ROUTES'] = ','.join(ROUTES)
+    # AMQP is connected once the ioloop runs, the patch is kept for the process lifetime
+    patch('pika.TornadoConnection', FakeTornadoConnection, create=True).start()
+    import main
+    from src.lib.serverSettings import make_server
+
+    main.app.add_handlers(r'.*$', [(r'/__benchmark__/stats', StatsHandler)])
+    make_server(main.app).listen(port, '127.0.0.1')
+    ready.set()
+    IOLoop.current().start()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@gen.coroutine
+def drive(url, corpus, requests, concurrency):
+    """
+    closed-loop load: `concurrency` clients sending `requests` requests in total
+    :return: a tuple (latencies, errors, elapsed)
+    """
+    client = AsyncHTTPClient(max_clients=concurrency)
+    latencies = []
+    errors = [0]
+    sent = [0]
+
+    @gen.coroutine
+    def one_client():
+        while sent[0] < requests:
+            path, body, headers = corpus[sent[0]]
+            sent[0] += 1
+            start = perf_counter()
+            try:
+                response = yield client.fetch(HTTPRequest(url + path, method='POST', body=body, headers=headers,
+                                                          decompress_response=False), raise_error=False)
+                code = response.code
+            except Exception:
+                code = 599
+            latencies.append(perf_counter() - start)
+            if code != 200:
+                errors[0] += 1
+
+    start = perf_counter()
+    yield [one_client() for _ in range(concurrency)]
+    return latencies, errors[0], perf_counter() - start
+
+
+@gen.coroutine
+def stats(url):
+    response = yield AsyncHTTPClient().fetch(url + '/__benchmark__/stats')
+    return json.loads(response.body.decode())
+
+
+def bench_route(route, requests, concurrency, corpus_size, seed):
+    """
+    boot a server and drive one route
+    """
+    ctx = multiprocessing.get_context('spawn')
+    ready = ctx.Event()
+    port = free_port()
+    server = ctx.Process(target=serve, args=(port, ready), daemon=True)
+    server.start()
+    try:
+        if not ready.wait(30):
+            raise RuntimeError('server did not start')
+        url = 'http://127.0.0.1:{}'.format(port)
+        corpus = Corpus((route,), corpus_size, 'integration', seed)
+        ioloop = IOLoop.current()
+        # warm up, and check the route answers
+        _, errors, _ = ioloop.run_sync(lambda: drive(url, corpus, 100, 10))
+        if errors:
+            raise RuntimeError('{}: {} warm up requests did not answer 200'.format(route, errors))
+        before = ioloop.run_sync(lambda: stats(url))
+        latencies, errors, elapsed = ioloop.run_sync(lambda: drive(url, corpus, requests, concurrency))
+        after = ioloop.run_sync(lambda: stats(url))
+    finally:
+        server.terminate()
+        server.join()
+
+    return {
+        'requests_per_sec': round(len(latencies) / elapsed),
+        'messages_per_sec': round((after['published'] - before['published']) / elapsed),
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+        'max_rss_kb': after['max_rss_kb'],
+    }
+
+
+def bench_split(lines, seed):
+    """
+    in-process split throughput on Heroku drain bodies
+    """
+    from src.config import TruncateConfig
+    from src.lib.syslogSplitter import split
+
+    rng = random.Random(seed)
+    bodies = []
+    count = 0
+    while count < lines:
+        body, msg_count = heroku_payload(rng)
+        bodies.append(body)
+        count += msg_count
+
+    with patch('src.lib.syslogSplitter.StatsClientSingleton'):
+        start = perf_counter()
+        for body in bodies:
+            split(body, TruncateConfig)
+        elapsed = perf_counter() - start
+    return {'lines_per_sec': round(count / elapsed)}
+
+
+def bench_publish(messages):
+    """
+    in-process AMQPConnection.publish throughput on a fake pika channel
+    """
+    from src.lib.AMQPConnection import AMQPConnection
+
+    amqp_con = AMQPConnection()
+    fake_amqp_connection(amqp_con)
+    body = json.dumps({'message': 'this is a log message', 'level': 'info', 'userId': 42})
+    start = perf_counter()
+    for _ in range(messages):
+        amqp_con.publish('mobile.v1.integration', body)
+    elapsed = perf_counter() - start
+    return {'messages_per_sec': round(messages / elapsed)}
+
+
+def current_commit():
+    try:
+        output = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL)
+        return output.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(before_path, after_path):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+    print('{:<30} {:>14} {:>14} {:>8}'.format('metric', before['commit'], after['commit'], 'change'))
+    for name, metrics in sorted(after['results'].items()):
+        for metric, value in sorted(metrics.items()):
+            old = before['results'].get(name, {}).get(metric)
+            if not isinstance(value, (int, float)) or not isinstance(old, (int, float)):
+                continue
+            change = '{:+.1%}'.format((value - old) / old) if old else ''
+            print('{:<30} {:>14} {:>14} {:>8}'.format('{}.{}'.format(name, metric), old, value, change))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=5000, help='requests per route')
+    parser.add_argument('--concurrency', type=int, default=50)
+    parser.add_argument('--corpus-size', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--routes', nargs='*', default=ROUTES, choices=ROUTES)
+    parser.add_argument('--output', help='results file, benchmarks/results/<commit>.json by default')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='compare two results files')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    results = {
+        'split': bench_split(100000, args.seed),
+        'publish': bench_publish(100000),
+    }
+    for route in args.routes:
+        results['route.' + route] = bench_route(route, args.requests, args.concurrency, args.corpus_size, args.seed)
+
+    commit = current_commit()
+    report = {
+        'commit': commit,
+        'date': datetime.utcnow().isoformat(),
+        'python': platform.python_version(),
+        'tornado': tornado.version,
+        'parameters': {'requests': args.requests, 'concurrency': args.concurrency, 'seed': args.seed},
+        'results': results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, '{}.json'.format(commit))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    json.dump(results, sys.stdout, indent=2, sort_keys=True)
+    print('\nresults written to {}'.format(output))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+from tornado.ioloop import IOLoop
+from pika import frame, spec
+
+
+class FakeChannel:
+    """
+    A pika channel stand-in.
+    Published messages are marshalled into AMQP frames like pika does, then
+    acknowledged the way RabbitMQ does it: one Basic.Ack with multiple=True
+    for everything published during the current ioloop iteration.
+    """
+
+    def __init__(self, ioloop=None, channel_number=1):
+        self._ioloop = ioloop or IOLoop.current()
+        self.channel_number = channel_number
+        self.published = 0
+        self.published_bytes = 0
+        self._on_confirm = None
+        self._on_close = None
+        self._delivery_tag = 0
+        self._ack_scheduled = False
+
+    def confirm_delivery(self, callback):
+        self._on_confirm = callback
+
+    def add_on_close_callback(self, callback):
+        self._on_close = callback
+
+    def add_on_return_callback(self, callback):
+        pass
+
+    def exchange_declare(self, callback, **kwargs):
+        self._ioloop.add_callback(callback, frame.Method(self.channel_number, spec.Exchange.DeclareOk()))
+
+    def queue_declare(self, callback, queue='', **kwargs):
+        self._ioloop.add_callback(callback, frame.Method(self.channel_number, spec.Queue.DeclareOk(queue=queue)))
+
+    def queue_bind(self, callback, queue, exchange, routing_key=None, **kwargs):
+        self._ioloop.add_callback(callback, frame.Method(self.channel_number, spec.Queue.BindOk()))
+
+    def close(self):
+        self._ioloop.add_callback(self._on_close, self, 200, 'Normal shutdown')
+
+    def basic_publish(self, exchange, routing_key, body, properties=None, mandatory=False):
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        properties = properties or spec.BasicProperties()
+        method = spec.Basic.Publish(exchange=exchange, routing_key=routing_key, mandatory=mandatory)
+        self.published_bytes += len(frame.Method(self.channel_number, method).marshal())
+        self.published_bytes += len(frame.Header(self.channel_number, len(body), properties).marshal())
+        self.published_bytes += len(frame.Body(self.channel_number, body).marshal())
+        self.published += 1
+        self._delivery_tag += 1
+
+        if self._on_confirm is not None and not self._ack_scheduled:
+            self._ack_scheduled = True
+            self._ioloop.add_callback(self._ack)
+
+    def _ack(self):
+        self._ack_scheduled = False
+        self._on_confirm(frame.Method(self.channel_number,
+                                      spec.Basic.Ack(delivery_tag=self._delivery_tag, multiple=True)))
+
+
+class FakeTornadoConnection:
+    """
+    A pika.TornadoConnection stand-in, opening a FakeChannel.
+    Patch pika.TornadoConnection with it to run the service without RabbitMQ.
+    """
+    channels = []
+
+    def __init__(self, parameters=None, on_open_callback=None, on_open_error_callback=None,
+                 on_close_callback=None, stop_ioloop_on_close=False, custom_ioloop=None):
+        self._ioloop = custom_ioloop or IOLoop.current()
+        self._on_close_callback = on_close_callback
+        self._ioloop.add_callback(on_open_callback, self)
+
+    def channel(self, on_open_callback, channel_number=None):
+        channel = FakeChannel(self._ioloop)
+        self.channels.append(channel)
+        self._ioloop.add_callback(on_open_callback, channel)
+        return channel
+
+    def close(self, reply_code=200, reply_text='Normal shutdown'):
+        if self._on_close_callback:
+            self._ioloop.add_callback(self._on_close_callback, self, reply_code, reply_text)
+
+
+def fake_amqp_connection(amqp_con, ioloop=None):
+    """
+    Plug a FakeChannel into an AMQPConnection that is not connected.
+    :param amqp_con: an AMQPConnection instance
+    :param ioloop: the ioloop acknowledging the messages
+    :return: the FakeChannel
+    """
+    channel = FakeChannel(ioloop)
+    channel.confirm_delivery(amqp_con._on_delivery_confirmation)
+    amqp_con._channel = channel
+    return channel
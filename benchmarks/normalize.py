@@ -0,0 +1,62 @@
+"""
+CPU cost of the mobile events normalization.
+
+The events of the fake log generator are normalized in process, and the cost
+per event is compared to the fast path of an unknown schema version and to a
+bare json.loads/json.dumps round trip.
+
+    python -m benchmarks.normalize
+    python -m benchmarks.normalize --events 100000 --nested
+"""
+import argparse
+import json
+import random
+from time import perf_counter
+
+from src.lib.mobileSchema import SCHEMAS, Normalizer
+from tools.fakelogGenerator import mobile_event
+
+
+def make_events(count, nested, seed):
+    rng = random.Random(seed)
+    events = []
+    for _ in range(count):
+        event = mobile_event(rng)
+        # mobile SDKs send some numbers as strings
+        event['userId'] = str(event['userId'])
+        if nested:
+            event['device'] = {'os': rng.choice(('ios', 'android')), 'version': '12.{}'.format(rng.randint(0, 9)),
+                               'battery': rng.random()}
+        events.append(json.dumps(event).encode('utf-8'))
+    return events
+
+
+def measure(fn, events):
+    """
+    :return: the microseconds per event of fn
+    """
+    start = perf_counter()
+    fn(events)
+    return (perf_counter() - start) / len(events) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=50000)
+    parser.add_argument('--nested', action='store_true', help='add a nested device object to the events')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    events = make_events(args.events, args.nested, args.seed)
+    normalizer = Normalizer(SCHEMAS, 32 * 1024)
+    scenarios = (
+        ('unknown version', lambda e: normalizer.normalize('v0', e)),
+        ('json round trip', lambda e: [json.dumps(json.loads(body.decode('utf-8'))).encode('utf-8') for body in e]),
+        ('normalize v1', lambda e: normalizer.normalize('v1', e)),
+    )
+    results = {name: round(measure(fn, events), 3) for name, fn in scenarios}
+    print(json.dumps({'events': args.events, 'nested': args.nested, 'us_per_event': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
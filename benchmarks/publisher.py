@@ -0,0 +1,84 @@
+"""
+Latency/throughput trade-off of the BatchPublisher against direct publishing.
+
+Each simulated request publishes `--messages` messages and waits for their
+delivery confirmations, `--concurrency` requests are in flight at once.
+
+    python -m benchmarks.publisher
+"""
+import argparse
+import json
+from time import perf_counter
+from unittest.mock import patch
+
+from tornado import gen
+from tornado.ioloop import IOLoop
+
+from benchmarks.fake_amqp import fake_amqp_connection
+from src.lib.AMQPConnection import AMQPConnection
+from src.lib.BatchPublisher import BatchPublisher
+
+ROUTING_KEY = 'mobile.v1.production'
+BODY = json.dumps({'message': 'this is a log message', 'level': 'info', 'userId': 42})
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+class BatchConfig:
+    def __init__(self, batch_size, linger_ms):
+        self.batch_size = batch_size
+        self.linger_ms = linger_ms
+
+
+@gen.coroutine
+def run_scenario(make_publisher, requests, concurrency, messages):
+    amqp_con = AMQPConnection()
+    fake_amqp_connection(amqp_con)
+    publisher = make_publisher(amqp_con)
+    latencies = []
+
+    @gen.coroutine
+    def one_request():
+        start = perf_counter()
+        yield [publisher.publish(ROUTING_KEY, BODY) for _ in range(messages)]
+        latencies.append(perf_counter() - start)
+
+    start = perf_counter()
+    for _ in range(requests // concurrency):
+        yield [one_request() for _ in range(concurrency)]
+    elapsed = perf_counter() - start
+
+    return {
+        'msg_per_sec': int(len(latencies) * messages / elapsed),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--messages', type=int, default=1)
+    args = parser.parse_args()
+
+    scenarios = [('direct', lambda con: con)]
+    for batch_size in (10, 100, 1000):
+        for linger_ms in (1, 5, 20):
+            scenarios.append(('batch size={} linger={}ms'.format(batch_size, linger_ms),
+                              lambda con, c=BatchConfig(batch_size, linger_ms): BatchPublisher(con, c)))
+
+    # the stats are not what is measured here
+    with patch('src.lib.AMQPConnection.StatsClientSingleton'), patch('src.lib.BatchPublisher.StatsClientSingleton'):
+        print('{:<30} {:>12} {:>10} {:>10}'.format('scenario', 'msg/s', 'p50 ms', 'p99 ms'))
+        for name, make_publisher in scenarios:
+            res = IOLoop.current().run_sync(
+                lambda: run_scenario(make_publisher, args.requests, args.concurrency, args.messages))
+            print('{:<30} {msg_per_sec:>12} {p50_ms:>10} {p99_ms:>10}'.format(name, **res))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Worker startup benchmark.
+
+A fresh interpreter boots `main.app` against a fake pika connection, as a
+gunicorn worker does after a recycle, and the following delays are measured
+from the start of the import:
+  - import_ms: `import main`, handlers and their dependencies
+  - listen_ms: the HTTP server is listening
+  - first_request_ms: the first log request is answered 200
+
+    python -m benchmarks.startup
+    ENABLED_ROUTES=heroku,mobile,cloudtrail python -m benchmarks.startup
+"""
+import argparse
+import gzip
+import http.client
+import json
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.e2e import free_port, percentile
+
+FIRST_REQUEST = {
+    'mobile': ('/mobile/v1/integration', gzip.compress(b'{"message": "startup"}'),
+               {'Accept-Encoding': 'gzip', 'Content-Encoding': 'gzip'}),
+    'cloudtrail': ('/cloudtrail/v1/integration', gzip.compress(b'{"Records": []}'),
+                   {'Accept-Encoding': 'gzip', 'Content-Encoding': 'gzip'}),
+    'heroku': ('/heroku/v1/integration/myapp',
+               b'83 <40>1 2017-06-14T13:52:29+00:00 host app web.1 - State changed from up to down\n',
+               {'Content-Type': 'application/logplex-1', 'Logplex-Msg-Count': '1'}),
+}
+
+# Child process: import main and listen, as a gunicorn worker would.
+# The fake pika connection is patched in after the import, AMQP is connected once the ioloop runs.
+SERVE = """
+import time
+start = time.monotonic()
+import main
+imported = time.monotonic()
+import json, logging, sys
+from unittest.mock import patch
+from tornado.ioloop import IOLoop
+from benchmarks.fake_amqp import FakeTornadoConnection
+from src.lib.serverSettings import make_server
+patch('pika.TornadoConnection', FakeTornadoConnection, create=True).start()
+logging.getLogger('tornado.access').setLevel(logging.ERROR)
+make_server(main.app).listen(int(sys.argv[1]), '127.0.0.1')
+print(json.dumps({'start': start, 'import_ms': (imported - start) * 1000,
+                  'listen_ms': (time.monotonic() - start) * 1000,
+                  'modules': len(sys.modules), 'route': main.routes[0].name}), flush=True)
+IOLoop.current().start()
+"""
+
+
+def first_request(port, route):
+    """
+    :return: the monotonic time of the first 200 answer
+    """
+    path, body, headers = FIRST_REQUEST[route]
+    while True:
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        connection.request('POST', path, body=body, headers=headers)
+        status = connection.getresponse().status
+        connection.close()
+        if status == 200:
+            return time.monotonic()
+        time.sleep(0.001)
+
+
+def boot_once():
+    port = free_port()
+    server = subprocess.Popen([sys.executable, '-c', SERVE, str(port)], stdout=subprocess.PIPE,
+                              cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    try:
+        result = json.loads(server.stdout.readline().decode())
+        answered = first_request(port, result['route'])
+    finally:
+        server.terminate()
+        server.wait()
+    result['first_request_ms'] = (answered - result.pop('start')) * 1000
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    runs = [boot_once() for _ in range(args.runs)]
+    results = {'runs': args.runs, 'modules': runs[-1]['modules'], 'route': runs[-1]['route']}
+    for metric in ('import_ms', 'listen_ms', 'first_request_ms'):
+        values = sorted(run[metric] for run in runs)
+        results[metric] = {'p50': round(percentile(values, 50), 1), 'max': round(values[-1], 1)}
+    json.dump(results, sys.stdout, indent=2, sort_keys=True)
+    print()
+
+
+if __name__ == '__main__':
+    main()
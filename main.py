@@ -3,36 +3,91 @@ from tornado import gen
 from tornado.ioloop import IOLoop
 import sys
 
-from src.handlers.heartbeat import HeartbeatHandler
-# from src.handlers.heroku import HerokuHandler
-from src.handlers.mobile import MobileHandler
-from src.handlers.cloudtrail import CloudTrailHandler
+from src.config import AmqpConfig, HTTPServerConfig, MonitoringConfig, PriorityConfig
+from src.handlers.heartbeat import HeartbeatHandler, HealthCheckHandler
+from src.handlers.metrics import MetricsHandler
+from src.handlers.profiling import ProfilingHandler
 
 from src.lib.AMQPConnection import AMQPConnection
+from src.lib.AppendLogSink import AppendLogSink
+from src.lib.BatchPublisher import BatchPublisher
+from src.lib.ElasticsearchSink import ElasticsearchSink
+from src.lib.PrioritySink import PrioritySink
+from src.lib.loopMonitor import LoopLagMonitor
+from src.lib.routing import compile_routes
+from src.lib.serverSettings import make_server
+from src.lib.sink import TeeSink
+from src.lib.statsExporter import StatsdExporter
 
 
 @gen.coroutine
 def connect_to_amqp():
-    amqp_con = AMQPConnection()
+    """
+    Connect once the ioloop runs, the worker accepts requests meanwhile and
+    the handlers wait for the connection.
+    Queues are declared once per deployment by tools/declare_queues.py
+    """
     res = yield amqp_con.connect(IOLoop.current())
     if not res:
         sys.exit(1)
-    yield amqp_con.declare_queue("mobile_integration_queue")
-    yield amqp_con.declare_queue("mobile_production_queue")
-    # yield amqp_con.declare_queue("heroku_integration_queue")
-    # yield amqp_con.declare_queue("heroku_production_queue")
-    yield amqp_con.declare_queue("cloudtrail_integration_queue")
-    yield amqp_con.declare_queue("cloudtrail_production_queue")
-    return amqp_con
+    if AmqpConfig.declare_queues_on_startup:
+        for route in routes:
+            for queue, routing_key in route.queues:
+                yield amqp_con.declare_queue(queue)
+                yield amqp_con.bind_queue(queue, routing_key)
 
-amqp_con = IOLoop.current().run_sync(connect_to_amqp)
+
+def route_sink(route):
+    """
+    :return: the sink the handler of the route publishes to
+    """
+    if route.sink == 'elasticsearch':
+        sink = elasticsearch_sink
+    elif route.sink == 'appendlog':
+        return append_log_sink
+    else:
+        sink = batch_publisher if route.batched else amqp_sink
+    return TeeSink(sink, append_log_sink) if route.archive else sink
+
+
+routes = compile_routes()
+amqp_con = AMQPConnection()
+for route in routes:
+    if route.compression and route.sink == 'amqp':
+        amqp_con.compressor.add_route(route.prefix, route.compression)
+batched = any(route.batched and route.sink == 'amqp' for route in routes)
+# the priority lanes of every AMQP route, in front of the connection they share
+amqp_sink = PrioritySink(amqp_con) if PriorityConfig.activated else amqp_con
+batch_publisher = BatchPublisher(amqp_sink) if batched else None
+elasticsearch_sink = ElasticsearchSink() if any(route.sink == 'elasticsearch' for route in routes) else None
+archived = any(route.sink == 'appendlog' or route.archive for route in routes)
+append_log_sink = AppendLogSink() if archived else None
+loop_monitor = LoopLagMonitor()
+IOLoop.current().add_callback(connect_to_amqp)
+IOLoop.current().add_callback(loop_monitor.start)
+if MonitoringConfig.statsd_export:
+    IOLoop.current().add_callback(StatsdExporter().start)
 
 
 app = tornado.web.Application([
-    # (r"/heroku/.*", HerokuHandler, dict(amqp_con=amqp_con)),
-    (r"/mobile/.*", MobileHandler, dict(amqp_con=amqp_con)),
-    (r"/cloudtrail/.*", CloudTrailHandler, dict(amqp_con=amqp_con)),
-    (r"/api/healthcheck", HeartbeatHandler),
+    # handlers are imported by tornado from their class path, for the enabled routes only
+    (route.pattern, route.handler, dict(amqp_con=route_sink(route), routing=route)) for route in routes
+] + [
+    (r"/api/healthcheck", HealthCheckHandler, dict(amqp_con=amqp_con, loop_monitor=loop_monitor)),
     (r"/api/heartbeat", HeartbeatHandler),
+    (r"/metrics", MetricsHandler),
+    (r"/api/admin/(tracemalloc|cpu)/(\w+)", ProfilingHandler),
    ])
 
+
+def main():
+    """
+    Standalone bootstrap, serve the application with the HTTPServerConfig settings
+    """
+    server = make_server(app)
+    server.listen(HTTPServerConfig.port)
+    IOLoop.current().start()
+
+
+if __name__ == '__main__':
+    main()
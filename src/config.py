@@ -11,10 +11,14 @@ class MainConfig:
 class MonitoringConfig:
     """
     This class contains monitoring configuration parameters.
+    The stats are counted in the shared memory metrics of the workers, one
+    worker sends them to statsd every statsd_export_interval_ms.
     """
     metrics_host = get('METRICS_HOST', 'localhost')
     metrics_port = int(get('METRICS_PORT', '8125'))
     metrics_prefix = get('METRICS_PREFIX', 'heroku2logstash')
+    statsd_export = get('METRICS_STATSD_EXPORT', 'true') == 'true'
+    statsd_export_interval_ms = float(get('METRICS_STATSD_EXPORT_INTERVAL_MS', '10000'))
 
 
 class TruncateConfig:
@@ -37,3 +41,283 @@ class AmqpConfig:
     port = int(get('AMQP_PORT', 5672))
     user = get('AMQP_USER', 'guest')
     password = get('AMQP_PASSWORD', 'guest')
+    connect_timeout = float(get('AMQP_CONNECT_TIMEOUT', '10'))
+    declare_queues_on_startup = get('AMQP_DECLARE_QUEUES_ON_STARTUP', 'false') == 'true'
+
+
+class RoutesConfig:
+    """
+    This class is about the input routes served by the workers, one per log source.
+    Only the handlers of the enabled routes are imported.
+
+    Each route defines:
+     * pattern: the URL pattern of the route
+     * handler: the class path of its handler
+     * routing_key: the routing key template, formatted with the URL path segments,
+       {0} being the first one, and {path} the segments after the first one joined with dots
+     * queues: the AMQP queues to declare, with the routing key they are bound to
+     * compression: the codec of the published messages, None for no compression
+     * batch: publish through the micro-batching publisher, None to follow BatchConfig
+     * max_body_size: the request body size limit in bytes, None for the HTTP server limit
+     * shards: the number of shards of the route, each queue is declared once per shard
+       as <name>_<shard> bound to <key>.<shard>, 1 for no sharding
+     * shard_by: the request header hashed to choose the shard, e.g. the drain or request id
+     * sink: where the messages are published, 'amqp', 'elasticsearch' to index them
+       directly with the _bulk API, or 'appendlog' to write them in the local append log
+       (compression, batch and queues only apply to 'amqp')
+     * archive: also write a copy of the messages in the local append log, to be replayed
+
+    ROUTES_FILE is a JSON file with the same structure, its routes are added to,
+    or replace, the ones below.
+    """
+    enabled = [route for route in get('ENABLED_ROUTES', 'mobile,cloudtrail').split(',') if route]
+    routes_file = get('ROUTES_FILE', '')
+    routes = {
+        'heroku': {
+            'pattern': r"/heroku/.*",
+            'handler': 'src.handlers.heroku.HerokuHandler',
+            'routing_key': 'heroku.{1}.{2}.{3}',
+            'shard_by': 'Logplex-Drain-Token',
+            'queues': [
+                {'name': 'heroku_integration_queue', 'key': 'heroku.v1.integration.*'},
+                {'name': 'heroku_production_queue', 'key': 'heroku.v1.production.*'},
+            ],
+        },
+        'mobile': {
+            'pattern': r"/mobile/.*",
+            'handler': 'src.handlers.mobile.MobileHandler',
+            'routing_key': 'mobile.{path}',
+            'shard_by': 'X-Request-ID',
+            'queues': [
+                {'name': 'mobile_integration_queue', 'key': 'mobile.v1.integration'},
+                {'name': 'mobile_production_queue', 'key': 'mobile.v1.production'},
+            ],
+        },
+        'cloudtrail': {
+            'pattern': r"/cloudtrail/.*",
+            'handler': 'src.handlers.cloudtrail.CloudTrailHandler',
+            'routing_key': 'cloudtrail.{path}',
+            'queues': [
+                {'name': 'cloudtrail_integration_queue', 'key': 'cloudtrail.v1.integration'},
+                {'name': 'cloudtrail_production_queue', 'key': 'cloudtrail.v1.production'},
+            ],
+        },
+        'cloudtrail_s3': {
+            'pattern': r"/cloudtrail-s3/.*",
+            'handler': 'src.handlers.cloudtrailNotification.CloudTrailNotificationHandler',
+            'routing_key': 'cloudtrail.{path}',
+            'queues': [
+                {'name': 'cloudtrail_integration_queue', 'key': 'cloudtrail.v1.integration'},
+                {'name': 'cloudtrail_production_queue', 'key': 'cloudtrail.v1.production'},
+            ],
+        },
+    }
+
+
+class CompressionConfig:
+    """
+    This class is about the AMQP payload compression configuration.
+    Routes are given as a comma separated list of routing_key_prefix:codec,
+    e.g. "mobile:gzip,cloudtrail.v1.production:deflate"
+    """
+    routes = get('AMQP_COMPRESSION_ROUTES', '')
+    min_size = int(get('AMQP_COMPRESSION_MIN_SIZE', '1024'))
+    level = int(get('AMQP_COMPRESSION_LEVEL', '6'))
+    mobile_gzip_passthrough = get('MOBILE_GZIP_PASSTHROUGH', 'false') == 'true'
+
+
+class BatchConfig:
+    """
+    This class is about the micro-batching publisher configuration.
+    Messages are flushed to AMQP when batch_size messages are queued
+    or linger_ms milliseconds after the first queued message.
+    """
+    batch_activated = get('BATCH_ACTIVATION', 'false') == 'true'
+    batch_size = int(get('BATCH_SIZE', '100'))
+    linger_ms = float(get('BATCH_LINGER_MS', '5'))
+
+
+class HTTPServerConfig:
+    """
+    This class is about the tornado HTTP server configuration.
+    Logplex and mobile clients keep their connections alive between POSTs,
+    idle connections are closed after idle_connection_timeout seconds.
+    """
+    port = int(get('PORT', '8080'))
+    no_keep_alive = get('HTTP_NO_KEEP_ALIVE', 'false') == 'true'
+    idle_connection_timeout = float(get('HTTP_IDLE_CONNECTION_TIMEOUT', '75'))
+    body_timeout = float(get('HTTP_BODY_TIMEOUT', '30'))
+    max_header_size = int(get('HTTP_MAX_HEADER_SIZE', '16384'))
+    max_body_size = int(get('HTTP_MAX_BODY_SIZE', str(100 * 1024 * 1024)))
+    max_buffer_size = int(get('HTTP_MAX_BUFFER_SIZE', str(100 * 1024 * 1024)))
+    chunk_size = int(get('HTTP_CHUNK_SIZE', '65536'))
+    decompress_request = get('HTTP_DECOMPRESS_REQUEST', 'false') == 'true'
+
+
+class ProfilingConfig:
+    """
+    This class is about the admin profiling endpoints configuration.
+    The endpoints are disabled when no admin token is set.
+    """
+    admin_token = get('ADMIN_TOKEN', '')
+    tracemalloc_frames = int(get('PROFILING_TRACEMALLOC_FRAMES', '25'))
+    cpu_interval = float(get('PROFILING_CPU_INTERVAL', '0.005'))
+    max_duration = float(get('PROFILING_MAX_DURATION', '600'))
+
+
+class MetricsConfig:
+    """
+    This class is about the in-process metrics registry configuration.
+    Each worker writes its metrics into its own memory mapped file in
+    this directory, the /metrics endpoint aggregates all of them.
+    """
+    directory = get('METRICS_DIRECTORY', '/tmp/heroku2elk-metrics')
+
+
+class HealthConfig:
+    """
+    This class is about the readiness healthcheck configuration.
+    The worker is reported unavailable when one of the limits is exceeded.
+    """
+    max_outstanding_confirms = int(get('HEALTH_MAX_OUTSTANDING_CONFIRMS', '10000'))
+    max_loop_lag_ms = float(get('HEALTH_MAX_LOOP_LAG_MS', '500'))
+    max_in_flight = int(get('HEALTH_MAX_IN_FLIGHT', '1000'))
+    cache_ms = float(get('HEALTH_CACHE_MS', '1000'))
+
+
+class LoopMonitorConfig:
+    """
+    This class is about the ioloop lag monitor configuration.
+    The stack of the ioloop thread is logged when it is blocked
+    for more than slow_threshold_ms, 0 disables the detection.
+    """
+    interval_ms = float(get('LOOP_MONITOR_INTERVAL_MS', '20'))
+    window = int(get('LOOP_MONITOR_WINDOW', '3000'))
+    slow_threshold_ms = float(get('LOOP_MONITOR_SLOW_THRESHOLD_MS', '200'))
+
+
+class ElasticsearchConfig:
+    """
+    This class is about the Elasticsearch bulk sink configuration.
+    Documents are sent in _bulk requests of bulk_size bytes, or every
+    flush_interval_ms milliseconds; 429 responses are retried with
+    an exponential backoff, up to max_retries times.
+    The index is formatted with the routing key source, e.g. heroku, and the UTC date.
+    """
+    url = get('ELASTICSEARCH_URL', 'http://localhost:9200')
+    index = get('ELASTICSEARCH_INDEX', 'logs-{source}-{date}')
+    bulk_size = int(get('ELASTICSEARCH_BULK_SIZE', str(5 * 1024 * 1024)))
+    flush_interval_ms = float(get('ELASTICSEARCH_FLUSH_INTERVAL_MS', '1000'))
+    max_concurrent_requests = int(get('ELASTICSEARCH_MAX_CONCURRENT_REQUESTS', '4'))
+    max_pending_bytes = int(get('ELASTICSEARCH_MAX_PENDING_BYTES', str(100 * 1024 * 1024)))
+    max_retries = int(get('ELASTICSEARCH_MAX_RETRIES', '5'))
+    retry_backoff_ms = float(get('ELASTICSEARCH_RETRY_BACKOFF_MS', '100'))
+    retry_max_backoff_ms = float(get('ELASTICSEARCH_RETRY_MAX_BACKOFF_MS', '10000'))
+    request_timeout = float(get('ELASTICSEARCH_REQUEST_TIMEOUT', '30'))
+
+
+class AppendLogConfig:
+    """
+    This class is about the append log sink configuration, archiving the
+    messages on the local disk to be replayed.
+    Each worker writes to its own partition directory, in segment files
+    rotated every segment_bytes or segment_ms, the oldest segments of a
+    partition being deleted past retention_bytes.
+    Records are readable once flushed, every flush_interval_ms.
+    """
+    directory = get('APPEND_LOG_DIRECTORY', '/tmp/heroku2elk-log')
+    partitions = int(get('APPEND_LOG_PARTITIONS', '16'))
+    segment_bytes = int(get('APPEND_LOG_SEGMENT_BYTES', str(128 * 1024 * 1024)))
+    segment_ms = float(get('APPEND_LOG_SEGMENT_MS', str(60 * 60 * 1000)))
+    retention_bytes = int(get('APPEND_LOG_RETENTION_BYTES', str(10 * 1024 * 1024 * 1024)))
+    index_interval_bytes = int(get('APPEND_LOG_INDEX_INTERVAL_BYTES', '4096'))
+    buffer_size = int(get('APPEND_LOG_BUFFER_SIZE', str(1024 * 1024)))
+    flush_interval_ms = float(get('APPEND_LOG_FLUSH_INTERVAL_MS', '100'))
+
+
+class MobileSchemaConfig:
+    """
+    This class is about the normalization of the mobile events.
+    The schemas of each version of the API (the /mobile/<version>/ path segment)
+    give the types of their fields, the nested ones being named with dots,
+    e.g. {"v1": {"userId": "int", "device.os": "str"}}; the schemas_file ones
+    are merged over the default ones.
+    """
+    normalize = get('MOBILE_NORMALIZE', 'false') == 'true'
+    schemas_file = get('MOBILE_SCHEMAS_FILE')
+    max_field_size = int(get('MOBILE_MAX_FIELD_SIZE', str(32 * 1024)))
+
+
+class CloudTrailFilterConfig:
+    """
+    This class is about the filtering and projection of the CloudTrail records.
+    rules_file is a JSON file of rules, see src.lib.cloudtrailFilter; the records
+    are published untouched without it.
+    """
+    rules_file = get('CLOUDTRAIL_RULES_FILE')
+
+
+class CloudTrailS3Config:
+    """
+    This class is about the ingestion of the CloudTrail log files notified by S3.
+    The 's3' object store reads the objects from S3, or from the S3 compatible
+    service of the endpoint, with the AWS credentials; the 'local' one reads
+    the objects of a bucket from the <directory>/<bucket> directory. The keys
+    of the ingested objects are appended to the checkpoint file so that they
+    are not ingested twice.
+    """
+    store = get('CLOUDTRAIL_S3_STORE', 's3')
+    region = get('CLOUDTRAIL_S3_REGION', get('AWS_REGION', 'us-east-1'))
+    endpoint = get('CLOUDTRAIL_S3_ENDPOINT', '')
+    access_key = get('AWS_ACCESS_KEY_ID', '')
+    secret_key = get('AWS_SECRET_ACCESS_KEY', '')
+    session_token = get('AWS_SESSION_TOKEN', '')
+    request_timeout = float(get('CLOUDTRAIL_S3_REQUEST_TIMEOUT', '60'))
+    directory = get('CLOUDTRAIL_S3_DIRECTORY', '/tmp/heroku2elk-s3')
+    max_concurrent_fetches = int(get('CLOUDTRAIL_S3_MAX_CONCURRENT_FETCHES', '4'))
+    chunk_size = int(get('CLOUDTRAIL_S3_CHUNK_SIZE', str(64 * 1024)))
+    checkpoint_file = get('CLOUDTRAIL_S3_CHECKPOINT_FILE', '/tmp/heroku2elk-cloudtrail.checkpoint')
+
+
+class TracingConfig:
+    """
+    This class is about the tracing of the requests: the traces of a sample
+    of the requests, and of the requests slower than slow_threshold_ms from
+    their reception to the confirmation of their messages, are appended to
+    the collector file as JSON lines.
+    """
+    sample_rate = float(get('TRACING_SAMPLE_RATE', '0.001'))
+    slow_threshold_ms = float(get('TRACING_SLOW_THRESHOLD_MS', '1000'))
+    collector_file = get('TRACING_COLLECTOR_FILE', '/tmp/heroku2elk-traces.jsonl')
+
+
+class FrameDedupConfig:
+    """
+    This class is about the suppression of the Heroku drain frames sent again
+    by Logplex after a timeout: the drain token and frame id of the frames
+    received in the last ttl seconds are kept in a fixed size table of
+    capacity slots, in a memory mapped file shared by the workers.
+    """
+    activated = get('FRAME_DEDUP_ACTIVATED', 'false') == 'true'
+    file = get('FRAME_DEDUP_FILE', '/tmp/heroku2elk-frames.dedup')
+    capacity = int(get('FRAME_DEDUP_CAPACITY', '65536'))
+    ttl = float(get('FRAME_DEDUP_TTL', '3600'))
+
+
+class PriorityConfig:
+    """
+    This class is about the priority lanes of the messages published to AMQP.
+    The lane of a message is the env segment of its routing key, e.g.
+    heroku.v1.<env>.app or mobile.v1.<env>; lanes are given highest priority
+    first as env:weight, the other envs going to the last lane.
+    At most max_outstanding_confirms messages are waiting for a confirmation,
+    the others are queued in their lane, up to max_queued messages per lane,
+    and published in turn, weight messages of a lane at a time.
+    While the confirmation window is full, the messages of the lanes but the
+    first one are shed once shed_queued messages are queued in their lane.
+    """
+    activated = get('PRIORITY_ACTIVATED', 'false') == 'true'
+    lanes = get('PRIORITY_LANES', 'production:8,integration:1')
+    max_outstanding_confirms = int(get('PRIORITY_MAX_OUTSTANDING_CONFIRMS', '5000'))
+    max_queued = int(get('PRIORITY_MAX_QUEUED', '20000'))
+    shed_queued = int(get('PRIORITY_SHED_QUEUED', '1000'))
@@ -0,0 +1,65 @@
+from datetime import timedelta
+import tornado.web
+from tornado import gen
+
+from src.config import AmqpConfig
+from src.lib.metrics import Counter, Gauge, Histogram
+from src.lib.tracing import Trace
+
+HTTP_REQUESTS = Counter('http_requests_total', 'HTTP requests handled', ('route', 'code'))
+HTTP_IN_FLIGHT = Gauge('http_requests_in_flight', 'HTTP requests being handled', ('route',))
+HTTP_DURATION = Histogram('http_request_duration_seconds', 'HTTP request handling duration', ('route',))
+
+
+class BaseHandler(tornado.web.RequestHandler):
+    """ The base class of the log input handlers,
+    measuring the in-flight requests, the request rate and duration per route
+    """
+    route = None
+    # requests being handled by the worker, all routes included
+    in_flight = 0
+    _trace = None
+
+    @property
+    def trace(self):
+        """
+        :return: the Trace of the request
+        """
+        if self._trace is None:
+            self._trace = Trace(self.request, self.route)
+        return self._trace
+
+    def prepare(self):
+        BaseHandler.in_flight += 1
+        HTTP_IN_FLIGHT.labels(route=self.route).inc()
+        routing = getattr(self, 'routing', None)
+        if routing is not None and routing.max_body_size and len(self.request.body) > routing.max_body_size:
+            raise tornado.web.HTTPError(413)
+        amqp_con = getattr(self, 'amqp_con', None)
+        if amqp_con is not None and not amqp_con.is_open:
+            if not amqp_con.started.done():
+                # the worker serves before AMQP is connected
+                return self._wait_for_amqp(amqp_con)
+            if not amqp_con.started.result():
+                raise tornado.web.HTTPError(503)
+            # the channel was lost once connected: the handler fails to publish and exits, to restart the worker
+
+    @gen.coroutine
+    def _wait_for_amqp(self, amqp_con):
+        """
+        wait for the AMQP connection, reply 503 if it is not established within the connect timeout
+        """
+        try:
+            started = yield gen.with_timeout(timedelta(seconds=AmqpConfig.connect_timeout), amqp_con.started)
+        except gen.TimeoutError:
+            started = False
+        if not started or not amqp_con.is_open:
+            raise tornado.web.HTTPError(503)
+
+    def on_finish(self):
+        BaseHandler.in_flight -= 1
+        HTTP_IN_FLIGHT.labels(route=self.route).dec()
+        HTTP_REQUESTS.labels(route=self.route, code=self.get_status()).inc()
+        HTTP_DURATION.labels(route=self.route).observe(self.request.request_time())
+        if self._trace is not None:
+            self._trace.finish(self.get_status())
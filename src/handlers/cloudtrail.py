@@ -1,22 +1,29 @@
-import tornado.web
 import logging
 import sys
 import gzip
 import json
+from time import perf_counter
 
+from src.handlers.base import BaseHandler
 from src.lib.Statsd import StatsClientSingleton
+from src.lib.cloudtrailFilter import default_filter
+from src.lib.routing import default_route
 
 
-class CloudTrailHandler(tornado.web.RequestHandler):
+class CloudTrailHandler(BaseHandler):
     """ The AWS CloudTrail handler class
     """
+    route = 'cloudtrail'
 
-    def initialize(self, amqp_con):
+    def initialize(self, amqp_con, routing=None, record_filter=None):
         """
         handler initialisation
+        :param record_filter: the RecordFilter of the records, the CLOUDTRAIL_RULES_FILE one by default
         """
         self.logger = logging.getLogger("tornado.application")
         self.amqp_con = amqp_con
+        self.routing = routing or default_route(self.route)
+        self.record_filter = record_filter or default_filter()
 
     def post(self):
         """
@@ -26,17 +33,25 @@ class CloudTrailHandler(tornado.web.RequestHandler):
         """
         try:
             StatsClientSingleton().incr('cloudtrail.input', count=1)
-            routing_key = self.request.uri.replace('/', '.')[1:]
+            routing_key = self.routing.request_routing_key(self.request)
 
             payload = self.request.body
-            content_encoding = self.request.headers.get('Accept-Encoding')
-            if content_encoding == 'gzip':
+            headers = self.request.headers
+            if 'X-Consumed-Content-Encoding' not in headers and headers.get('Accept-Encoding') == 'gzip':
+                # the clients send gzipped bodies with an Accept-Encoding header, inflated here
+                # unless the server already did, with HTTP_DECOMPRESS_REQUEST
                 payload = gzip.decompress(payload)
 
             try:
                 entry_list = json.loads(payload.decode())["Records"]
-                for entry in entry_list:
-                    self.amqp_con.publish(routing_key, json.dumps(entry))
+                if self.record_filter is not None:
+                    entry_list = [entry for entry in map(self.record_filter.apply, entry_list) if entry is not None]
+                trace = self.trace
+                start = perf_counter()
+                confirmations = [self.amqp_con.publish(routing_key, json.dumps(entry), headers=trace.headers)
+                                 for entry in entry_list]
+                trace.span('publish', start)
+                trace.published(confirmations)
 
                 StatsClientSingleton().incr('amqp.output', count=len(entry_list))
             except KeyError:
@@ -0,0 +1,55 @@
+import logging
+
+from tornado import gen
+
+from src.handlers.base import BaseHandler
+from src.lib.Statsd import StatsClientSingleton
+from src.lib.cloudtrailS3 import default_ingester, parse_notification
+from src.lib.routing import default_route
+
+
+class CloudTrailNotificationHandler(BaseHandler):
+    """ The handler of the S3 notifications of new CloudTrail log files,
+    pushed by SNS or forwarded from SQS
+    """
+    route = 'cloudtrail_s3'
+
+    def initialize(self, amqp_con, routing=None, ingester=None):
+        """
+        handler initialisation
+        :param ingester: the CloudTrailIngester of the log files, the CloudTrailS3Config one by default
+        """
+        self.logger = logging.getLogger("tornado.application")
+        self.amqp_con = amqp_con
+        self.routing = routing or default_route(self.route)
+        self.ingester = ingester or default_ingester()
+
+    @gen.coroutine
+    def post(self):
+        """
+        HTTP Post handler
+        * Ingest the notified log files: publish their records to AMQP
+        :return: HTTPStatus 200 once the records are confirmed, 400 for an unknown notification,
+            500 if a log file cannot be ingested, for the notification to be sent again
+        """
+        StatsClientSingleton().incr('cloudtrail.notification', count=1)
+        if self.request.headers.get('x-amz-sns-message-type') == 'SubscriptionConfirmation':
+            # the subscription is confirmed from the AWS console, with the SubscribeURL
+            self.logger.warning("SNS subscription confirmation: {}".format(self.request.body))
+            return
+        try:
+            objects = parse_notification(self.request.body.decode('utf-8'))
+        except (ValueError, KeyError, TypeError) as e:
+            self.logger.warning("Unknown CloudTrail notification: {}, body: {}".format(e, self.request.body))
+            self.set_status(400)
+            return
+
+        routing_key = self.routing.request_routing_key(self.request)
+        headers = self.trace.headers
+        try:
+            publish = self.amqp_con.publish
+            count = yield self.ingester.ingest(objects, lambda record: publish(routing_key, record, headers=headers))
+        except Exception:
+            self.set_status(500)
+            return
+        StatsClientSingleton().incr('amqp.output', count=count)
@@ -1,6 +1,9 @@
 import tornado.web
 from tornado import gen
+from tornado.ioloop import IOLoop
 
+from src.config import HealthConfig
+from src.handlers.base import BaseHandler
 from src.lib.Statsd import StatsClientSingleton
 
 
@@ -14,4 +17,52 @@ class HeartbeatHandler(tornado.web.RequestHandler):
             reply 200 to every GET called
         """
         StatsClientSingleton().incr('heartbeat', count=1)
-        self.set_status(200)
\ No newline at end of file
+        self.set_status(200)
+
+
+class HealthCheckHandler(tornado.web.RequestHandler):
+    """ The readiness HealthCheck handler class
+    """
+    _cache = None
+    _cache_time = 0
+
+    def initialize(self, amqp_con, loop_monitor, config=HealthConfig):
+        """
+        handler initialisation
+        """
+        self.amqp_con = amqp_con
+        self.loop_monitor = loop_monitor
+        self.config = config
+
+    def get(self):
+        """ reply 200 if the worker is ready to handle logs, 503 otherwise,
+            with the state of the checks as a JSON body. The state is cached
+            for cache_ms milliseconds.
+        """
+        StatsClientSingleton().incr('healthcheck', count=1)
+        now = IOLoop.current().time()
+        if HealthCheckHandler._cache is None or now - HealthCheckHandler._cache_time > self.config.cache_ms / 1000:
+            HealthCheckHandler._cache = self.health()
+            HealthCheckHandler._cache_time = now
+
+        self.set_status(200 if HealthCheckHandler._cache['ready'] else 503)
+        self.write(HealthCheckHandler._cache)
+
+    def health(self):
+        """
+        :return: the state of the worker
+        """
+        amqp_channel_open = self.amqp_con.is_open
+        outstanding_confirms = self.amqp_con.outstanding_confirms
+        loop_lag_ms = round(self.loop_monitor.lag * 1000, 3)
+        in_flight = BaseHandler.in_flight
+        return {
+            'ready': (amqp_channel_open and
+                      outstanding_confirms <= self.config.max_outstanding_confirms and
+                      loop_lag_ms <= self.config.max_loop_lag_ms and
+                      in_flight <= self.config.max_in_flight),
+            'amqp_channel_open': amqp_channel_open,
+            'outstanding_confirms': outstanding_confirms,
+            'loop_lag_ms': loop_lag_ms,
+            'in_flight': in_flight,
+        }
@@ -1,23 +1,30 @@
-import tornado.web
 import logging
 import json
 import sys
+from time import perf_counter
 
 from src.config import TruncateConfig
+from src.handlers.base import BaseHandler
 from src.lib.Statsd import StatsClientSingleton
-from src.lib.syslogSplitter import split
+from src.lib.frameDedup import default_dedup
+from src.lib.routing import MAX_CACHED_KEYS, default_route
+from src.lib.syslogSplitter import split_frames
 
 
-class HerokuHandler(tornado.web.RequestHandler):
+class HerokuHandler(BaseHandler):
     """ The Heroku HTTP drain handler class
     """
+    route = 'heroku'
 
-    def initialize(self, amqp_con):
+    def initialize(self, amqp_con, routing=None, dedup=None):
         """
         handler initialisation
+        :param dedup: the FrameDedup of the frames, the FRAME_DEDUP_ACTIVATED one by default
         """
         self.logger = logging.getLogger("tornado.application")
         self.amqp_con = amqp_con
+        self.routing = routing or default_route(self.route)
+        self.dedup = dedup or default_dedup()
 
     def set_default_headers(self):
         """
@@ -33,25 +40,56 @@ class HerokuHandler(tornado.web.RequestHandler):
         1. Split the input payload into an array of bytes
         2. send HTTP requests to logstash for each element of the array
         3. aggregate answers
+        A frame already received is acknowledged without publishing its messages again.
         :return: HTTPStatus 200
         """
+        trace = self.trace
+        if self.dedup is not None and self.dedup.seen(trace.drain_token, trace.frame_id):
+            StatsClientSingleton().incr('input.heroku.duplicate', count=1)
+            self.set_status(200)
+            return
+
         # 1. split
         try:
             StatsClientSingleton().incr('input.heroku', count=1)
-            logs = split(self.request.body, TruncateConfig)
+            start = perf_counter()
+            frames = split_frames(self.request.body, TruncateConfig, self.request.headers.get('Logplex-Msg-Count'))
+            trace.span('split', start)
+            if frames.quarantined or frames.msg_count_mismatch:
+                self.logger.warning("Malformed drain payload, {} frames for Logplex-Msg-Count: {}, "
+                                    "{} quarantined, uri: {}"
+                                    .format(frames.frames, self.request.headers.get('Logplex-Msg-Count'),
+                                            len(frames.quarantined), self.request.uri))
         except Exception as e:
             self.logger.info("Error while splitting message, errors: {} "
-                             "input headers: {}, payload: {}".format(
-                e, self.request.headers, self.request.body))
+                             "input headers: {}, payload: {}"
+                             .format(e, self.request.headers, self.request.body))
             StatsClientSingleton().incr('split.error', count=1)
+            self._forget_frame()
             self.set_status(500)
             return
 
         # 2. forward
         try:
-            [self._push_to_amqp(l) for l in logs]
+            start = perf_counter()
+            confirmations = []
+            if frames.lines or frames.quarantined:
+                # an empty payload has nothing to format, whatever its URI
+                drain = drain_format(self.request.uri)
+                routing_key = self.routing.request_routing_key(self.request)
+                publish = self.amqp_con.publish
+                headers = trace.headers
+                confirmations = [publish(routing_key, drain.format(line), headers=headers) for line in frames.lines]
+                # the malformed parts are published as is, flagged, to be looked at
+                confirmations += [publish(routing_key, drain.format(part.decode('utf-8', 'replace'), True),
+                                          headers=headers)
+                                  for part in frames.quarantined]
+                StatsClientSingleton().incr('amqp.output', count=len(confirmations))
+            trace.span('publish', start)
+            trace.published(confirmations)
             self.set_status(200)
         except Exception as e:
+            self._forget_frame()
             self.set_status(500)
             StatsClientSingleton().incr('amqp.output_exception', count=1)
             self.logger.error("Error while pushing message to AMQP, exception:"
@@ -59,23 +97,58 @@ class HerokuHandler(tornado.web.RequestHandler):
                               .format(e, self.request.uri))
             sys.exit(1)
 
-    def _push_to_amqp(self, msg):
+    def _forget_frame(self):
+        """
+        Accept the frame when Logplex sends it again, its messages were not published
+        """
+        if self.dedup is not None:
+            self.dedup.forget(self.trace.drain_token, self.trace.frame_id)
+
+
+class DrainFormat:
+    """
+    The JSON messages of a drain URI, /heroku/<parser version>/<env>/<app>:
+    the head of the messages (type, parser version, env and app) is encoded
+    once, each line only adds its message and length. The messages are the
+    ones json.dumps gives for a dict of these keys.
+    """
+    __slots__ = ('head',)
+
+    def __init__(self, uri):
+        path = uri.split('/')[1:]
+        head = json.dumps({'type': path[0], 'parser_ver': path[1], 'env': path[2], 'app': path[3]})
+        self.head = head[:-1] + ', "message": '
+
+    def format(self, msg, quarantined=False):
         """
-        publish message to amqp, splitting the uri to format the json payload
-        :param msg: input decoded message
-        :return: {void}
+        :param msg: a decoded syslog message of the drain
+        :param quarantined: True for a malformed part of the payload, flagged in the message
+        :return: the JSON message published to AMQP
         """
-        StatsClientSingleton().incr('amqp.output', count=1)
-        payload = dict()
-        path = self.request.uri.split('/')[1:]
-        payload['type'] = path[0]
-        payload['parser_ver'] = path[1]
-        payload['env'] = path[2]
-        payload['app'] = path[3]
-        payload['message'] = msg
-        payload['http_content_length'] = len(msg)
-        routing_key = "{}.{}.{}.{}".format(payload['type'],
-                                           payload['parser_ver'],
-                                           payload['env'], payload['app'])
-
-        self.amqp_con.publish(routing_key, json.dumps(payload))
\ No newline at end of file
+        tail = ', "quarantined": true}' if quarantined else '}'
+        return self.head + json.dumps(msg) + ', "http_content_length": ' + str(len(msg)) + tail
+
+
+_drain_formats = {}
+
+
+def drain_format(uri):
+    """
+    :return: the DrainFormat of the URI, cached
+    """
+    drain = _drain_formats.get(uri)
+    if drain is None:
+        drain = DrainFormat(uri)
+        if len(_drain_formats) < MAX_CACHED_KEYS:
+            _drain_formats[uri] = drain
+    return drain
+
+
+def format_message(uri, msg, quarantined=False):
+    """
+    :param uri: the drain URI, /heroku/<parser version>/<env>/<app>
+    :param msg: a decoded syslog message of the drain
+    :param quarantined: True for a malformed part of the payload, flagged in the message
+    :return: the JSON message published to AMQP
+    """
+    return drain_format(uri).format(msg, quarantined)
@@ -0,0 +1,20 @@
+import tornado.web
+
+from src.lib.metrics import REGISTRY
+
+
+class MetricsHandler(tornado.web.RequestHandler):
+    """ The metrics handler class, aggregating the metrics of every worker
+    """
+
+    def initialize(self, registry=REGISTRY):
+        """
+        handler initialisation
+        """
+        self.registry = registry
+
+    def get(self):
+        """ reply the metrics in the Prometheus text exposition format
+        """
+        self.set_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.write(self.registry.exposition())
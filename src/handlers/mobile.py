@@ -1,39 +1,92 @@
-import tornado.web
 import logging
 import sys
-import gzip
+from time import perf_counter
 
+from src.config import CompressionConfig
+from src.handlers.base import BaseHandler
 from src.lib.Statsd import StatsClientSingleton
+from src.lib.compression import DECODERS
+from src.lib.metrics import Counter, Histogram
+from src.lib.mobileSchema import default_normalizer
+from src.lib.ndjson import is_ndjson, split_events
+from src.lib.routing import default_route
 
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+MOBILE_REQUEST_BYTES = Histogram('mobile_request_bytes', 'Mobile request body size, as received',
+                                 ('encoding',), buckets=SIZE_BUCKETS)
+MOBILE_DECODED_BYTES = Histogram('mobile_decoded_bytes', 'Mobile request body size, decoded', buckets=SIZE_BUCKETS)
+MOBILE_EVENTS = Counter('mobile_events_total', 'Mobile events published')
 
-class MobileHandler(tornado.web.RequestHandler):
+
+class MobileHandler(BaseHandler):
     """ The Mobile HTTP handler class
     """
+    route = 'mobile'
 
-    def initialize(self, amqp_con):
+    def initialize(self, amqp_con, routing=None, config=CompressionConfig, normalizer=None):
         """
         handler initialisation
+        :param normalizer: the Normalizer of the events, the MOBILE_NORMALIZE one by default
         """
         self.logger = logging.getLogger("tornado.application")
         self.amqp_con = amqp_con
+        self.routing = routing or default_route(self.route)
+        self.config = config
+        self.normalizer = normalizer or default_normalizer()
+
+    def _content_encoding(self):
+        """
+        :return: the encoding of the request body, None if it is not encoded
+        """
+        headers = self.request.headers
+        content_encoding = headers.get('Content-Encoding')
+        if content_encoding is not None:
+            content_encoding = content_encoding.strip().lower()
+            return None if content_encoding == 'identity' else content_encoding
+        if 'X-Consumed-Content-Encoding' not in headers and headers.get('Accept-Encoding') == 'gzip':
+            # older clients send gzipped bodies with an Accept-Encoding header only
+            return 'gzip'
+        return None
 
     def post(self):
         """
         HTTP Post handler
-        * Forward request: publish to AMQP
-        :return: HTTPStatus 200
+        * Forward request: publish to AMQP, one message per line of a NDJSON body
+        :return: HTTPStatus 200, 400 if the body cannot be decoded, 415 if its encoding is not supported
         """
         try:
             StatsClientSingleton().incr('input.mobile', count=1)
-            StatsClientSingleton().incr('amqp.output', count=1)
-            routing_key = self.request.uri.replace('/', '.')[1:]
+            routing_key = self.routing.request_routing_key(self.request)
 
             payload = self.request.body
-            content_encoding = self.request.headers.get('Accept-Encoding')
-            if content_encoding == 'gzip':
-                payload = gzip.decompress(payload)
+            content_encoding = self._content_encoding()
+            ndjson = is_ndjson(self.request.headers.get('Content-Type', ''))
+            MOBILE_REQUEST_BYTES.labels(encoding=content_encoding or 'identity').observe(len(payload))
+            if content_encoding is not None:
+                if content_encoding == 'gzip' and self.config.mobile_gzip_passthrough and not ndjson:
+                    # forward the compressed body as is, consumers inflate it
+                    StatsClientSingleton().incr('amqp.output', count=1)
+                    MOBILE_EVENTS.inc()
+                    trace = self.trace
+                    trace.published([self.amqp_con.publish(routing_key, payload, content_encoding='gzip',
+                                                           headers=trace.headers)])
+                    return
+                payload = self._decode(payload, content_encoding)
+                if payload is None:
+                    return
+            MOBILE_DECODED_BYTES.observe(len(payload))
 
-            self.amqp_con.publish(routing_key, payload)
+            events = split_events(payload) if ndjson else (payload,)
+            if self.normalizer is not None:
+                # the API version is the path segment following /mobile/
+                events = self.normalizer.normalize(self.request.path.split('/', 3)[2], events)
+            StatsClientSingleton().incr('amqp.output', count=len(events))
+            MOBILE_EVENTS.inc(len(events))
+            trace = self.trace
+            start = perf_counter()
+            confirmations = [self.amqp_con.publish(routing_key, event, headers=trace.headers) for event in events]
+            trace.span('publish', start)
+            trace.published(confirmations)
 
         except Exception as e:
             self.set_status(500)
@@ -42,3 +95,25 @@ class MobileHandler(tornado.web.RequestHandler):
                              "exception: {} msg: {}, uri: {}"
                              .format(e, self.request.body, self.request.uri))
             sys.exit(1)
+
+    def _decode(self, payload, content_encoding):
+        """
+        :return: the decoded body, None if it cannot be decoded, the status being set
+        """
+        decoder = DECODERS.get(content_encoding)
+        if decoder is None:
+            self.set_status(415)
+            return None
+        try:
+            payload = decoder(payload)
+        except Exception as e:
+            StatsClientSingleton().incr('input.mobile.decode_error', count=1)
+            self.logger.warning("Cannot decode a {} mobile payload: {}, uri: {}"
+                                .format(content_encoding, e, self.request.uri))
+            self.set_status(400)
+            return None
+        max_body_size = self.routing.max_body_size
+        if max_body_size and len(payload) > max_body_size:
+            self.set_status(413)
+            return None
+        return payload
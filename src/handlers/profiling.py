@@ -0,0 +1,127 @@
+import tornado.web
+from tornado.ioloop import IOLoop
+import hmac
+import logging
+import os
+
+from src.config import ProfilingConfig
+from src.lib.profiling import MemoryProfiler, CPUSampler
+
+# one profiler of each kind per worker
+memory_profiler = MemoryProfiler()
+cpu_sampler = CPUSampler()
+_stop_timeouts = {}
+# the tracemalloc statistics groupings
+KEY_TYPES = ('lineno', 'filename', 'traceback')
+
+
+def stop_profiler(profiler):
+    """
+    :param profiler: 'tracemalloc' or 'cpu'
+    """
+    timeout = _stop_timeouts.pop(profiler, None)
+    if timeout is not None:
+        IOLoop.current().remove_timeout(timeout)
+    if profiler == 'tracemalloc' and memory_profiler.tracing:
+        memory_profiler.stop()
+    elif profiler == 'cpu' and cpu_sampler.running:
+        cpu_sampler.stop()
+    else:
+        return
+    logging.getLogger("tornado.application").info("pid:{} {} profiling stopped".format(os.getpid(), profiler))
+
+
+class ProfilingHandler(tornado.web.RequestHandler):
+    """ The admin profiling handler class
+
+    POST /api/admin/tracemalloc/start?frames=25   start tracing the allocations
+    GET  /api/admin/tracemalloc/top?limit=10      top allocators
+    GET  /api/admin/tracemalloc/diff?limit=10     top growth since the previous diff
+    GET  /api/admin/tracemalloc/routes?limit=5    allocations grouped by route
+    POST /api/admin/tracemalloc/stop
+    POST /api/admin/cpu/start?interval=0.005      start the sampling CPU profiler
+    GET  /api/admin/cpu/collapsed                 collapsed stacks, flamegraph input
+    POST /api/admin/cpu/stop
+
+    Every request requires the X-Admin-Token header, and is answered by one worker only:
+    the profilers are per worker, the replies give its pid.
+    Profilers are stopped automatically after max_duration seconds.
+    """
+
+    def initialize(self, config=ProfilingConfig):
+        """
+        handler initialisation
+        """
+        self.logger = logging.getLogger("tornado.application")
+        self.config = config
+
+    def prepare(self):
+        token = self.request.headers.get('X-Admin-Token', '')
+        if not self.config.admin_token or not hmac.compare_digest(token, self.config.admin_token):
+            raise tornado.web.HTTPError(404)
+
+    def get(self, profiler, action):
+        """
+        HTTP Get handler, report the profiling results
+        """
+        limit = self._argument('limit', 10, int)
+        if profiler == 'cpu' and action == 'collapsed':
+            self.set_header('Content-Type', 'text/plain')
+            self.set_header('X-Worker-Pid', str(os.getpid()))
+            self.write(cpu_sampler.collapsed())
+            return
+        if profiler != 'tracemalloc' or action not in ('top', 'diff', 'routes'):
+            raise tornado.web.HTTPError(404)
+        if not memory_profiler.tracing:
+            self._reply(409, error='tracemalloc is not started')
+            return
+
+        key_type = self.get_argument('key_type', 'lineno')
+        if key_type not in KEY_TYPES:
+            raise tornado.web.HTTPError(400, "key_type must be one of {}".format(', '.join(KEY_TYPES)))
+        if action == 'top':
+            self._reply(200, **memory_profiler.top(key_type, limit))
+        elif action == 'diff':
+            self._reply(200, diff=memory_profiler.diff(key_type, limit))
+        else:
+            self._reply(200, routes=memory_profiler.top_by_route(limit))
+
+    def post(self, profiler, action):
+        """
+        HTTP Post handler, start or stop a profiler
+        """
+        if profiler not in ('tracemalloc', 'cpu') or action not in ('start', 'stop'):
+            raise tornado.web.HTTPError(404)
+
+        if action == 'start' and profiler == 'tracemalloc':
+            frames = self._argument('frames', self.config.tracemalloc_frames, int)
+        elif action == 'start':
+            interval = self._argument('interval', self.config.cpu_interval, float)
+
+        stop_profiler(profiler)
+        if action == 'start':
+            if profiler == 'tracemalloc':
+                memory_profiler.start(frames)
+            else:
+                cpu_sampler.start(interval)
+            _stop_timeouts[profiler] = IOLoop.current().call_later(self.config.max_duration, stop_profiler, profiler)
+            self.logger.info("pid:{} {} profiling started".format(os.getpid(), profiler))
+        self._reply(200, profiler=profiler, running=action == 'start')
+
+    def _argument(self, name, default, cast):
+        """
+        :return: the positive number of the query argument name
+        :raise: HTTPError 400 if it is not one
+        """
+        try:
+            value = cast(self.get_argument(name, default))
+        except ValueError:
+            value = 0
+        if not 0 < value < float('inf'):
+            raise tornado.web.HTTPError(400, "{} must be a positive number".format(name))
+        return value
+
+    def _reply(self, status, **kwargs):
+        self.set_status(status)
+        kwargs['pid'] = os.getpid()
+        self.write(kwargs)
@@ -1,13 +1,22 @@
 from tornado import gen
 from tornado.concurrent import Future
+from collections import OrderedDict
 import logging
-from statsd import StatsClient
-from src.config import MonitoringConfig, AmqpConfig
+from src.config import AmqpConfig, CompressionConfig
+from src.lib.Statsd import StatsClientSingleton
+from src.lib.compression import Compressor
+from src.lib.metrics import Counter, Gauge
+from src.lib.sink import Sink
 import pika
 import os
 
+AMQP_PUBLISHED = Counter('amqp_published_total', 'Messages published to AMQP')
+AMQP_CONFIRMED = Counter('amqp_confirmed_total', 'AMQP delivery confirmations', ('result',))
+AMQP_RETURNED = Counter('amqp_returned_total', 'Messages returned by AMQP, not routed to any queue')
+AMQP_OUTSTANDING = Gauge('amqp_outstanding_confirms', 'Published messages waiting for a delivery confirmation')
 
-class AMQPConnection:
+
+class AMQPConnection(Sink):
     """
     This class is inspired from the following pika sample:
     http://pika.readthedocs.io/en/0.11.0/examples/tornado_consumer.html
@@ -16,24 +25,27 @@ class AMQPConnection:
     commands that were issued and that should surface in the output as well.
 
     """
-    def __init__(self, config=AmqpConfig):
+    def __init__(self, config=AmqpConfig, compression_config=CompressionConfig):
         """
         Create a new instance of the AMQPConnection class, passing in the AMQPConfig
         class to connect to RabbitMQ.
         :param config:
+        :param compression_config: the per route body compression configuration
         """
 
         self._config = config
+        self._compressor = Compressor(compression_config)
         self._connection = None
         self._channel = None
+        self._delivery_tag = 0
+        self._pending_confirms = OrderedDict()
+        self._encoding_properties = {}
+        self._headers_properties = None
         self._isStarted = Future()
         self._channelClosed = Future()
         self._connectionClosed = Future()
         self.logger = logging.getLogger("tornado.application")
-        self.statsdClient = StatsClient(
-            MonitoringConfig.metrics_host,
-            MonitoringConfig.metrics_port,
-            prefix=MonitoringConfig.metrics_prefix)
+        self.statsdClient = StatsClientSingleton()
 
     @gen.coroutine
     def connect(self, ioloop):
@@ -96,6 +108,27 @@ class AMQPConnection:
         res = yield future_result
         return res
 
+    @gen.coroutine
+    def bind_queue(self, name, routing_key):
+        """Bind the queue to the exchange by invoking the Queue.Bind RPC
+        command. This method wait for the queue to be bound successfully
+
+        :param str|unicode name: The name of the queue to bind.
+        :param str|unicode routing_key: The routing key (pattern) to bind the queue to.
+
+        """
+        bind_ok = Future()
+
+        def on_bind_ok(unused_frame):
+            self.logger.info("pid:{} Queue {} is bound to {}"
+                             .format(os.getpid(), name, routing_key))
+            bind_ok.set_result(True)
+
+        self._channel.queue_bind(on_bind_ok, name,
+                                 self._config.exchange, routing_key)
+        res = yield bind_ok
+        return res
+
     @gen.coroutine
     def subscribe(self, routing_key, queue_name, handler):
         """
@@ -113,32 +146,86 @@ class AMQPConnection:
         yield self.declare_queue(queue_name)
 
         #  bind it
-        bind_ok = Future()
-
-        def on_bind_ok(unused_frame):
-            bind_ok.set_result(True)
-
-        self._channel.queue_bind(on_bind_ok, queue_name,
-                                 self._config.exchange, routing_key)
-        yield bind_ok
+        yield self.bind_queue(queue_name, routing_key)
 
         # consume it
         self._channel.basic_consume(handler, queue_name)
 
-    def publish(self, routing_key, msg):
+    def publish(self, routing_key, msg, content_encoding=None, headers=None):
         """publish a message to RabbitMQ, check for delivery confirmations in the
         _on_delivery_confirmations method.
 
+        The body is compressed if a codec is configured for the routing key,
+        unless a content_encoding is given, meaning the body is already encoded.
+
+        :param routing_key: the message routing key
+        :param msg: str or bytes message body
+        :param content_encoding: the encoding of an already compressed body
+        :param headers: a dict of message headers
+        :return: a Future resolved to True when the broker acks the message, False otherwise
         """
+        if content_encoding is None:
+            msg, content_encoding = self._compressor.compress(routing_key, msg)
         self._channel.basic_publish(exchange=self._config.exchange,
                                     routing_key=routing_key,
                                     body=msg,
-                                    properties=pika.BasicProperties(
-                                        delivery_mode=2,
-                                        # make message persistent
-                                    ),
+                                    properties=self._properties(content_encoding, headers),
                                     mandatory=True
                                     )
+        self._delivery_tag += 1
+        confirmation = Future()
+        self._pending_confirms[self._delivery_tag] = confirmation
+        AMQP_PUBLISHED.inc()
+        AMQP_OUTSTANDING.set(len(self._pending_confirms))
+        return confirmation
+
+    def _properties(self, content_encoding, headers):
+        """
+        :return: the BasicProperties of a message, reused: pika encodes them when the message is published.
+            The properties without headers are kept per content encoding, the ones of the last
+            headers dict published (the messages of a request share it, and do not modify it) are kept too.
+        """
+        if headers is None:
+            properties = self._encoding_properties.get(content_encoding)
+            if properties is None:
+                properties = self._encoding_properties[content_encoding] = pika.BasicProperties(
+                    delivery_mode=2,  # make message persistent
+                    content_encoding=content_encoding)
+            return properties
+        last = self._headers_properties
+        if last is not None and last[0] is headers and last[1] == content_encoding:
+            return last[2]
+        properties = pika.BasicProperties(delivery_mode=2, content_encoding=content_encoding, headers=headers)
+        self._headers_properties = (headers, content_encoding, properties)
+        return properties
+
+    @property
+    def compressor(self):
+        """
+        :return: the Compressor of the published messages
+        """
+        return self._compressor
+
+    @property
+    def started(self):
+        """
+        :return: a Future resolved to True once connected, False if the connection failed
+        """
+        return self._isStarted
+
+    @property
+    def is_open(self):
+        """
+        :return: True if the channel is open and messages can be published
+        """
+        return self._channel is not None
+
+    @property
+    def outstanding_confirms(self):
+        """
+        :return: the number of published messages waiting for a delivery confirmation
+        """
+        return len(self._pending_confirms)
 
     def _on_exchange_declare_ok(self, unused_frame):
         """Invoked by pika when RabbitMQ has finished the Exchange.Declare RPC
@@ -224,6 +311,7 @@ class AMQPConnection:
         """
         self.logger.info('Channel was closed: (%s) %s', reply_code, reply_text)
         self._channel = None
+        self._fail_pending_confirms()
         self._channelClosed.set_result(True)
         self._connection.close()
 
@@ -239,6 +327,7 @@ class AMQPConnection:
         """
         self.logger.error("message has been returned by the rabbitmq server: {}".format(body))
         self.statsdClient.incr('amqp.output_return', count=1)
+        AMQP_RETURNED.inc()
 
     def _on_delivery_confirmation(self, method_frame):
         """Invoked by pika when RabbitMQ responds to a Basic.Publish RPC
@@ -259,3 +348,33 @@ class AMQPConnection:
         else:
             self.logger.error("delivery_confirmation failed {}".format(method_frame))
             self.statsdClient.incr('amqp.output_failure', count=1)
+        AMQP_CONFIRMED.labels(result=confirmation_type).inc()
+        self._resolve_confirms(method_frame.method.delivery_tag, method_frame.method.multiple,
+                               confirmation_type == 'ack')
+        AMQP_OUTSTANDING.set(len(self._pending_confirms))
+
+    def _resolve_confirms(self, delivery_tag, multiple, acked):
+        """
+        Resolve the futures returned by publish for the confirmed delivery tag(s).
+        :param delivery_tag: the confirmed delivery tag
+        :param multiple: True if every delivery tag up to delivery_tag is confirmed
+        :param acked: True for a Basic.Ack, False for a Basic.Nack
+        """
+        pending = self._pending_confirms
+        if multiple:
+            while pending and next(iter(pending)) <= delivery_tag:
+                pending.popitem(last=False)[1].set_result(acked)
+        else:
+            confirmation = pending.pop(delivery_tag, None)
+            if confirmation is not None:
+                confirmation.set_result(acked)
+
+    def _fail_pending_confirms(self):
+        """
+        The channel is gone, messages waiting for a confirmation will never get one.
+        """
+        pending, self._pending_confirms = self._pending_confirms, OrderedDict()
+        self._delivery_tag = 0
+        for confirmation in pending.values():
+            confirmation.set_result(False)
+        AMQP_OUTSTANDING.set(0)
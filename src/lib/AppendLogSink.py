@@ -0,0 +1,118 @@
+from tornado.concurrent import Future
+from tornado.ioloop import IOLoop
+import logging
+import os
+
+from src.config import AppendLogConfig
+from src.lib.appendLog import PartitionWriter
+from src.lib.compression import DECODERS
+from src.lib.metrics import Counter
+from src.lib.sink import Sink
+
+APPEND_LOG_RECORDS = Counter('append_log_records_total', 'Messages written to the append log', ('result',))
+APPEND_LOG_BYTES = Counter('append_log_bytes_total', 'Message bytes written to the append log')
+
+
+class AppendLogSink(Sink):
+    """
+    This class archives the messages in a local append log, to be replayed
+    without the broker (see src.lib.appendLog.PartitionReader).
+
+    The worker claims the first partition not locked by another worker, and
+    appends the decoded messages to it. Messages are confirmed once flushed,
+    flush_interval_ms after the first buffered one.
+    """
+
+    def __init__(self, config=AppendLogConfig, ioloop=None):
+        """
+        :param config: the append log configuration
+        :param ioloop: the ioloop running the flush timer, the current one by default
+        """
+        self._config = config
+        self._ioloop = ioloop or IOLoop.current()
+        self._futures = []
+        self._timeout = None
+        self._started = Future()
+        self.logger = logging.getLogger("tornado.application")
+        self.writer = self._claim_partition()
+        self._started.set_result(self.writer is not None)
+
+    def _claim_partition(self):
+        for partition in range(self._config.partitions):
+            directory = os.path.join(self._config.directory, 'partition-{}'.format(partition))
+            try:
+                writer = PartitionWriter(directory, self._config)
+            except BlockingIOError:
+                continue
+            self.logger.info("pid:{} append log partition: {}".format(os.getpid(), directory))
+            return writer
+        self.logger.error("pid:{} every append log partition is locked, {} partitions for more workers"
+                          .format(os.getpid(), self._config.partitions))
+        return None
+
+    @property
+    def started(self):
+        return self._started
+
+    @property
+    def is_open(self):
+        return self.writer is not None
+
+    def publish(self, routing_key, msg, content_encoding=None, headers=None):
+        """
+        Append a message to the log.
+        :param routing_key: the message routing key
+        :param msg: str or bytes message body
+        :param content_encoding: the encoding of a compressed message
+        :param headers: the message headers, not archived
+        :return: a Future resolved to True once the message is flushed, False otherwise
+        """
+        confirmation = Future()
+        if self.writer is None:
+            APPEND_LOG_RECORDS.labels(result='dropped').inc()
+            confirmation.set_result(False)
+            return confirmation
+
+        if content_encoding is not None:
+            try:
+                msg = DECODERS[content_encoding](msg)
+            except Exception as e:
+                # a corrupt client body, not a sink failure
+                self.logger.warning("Cannot archive a message of {}: {}".format(routing_key, e))
+                APPEND_LOG_RECORDS.labels(result='rejected').inc()
+                confirmation.set_result(False)
+                return confirmation
+        if isinstance(msg, str):
+            msg = msg.encode('utf-8')
+        self.writer.append(routing_key, msg)
+        APPEND_LOG_BYTES.inc(len(msg))
+        self._futures.append(confirmation)
+        if self._timeout is None:
+            self._timeout = self._ioloop.call_later(self._config.flush_interval_ms / 1000, self.flush)
+        return confirmation
+
+    def flush(self):
+        """
+        Flush the appended messages, and confirm them
+        """
+        if self._timeout is not None:
+            self._ioloop.remove_timeout(self._timeout)
+            self._timeout = None
+        if self.writer is None or not self._futures:
+            return
+        futures, self._futures = self._futures, []
+        try:
+            self.writer.flush()
+            result = True
+        except OSError as e:
+            self.logger.error("pid:{} append log flush failed: {}".format(os.getpid(), e))
+            result = False
+        APPEND_LOG_RECORDS.labels(result='written' if result else 'failed').inc(len(futures))
+        for confirmation in futures:
+            confirmation.set_result(result)
+
+    def close(self):
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
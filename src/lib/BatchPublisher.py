@@ -0,0 +1,99 @@
+from tornado.concurrent import Future, chain_future
+from tornado.ioloop import IOLoop
+import logging
+
+from src.config import BatchConfig
+from src.lib.Statsd import StatsClientSingleton
+from src.lib.sink import Sink
+
+
+class BatchPublisher(Sink):
+    """
+    This class queues the messages published by every handler of the worker
+    and flushes them to the AMQPConnection when batch_size messages are queued
+    or when the linger timer expires, whichever comes first.
+
+    Messages are grouped per routing key, the publication order is preserved
+    within a routing key.
+    """
+
+    def __init__(self, amqp_con, config=BatchConfig, ioloop=None):
+        """
+        :param amqp_con: the AMQPConnection to flush the messages to
+        :param config: the batching configuration
+        :param ioloop: the ioloop running the linger timer, the current one by default
+        """
+        self._amqp_con = amqp_con
+        self._config = config
+        self._ioloop = ioloop or IOLoop.current()
+        self._groups = {}
+        self._size = 0
+        self._timeout = None
+        self.logger = logging.getLogger("tornado.application")
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def started(self):
+        return self._amqp_con.started
+
+    @property
+    def is_open(self):
+        return self._amqp_con.is_open
+
+    def publish(self, routing_key, msg, content_encoding=None, headers=None):
+        """
+        Queue a message to be published.
+        :param routing_key: the message routing key
+        :param msg: str or bytes message body
+        :param content_encoding: the encoding of an already compressed body
+        :param headers: a dict of message headers
+        :return: a Future resolved to True when the broker acks the message, False otherwise
+        :raise ConnectionError: if the AMQP channel is closed, as AMQPConnection.publish would
+        """
+        if not self._amqp_con.is_open:
+            raise ConnectionError("The AMQP channel is closed")
+        confirmation = Future()
+        group = self._groups.get(routing_key)
+        if group is None:
+            group = self._groups[routing_key] = []
+        group.append((msg, content_encoding, headers, confirmation))
+        self._size += 1
+
+        if self._size >= self._config.batch_size:
+            self.flush()
+        elif self._timeout is None:
+            self._timeout = self._ioloop.call_later(self._config.linger_ms / 1000, self._on_linger)
+        return confirmation
+
+    def flush(self):
+        """
+        Publish every queued message to the AMQPConnection.
+        """
+        if self._timeout is not None:
+            self._ioloop.remove_timeout(self._timeout)
+            self._timeout = None
+
+        groups, size = self._groups, self._size
+        self._groups, self._size = {}, 0
+        publish = self._amqp_con.publish
+        for routing_key, group in groups.items():
+            for msg, content_encoding, headers, confirmation in group:
+                try:
+                    if headers is None:
+                        published = publish(routing_key, msg, content_encoding)
+                    else:
+                        published = publish(routing_key, msg, content_encoding, headers)
+                    chain_future(published, confirmation)
+                except Exception as e:
+                    self.logger.error("Error while flushing message to AMQP, exception: {} routing_key: {}"
+                                      .format(e, routing_key))
+                    StatsClientSingleton().incr('amqp.output_exception', count=1)
+                    confirmation.set_result(False)
+        if size:
+            StatsClientSingleton().incr('amqp.batch_flush', count=1)
+
+    def _on_linger(self):
+        self._timeout = None
+        self.flush()
@@ -0,0 +1,231 @@
+from tornado import gen
+from tornado.concurrent import Future
+from tornado.ioloop import IOLoop
+import json
+import logging
+import random
+import time
+
+from src.config import ElasticsearchConfig
+from src.lib.compression import DECODERS
+from src.lib.keepAliveClient import KeepAliveHTTPClient
+from src.lib.metrics import Counter, Gauge
+from src.lib.sink import Sink
+
+ES_DOCUMENTS = Counter('es_documents_total', 'Documents sent to Elasticsearch', ('result',))
+ES_BULK_REQUESTS = Counter('es_bulk_requests_total', 'Elasticsearch _bulk requests', ('code',))
+ES_RETRIES = Counter('es_bulk_retries_total', 'Elasticsearch _bulk requests retried')
+ES_PENDING = Gauge('es_pending_bytes', 'Bytes buffered or being sent to Elasticsearch')
+
+# bulk responses worth a retry, 599 being a network error
+RETRY_CODES = frozenset((429, 502, 503, 504, 599))
+
+
+class ElasticsearchSink(Sink):
+    """
+    This class indexes the messages straight into Elasticsearch with the
+    _bulk API, skipping the AMQP broker and Logstash.
+
+    Documents are appended to an NDJSON buffer, sent when bulk_size bytes are
+    buffered or flush_interval_ms milliseconds after the first document.
+    At most max_concurrent_requests bulks are sent at once, on kept-alive
+    connections; the documents rejected with a 429 are sent again after an
+    exponential backoff. Past max_pending_bytes buffered or in flight,
+    new documents are dropped.
+    """
+
+    def __init__(self, config=ElasticsearchConfig, client=None, ioloop=None):
+        """
+        :param config: the Elasticsearch configuration
+        :param client: the KeepAliveHTTPClient to the Elasticsearch cluster
+        :param ioloop: the ioloop running the flush timer, the current one by default
+        """
+        self._config = config
+        self._client = client or KeepAliveHTTPClient(config.url, max_connections=config.max_concurrent_requests,
+                                                     request_timeout=config.request_timeout)
+        self._ioloop = ioloop or IOLoop.current()
+        self._entries = []
+        self._futures = []
+        self._size = 0
+        self._pending = 0
+        self._timeout = None
+        self._actions = {}
+        self._day = None
+        self._started = Future()
+        self._started.set_result(True)
+        self.logger = logging.getLogger("tornado.application")
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def started(self):
+        return self._started
+
+    @property
+    def is_open(self):
+        return True
+
+    def _action(self, routing_key):
+        """
+        :return: the NDJSON action line of a document, cached per routing key and day
+        """
+        day = int(time.time() // 86400)
+        if day != self._day:
+            self._day = day
+            self._actions = {}
+        action = self._actions.get(routing_key)
+        if action is None:
+            index = self._config.index.format(source=routing_key.split('.', 1)[0], routing_key=routing_key,
+                                              date=time.strftime('%Y.%m.%d', time.gmtime())).lower()
+            action = self._actions[routing_key] = json.dumps({'index': {'_index': index}}).encode('utf-8') + b'\n'
+        return action
+
+    def publish(self, routing_key, msg, content_encoding=None, headers=None):
+        """
+        Queue a document to be indexed.
+        :param routing_key: the message routing key, giving the index
+        :param msg: str or bytes JSON document
+        :param content_encoding: the encoding of a compressed document
+        :param headers: the message headers, not indexed
+        :return: a Future resolved to True when the document is indexed, False otherwise,
+            e.g. when it cannot be decoded
+        """
+        confirmation = Future()
+        if self._pending >= self._config.max_pending_bytes:
+            ES_DOCUMENTS.labels(result='dropped').inc()
+            confirmation.set_result(False)
+            return confirmation
+
+        try:
+            msg = self._document(msg, content_encoding)
+        except Exception as e:
+            # a corrupt client body, not a sink failure
+            self.logger.warning("Cannot index a document of {}: {}".format(routing_key, e))
+            ES_DOCUMENTS.labels(result='rejected').inc()
+            confirmation.set_result(False)
+            return confirmation
+        document = self._action(routing_key) + msg + b'\n'
+
+        self._entries.append(document)
+        self._futures.append(confirmation)
+        self._size += len(document)
+        self._pending += len(document)
+        if self._size >= self._config.bulk_size:
+            self.flush()
+        elif self._timeout is None:
+            self._timeout = self._ioloop.call_later(self._config.flush_interval_ms / 1000, self._on_flush_interval)
+        return confirmation
+
+    @staticmethod
+    def _document(msg, content_encoding):
+        """
+        :return: the decoded JSON document, on a single line
+        """
+        if content_encoding is not None:
+            msg = DECODERS[content_encoding](msg)
+        if isinstance(msg, str):
+            msg = msg.encode('utf-8')
+        if b'\n' in msg:
+            # NDJSON documents fit on a single line
+            msg = json.dumps(json.loads(msg.decode('utf-8'))).encode('utf-8')
+        return msg
+
+    def _on_flush_interval(self):
+        self._timeout = None
+        self.flush()
+
+    def flush(self):
+        """
+        Send the buffered documents in a _bulk request.
+        :return: the Future of the _bulk request, None if nothing was buffered
+        """
+        if self._timeout is not None:
+            self._ioloop.remove_timeout(self._timeout)
+            self._timeout = None
+        if not self._entries:
+            return None
+        entries, futures = self._entries, self._futures
+        self._entries, self._futures, self._size = [], [], 0
+        ES_PENDING.set(self._pending)
+        return self._send(entries, futures)
+
+    @gen.coroutine
+    def _send(self, entries, futures):
+        size = sum(len(entry) for entry in entries)
+        attempt = 0
+        try:
+            while entries:
+                code, response = yield self._post(entries)
+                if code == 200 and response.get('errors'):
+                    entries, futures = self._resolve_items(entries, futures, response['items'])
+                elif code == 200:
+                    self._resolve(futures, True, 'indexed')
+                    entries = futures = []
+                elif code not in RETRY_CODES:
+                    self.logger.error("Elasticsearch _bulk request failed with code {}, {} documents lost"
+                                      .format(code, len(entries)))
+                    self._resolve(futures, False, 'failed')
+                    entries = futures = []
+                if not entries:
+                    break
+
+                attempt += 1
+                if attempt > self._config.max_retries:
+                    self.logger.error("Elasticsearch _bulk request failed after {} retries, {} documents lost"
+                                      .format(self._config.max_retries, len(entries)))
+                    self._resolve(futures, False, 'failed')
+                    break
+                ES_RETRIES.inc()
+                yield gen.sleep(self._backoff(attempt))
+        finally:
+            self._pending -= size
+            ES_PENDING.set(self._pending)
+
+    @gen.coroutine
+    def _post(self, entries):
+        """
+        :return: a tuple (HTTP code, decoded response body)
+        """
+        try:
+            response = yield self._client.fetch('POST', '/_bulk', b''.join(entries),
+                                                {'Content-Type': 'application/x-ndjson'})
+            code = response.code
+        except Exception as e:
+            self.logger.warning("Elasticsearch _bulk request error: {}".format(e))
+            code, response = 599, None
+        ES_BULK_REQUESTS.labels(code=code).inc()
+        if code != 200:
+            return code, None
+        return code, json.loads(response.body.decode('utf-8'))
+
+    def _resolve_items(self, entries, futures, items):
+        """
+        Resolve the documents of a bulk response with errors.
+        :return: the entries and futures of the documents to send again
+        """
+        retry_entries, retry_futures = [], []
+        for entry, confirmation, item in zip(entries, futures, items):
+            status = next(iter(item.values()))['status']
+            if status == 429:
+                retry_entries.append(entry)
+                retry_futures.append(confirmation)
+            elif status < 300:
+                self._resolve((confirmation,), True, 'indexed')
+            else:
+                self.logger.debug("Elasticsearch rejected a document: {}".format(item))
+                self._resolve((confirmation,), False, 'rejected')
+        return retry_entries, retry_futures
+
+    def _backoff(self, attempt):
+        """
+        :return: the delay in seconds before the attempt-th retry, with a random jitter
+        """
+        delay = min(self._config.retry_max_backoff_ms, self._config.retry_backoff_ms * 2 ** (attempt - 1))
+        return delay * random.uniform(0.5, 1) / 1000
+
+    @staticmethod
+    def _resolve(futures, result, label):
+        ES_DOCUMENTS.labels(result=label).inc(len(futures))
+        for confirmation in futures:
+            confirmation.set_result(result)
@@ -0,0 +1,180 @@
+from collections import deque
+from tornado.concurrent import Future, chain_future
+from tornado.ioloop import IOLoop
+import logging
+
+from src.config import PriorityConfig
+from src.lib.metrics import Counter, Gauge
+from src.lib.sink import Sink
+
+PRIORITY_PUBLISHED = Counter('priority_published_total', 'Messages published, by priority lane', ('lane',))
+PRIORITY_SHED = Counter('priority_shed_total', 'Messages shed, by priority lane and reason', ('lane', 'reason'))
+PRIORITY_QUEUED = Gauge('priority_queued', 'Messages waiting in a priority lane', ('lane',))
+
+# lanes cached per routing key
+MAX_CACHED_KEYS = 10000
+
+
+def parse_lanes(lanes):
+    """
+    :param lanes: comma separated env:weight, highest priority first, e.g. "production:8,integration:1"
+    :return: a list of (env, weight)
+    """
+    res = []
+    for lane in lanes.split(','):
+        name, weight = lane.strip().rsplit(':', 1)
+        if int(weight) < 1:
+            raise ValueError("Priority lane {} needs a positive weight".format(name))
+        res.append((name, int(weight)))
+    if not res:
+        raise ValueError("No priority lane")
+    return res
+
+
+class Lane:
+    """
+    A priority lane: its queue of (routing_key, msg, content_encoding, headers, confirmation),
+    priority 0 being the highest
+    """
+    __slots__ = ('name', 'weight', 'priority', 'queue', 'queued_gauge')
+
+    def __init__(self, name, weight, priority):
+        self.name = name
+        self.weight = weight
+        self.priority = priority
+        self.queue = deque()
+        self.queued_gauge = PRIORITY_QUEUED.labels(lane=name)
+
+
+class PrioritySink(Sink):
+    """
+    This class schedules the messages of every route of the worker in front
+    of the AMQP sink, so that a load on the integration envs does not delay
+    the production ones.
+
+    Messages are published straight away while less than
+    max_outstanding_confirms are waiting for their confirmation; past it,
+    they are queued in the bounded queue of their lane, and a weighted round
+    robin publishes them as confirmations come back. Under this back-pressure
+    the lower lanes are shed first.
+    """
+
+    def __init__(self, sink, config=PriorityConfig, ioloop=None):
+        """
+        :param sink: the AMQPConnection
+        :param config: the priority configuration
+        :param ioloop: the ioloop running the scheduler, the current one by default
+        """
+        self._sink = sink
+        self._config = config
+        self._ioloop = ioloop or IOLoop.current()
+        self.lanes = [Lane(name, weight, priority) for priority, (name, weight) in enumerate(parse_lanes(config.lanes))]
+        self._lanes_by_env = {lane.name: lane for lane in self.lanes}
+        self._lanes_by_key = {}
+        self._outstanding = 0
+        self._queued = 0
+        self._scheduled = False
+        self.logger = logging.getLogger("tornado.application")
+
+    def __len__(self):
+        return self._queued
+
+    @property
+    def started(self):
+        return self._sink.started
+
+    @property
+    def is_open(self):
+        return self._sink.is_open
+
+    @property
+    def outstanding(self):
+        """
+        :return: the number of messages published and waiting for their confirmation
+        """
+        return self._outstanding
+
+    def lane(self, routing_key):
+        """
+        :return: the Lane of the env segment of the routing key, the last one for an unknown env
+        """
+        lane = self._lanes_by_key.get(routing_key)
+        if lane is None:
+            segments = routing_key.split('.', 3)
+            lane = self._lanes_by_env.get(segments[2] if len(segments) > 2 else None, self.lanes[-1])
+            if len(self._lanes_by_key) < MAX_CACHED_KEYS:
+                self._lanes_by_key[routing_key] = lane
+        return lane
+
+    def publish(self, routing_key, msg, content_encoding=None, headers=None):
+        """
+        Publish a message, or queue it in its lane while the confirmation window is full.
+        :return: a Future resolved to True when the broker acks the message, False if it is shed or nacked
+        :raise ConnectionError: if the AMQP channel is closed, as AMQPConnection.publish would
+        """
+        if not self._sink.is_open:
+            raise ConnectionError("The AMQP channel is closed")
+        lane = self.lane(routing_key)
+        confirmation = Future()
+        if self._outstanding < self._config.max_outstanding_confirms and not self._queued:
+            self._publish(lane, routing_key, msg, content_encoding, headers, confirmation)
+            return confirmation
+
+        queue = lane.queue
+        if len(queue) >= self._config.max_queued:
+            self._shed(lane, confirmation, 'full')
+        elif lane.priority and len(queue) >= self._config.shed_queued:
+            self._shed(lane, confirmation, 'backpressure')
+        else:
+            queue.append((routing_key, msg, content_encoding, headers, confirmation))
+            self._queued += 1
+            lane.queued_gauge.inc()
+            self._schedule()
+        return confirmation
+
+    def _shed(self, lane, confirmation, reason):
+        PRIORITY_SHED.labels(lane=lane.name, reason=reason).inc()
+        confirmation.set_result(False)
+
+    def _publish(self, lane, routing_key, msg, content_encoding, headers, confirmation):
+        try:
+            published = self._sink.publish(routing_key, msg, content_encoding, headers)
+        except Exception as e:
+            self.logger.error("Error while publishing message to AMQP, exception: {} routing_key: {}"
+                              .format(e, routing_key))
+            confirmation.set_result(False)
+            return
+        self._outstanding += 1
+        PRIORITY_PUBLISHED.labels(lane=lane.name).inc()
+        published.add_done_callback(self._on_confirmed)
+        chain_future(published, confirmation)
+
+    def _on_confirmed(self, published):
+        self._outstanding -= 1
+        if self._queued:
+            self._schedule()
+
+    def _schedule(self):
+        if not self._scheduled:
+            self._scheduled = True
+            self._ioloop.add_callback(self._drain)
+
+    def _drain(self):
+        """
+        Publish the queued messages within the confirmation window, weight messages of each lane in turn.
+        """
+        self._scheduled = False
+        budget = self._config.max_outstanding_confirms - self._outstanding
+        while budget > 0 and self._queued:
+            for lane in self.lanes:
+                queue = lane.queue
+                count = min(lane.weight, len(queue), budget)
+                for _ in range(count):
+                    routing_key, msg, content_encoding, headers, confirmation = queue.popleft()
+                    self._publish(lane, routing_key, msg, content_encoding, headers, confirmation)
+                if count:
+                    self._queued -= count
+                    lane.queued_gauge.inc(-count)
+                    budget -= count
+                if budget <= 0:
+                    break
@@ -1,5 +1,41 @@
-from statsd import StatsClient
-from src.config import MonitoringConfig
+from src.lib.metrics import Counter, Gauge
+
+STATS = Counter('stats_total', 'The statsd counters of the workers, by stat name', ('stat',))
+STATS_GAUGES = Gauge('stats_gauge', 'The statsd gauges of the workers, by stat name', ('stat',))
+
+
+class SharedStatsClient:
+    """
+    The statsd client API, writing the stats in the shared memory metrics of
+    the worker (see src.lib.metrics) instead of sending an UDP packet per call:
+    each worker updates its own slots, which are aggregated for the whole
+    instance by the /metrics endpoint and by the single StatsdExporter.
+    """
+
+    def __init__(self):
+        self._counters = {}
+        self._gauges = {}
+
+    def incr(self, stat, count=1, rate=1):
+        """
+        :param rate: ignored, every increment is counted
+        """
+        counter = self._counters.get(stat)
+        if counter is None:
+            counter = self._counters[stat] = STATS.labels(stat=stat)
+        counter.inc(count)
+
+    def gauge(self, stat, value, rate=1, delta=False):
+        """
+        :param delta: True to add value to the gauge of the worker instead of setting it
+        """
+        gauge = self._gauges.get(stat)
+        if gauge is None:
+            gauge = self._gauges[stat] = STATS_GAUGES.labels(stat=stat)
+        if delta:
+            gauge.inc(value)
+        else:
+            gauge.set(value)
 
 
 class StatsClientSingleton:
@@ -7,8 +43,5 @@ class StatsClientSingleton:
 
     def __new__(cls):
         if StatsClientSingleton.__instance is None:
-            StatsClientSingleton.__instance = StatsClient(
-                MonitoringConfig.metrics_host,
-                MonitoringConfig.metrics_port,
-                prefix=MonitoringConfig.metrics_prefix)
-        return StatsClientSingleton.__instance
\ No newline at end of file
+            StatsClientSingleton.__instance = SharedStatsClient()
+        return StatsClientSingleton.__instance
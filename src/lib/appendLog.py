@@ -0,0 +1,291 @@
+from bisect import bisect_right
+import fcntl
+import glob
+import mmap
+import os
+import struct
+import time
+import zlib
+
+# record: [uint32 length of key + body][uint32 crc32 of timestamp, key and body][int64 timestamp ms]
+#         [uint16 routing key length][routing key][body]
+RECORD_HEADER = struct.Struct('<IIqH')
+# sparse index entry: [uint32 offset relative to the segment][uint32 position in the segment][int64 timestamp ms]
+INDEX_ENTRY = struct.Struct('<IIq')
+
+SEGMENT_SUFFIX = '.log'
+INDEX_SUFFIX = '.index'
+
+
+class Record:
+    __slots__ = ('offset', 'timestamp', 'routing_key', 'body')
+
+    def __init__(self, offset, timestamp, routing_key, body):
+        self.offset = offset
+        self.timestamp = timestamp
+        self.routing_key = routing_key
+        self.body = body
+
+    def __repr__(self):
+        return 'Record(offset={}, timestamp={}, routing_key={!r}, {} bytes)'.format(
+            self.offset, self.timestamp, self.routing_key, len(self.body))
+
+
+def encode_record(timestamp, routing_key, body):
+    key = routing_key.encode('utf-8')
+    payload_crc = zlib.crc32(body, zlib.crc32(key, zlib.crc32(struct.pack('<q', timestamp))))
+    return RECORD_HEADER.pack(len(key) + len(body), payload_crc, timestamp, len(key)) + key + body
+
+
+def decode_record(data, position, offset):
+    """
+    :param data: the segment bytes, or mmap
+    :param position: the position of the record in the segment
+    :return: a tuple (Record, position of the next record), (None, position) if the record is truncated or corrupted
+    """
+    end = position + RECORD_HEADER.size
+    if end > len(data):
+        return None, position
+    length, crc, timestamp, key_length = RECORD_HEADER.unpack_from(data, position)
+    if end + length > len(data) or key_length > length:
+        return None, position
+    key = bytes(data[end:end + key_length])
+    body = bytes(data[end + key_length:end + length])
+    if zlib.crc32(body, zlib.crc32(key, zlib.crc32(struct.pack('<q', timestamp)))) != crc:
+        return None, position
+    return Record(offset, timestamp, key.decode('utf-8'), body), end + length
+
+
+def segment_path(directory, base_offset, suffix=SEGMENT_SUFFIX):
+    return os.path.join(directory, '{:020d}{}'.format(base_offset, suffix))
+
+
+def list_segments(directory):
+    """
+    :return: the sorted base offsets of the segments of a partition
+    """
+    return sorted(int(os.path.basename(path)[:-len(SEGMENT_SUFFIX)])
+                  for path in glob.glob(os.path.join(directory, '*' + SEGMENT_SUFFIX)))
+
+
+def read_index(directory, base_offset):
+    """
+    :return: the list of (relative offset, position, timestamp) entries of a segment index
+    """
+    try:
+        with open(segment_path(directory, base_offset, INDEX_SUFFIX), 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return []
+    usable = len(data) - len(data) % INDEX_ENTRY.size
+    return [INDEX_ENTRY.unpack_from(data, position) for position in range(0, usable, INDEX_ENTRY.size)]
+
+
+class PartitionWriter:
+    """
+    Append records to a partition: a directory of segment files named after
+    the offset of their first record, each one with a sparse index of an entry
+    every index_interval_bytes. Segments are rotated when they reach
+    segment_bytes or get older than segment_ms, the oldest ones are deleted
+    past retention_bytes.
+
+    A partition has a single writer, holding an exclusive lock on it.
+    """
+
+    def __init__(self, directory, config):
+        self.directory = directory
+        self._config = config
+        os.makedirs(directory, exist_ok=True)
+        self._lock = open(os.path.join(directory, '.lock'), 'a+b')
+        try:
+            fcntl.flock(self._lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._lock.close()
+            raise
+        self._segment = None
+        self._index = None
+        self._recover()
+
+    def _recover(self):
+        """
+        Reopen the last segment, dropping a record truncated by a crash
+        """
+        segments = list_segments(self.directory)
+        if not segments:
+            self._roll(0)
+            return
+        base_offset = segments[-1]
+        with open(segment_path(self.directory, base_offset), 'rb') as f:
+            data = f.read()
+        entries = read_index(self.directory, base_offset)
+        valid = [entry for entry in entries if entry[1] < len(data)]
+        offset, position = (base_offset + valid[-1][0], valid[-1][1]) if valid else (base_offset, 0)
+        while True:
+            record, next_position = decode_record(data, position, offset)
+            if record is None:
+                break
+            offset, position = offset + 1, next_position
+        self._open(base_offset)
+        if position < len(data):
+            self._segment.truncate(position)
+        if len(valid) < len(entries):
+            self._index.truncate(len(valid) * INDEX_ENTRY.size)
+        self.next_offset = offset
+        self._size = position
+        self._last_indexed = valid[-1][1] if valid else -self._config.index_interval_bytes
+
+    def _open(self, base_offset):
+        self.base_offset = base_offset
+        self._segment = open(segment_path(self.directory, base_offset), 'ab', buffering=self._config.buffer_size)
+        self._index = open(segment_path(self.directory, base_offset, INDEX_SUFFIX), 'ab')
+        self._created = time.time()
+
+    def _roll(self, base_offset):
+        if self._segment is not None:
+            self._segment.close()
+            self._index.close()
+        self._open(base_offset)
+        self.next_offset = base_offset
+        self._size = 0
+        self._last_indexed = -self._config.index_interval_bytes
+        self._apply_retention()
+
+    def _apply_retention(self):
+        segments = list_segments(self.directory)
+        sizes = [os.path.getsize(segment_path(self.directory, base)) for base in segments]
+        total = sum(sizes)
+        for base, size in zip(segments[:-1], sizes):
+            if total <= self._config.retention_bytes:
+                break
+            os.remove(segment_path(self.directory, base))
+            try:
+                os.remove(segment_path(self.directory, base, INDEX_SUFFIX))
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def append(self, routing_key, body, timestamp=None):
+        """
+        :param routing_key: the message routing key
+        :param body: bytes message body
+        :param timestamp: the message timestamp in milliseconds, now by default
+        :return: the offset of the record
+        """
+        if timestamp is None:
+            timestamp = int(time.time() * 1000)
+        if self._size >= self._config.segment_bytes or \
+                (self._size and time.time() - self._created >= self._config.segment_ms / 1000):
+            self._roll(self.next_offset)
+        if self._size - self._last_indexed >= self._config.index_interval_bytes:
+            self._index.write(INDEX_ENTRY.pack(self.next_offset - self.base_offset, self._size, timestamp))
+            self._last_indexed = self._size
+        record = encode_record(timestamp, routing_key, body)
+        self._segment.write(record)
+        self._size += len(record)
+        offset = self.next_offset
+        self.next_offset += 1
+        return offset
+
+    def flush(self):
+        """
+        Write the buffered records, they are readable once flushed
+        """
+        self._segment.flush()
+        self._index.flush()
+
+    def close(self):
+        self.flush()
+        self._segment.close()
+        self._index.close()
+        self._lock.close()
+
+
+class PartitionReader:
+    """
+    Read the records of a partition through mmap, from an offset or a timestamp.
+    Only the records flushed when a segment is opened are read.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def _segment_records(self, base_offset, position=0, offset=None):
+        path = segment_path(self.directory, base_offset)
+        try:
+            f = open(path, 'rb')
+        except FileNotFoundError:
+            # deleted by the retention
+            return
+        with f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return
+            data = mmap.mmap(f.fileno(), size, access=mmap.ACCESS_READ)
+            try:
+                offset = base_offset if offset is None else offset
+                while True:
+                    record, position = decode_record(data, position, offset)
+                    if record is None:
+                        return
+                    yield record
+                    offset += 1
+            finally:
+                data.close()
+
+    def read(self, offset=0):
+        """
+        :param offset: the first offset to read
+        :return: a generator of the Records from this offset
+        """
+        segments = list_segments(self.directory)
+        start = max(0, bisect_right(segments, offset) - 1)
+        for i, base_offset in enumerate(segments[start:]):
+            position, record_offset = 0, base_offset
+            if i == 0:
+                for relative, entry_position, _ in read_index(self.directory, base_offset):
+                    if base_offset + relative > offset:
+                        break
+                    position, record_offset = entry_position, base_offset + relative
+            for record in self._segment_records(base_offset, position, record_offset):
+                if record.offset >= offset:
+                    yield record
+
+    def offset_for_timestamp(self, timestamp):
+        """
+        :param timestamp: a timestamp in milliseconds
+        :return: the offset of the first record at or after this timestamp, None if there is none
+        """
+        segments = list_segments(self.directory)
+        for i, base_offset in enumerate(segments):
+            entries = read_index(self.directory, base_offset)
+            if i + 1 < len(segments):
+                next_entries = read_index(self.directory, segments[i + 1])
+                if next_entries and next_entries[0][2] <= timestamp:
+                    # the next segment starts before the timestamp
+                    continue
+            position, record_offset = 0, base_offset
+            for relative, entry_position, entry_timestamp in entries:
+                if entry_timestamp >= timestamp:
+                    break
+                position, record_offset = entry_position, base_offset + relative
+            for record in self._segment_records(base_offset, position, record_offset):
+                if record.timestamp >= timestamp:
+                    return record.offset
+        return None
+
+    def read_from_timestamp(self, timestamp):
+        """
+        :param timestamp: a timestamp in milliseconds
+        :return: a generator of the Records from the first one at or after this timestamp
+        """
+        offset = self.offset_for_timestamp(timestamp)
+        if offset is None:
+            return iter(())
+        return self.read(offset)
+
+
+def list_partitions(directory):
+    """
+    :return: the sorted partition directories of an append log
+    """
+    return sorted(path for path in glob.glob(os.path.join(directory, 'partition-*')) if os.path.isdir(path))
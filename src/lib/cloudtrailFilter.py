@@ -0,0 +1,195 @@
+import json
+
+from src.config import CloudTrailFilterConfig
+from src.lib.metrics import Counter
+
+CLOUDTRAIL_RECORDS = Counter('cloudtrail_records_total', 'CloudTrail records through the filter', ('result',))
+CLOUDTRAIL_DROPPED = Counter('cloudtrail_records_dropped_total', 'CloudTrail records dropped per rule', ('rule',))
+
+# actions cached per record kind: event sources and names are a few hundreds
+MAX_CACHED_KINDS = 10000
+
+KEEP = 'keep'
+DROP = 'drop'
+
+
+def _as_tuple(value):
+    if value is None:
+        return None
+    return (value,) if isinstance(value, str) else tuple(value)
+
+
+def _as_bool(value):
+    # readOnly is a boolean, or a string in the oldest records
+    if isinstance(value, str):
+        return value.lower() == 'true'
+    return bool(value) if value is not None else None
+
+
+def compile_projection(allow=None, deny=None):
+    """
+    :param allow: the fields to keep, the nested ones named with dots, all of them if None
+    :param deny: the fields to remove, the nested ones named with dots
+    :return: a function projecting a record, None if nothing is projected
+    """
+    if not allow and not deny:
+        return None
+    allowed = [field.split('.') for field in allow or ()]
+    denied = [field.split('.') for field in deny or ()]
+
+    def project(record):
+        if allowed:
+            projected = {}
+            for path in allowed:
+                source, target = record, projected
+                for name in path[:-1]:
+                    source = source.get(name)
+                    if not isinstance(source, dict):
+                        break
+                    target = target.setdefault(name, {})
+                else:
+                    if path[-1] in source:
+                        target[path[-1]] = source[path[-1]]
+            record = projected
+        for path in denied:
+            if len(path) == 1:
+                if path[0] in record:
+                    record = dict(record)
+                    del record[path[0]]
+                continue
+            # copy the parents of the removed field, the record itself is left untouched
+            record = dict(record)
+            parent = record
+            for name in path[:-1]:
+                child = parent.get(name)
+                if not isinstance(child, dict):
+                    break
+                parent[name] = child = dict(child)
+                parent = child
+            else:
+                parent.pop(path[-1], None)
+        return record
+
+    return project
+
+
+class Rule:
+    """
+    A filter rule: its predicates on the eventSource, the eventName prefixes,
+    readOnly and errorCode of a record, each one matching any record when
+    unset, and its action, dropping the matching records or projecting them.
+    """
+    __slots__ = ('name', 'event_sources', 'event_name_prefixes', 'read_only', 'error_codes', 'has_error', 'action')
+
+    def __init__(self, name, event_source=None, event_name_prefix=None, read_only=None, error_code=None,
+                 drop=False, allow_fields=None, deny_fields=None):
+        """
+        :param error_code: an error code or a list of error codes, True for any error, False for no error
+        """
+        self.name = name
+        self.event_sources = _as_tuple(event_source)
+        self.event_name_prefixes = _as_tuple(event_name_prefix)
+        self.read_only = read_only
+        self.has_error = error_code if isinstance(error_code, bool) else None
+        self.error_codes = None if isinstance(error_code, bool) else _as_tuple(error_code)
+        if drop:
+            self.action = DROP
+        else:
+            self.action = compile_projection(allow_fields, deny_fields) or KEEP
+
+    def matches(self, event_source, event_name, read_only, error_code):
+        if self.event_sources is not None and event_source not in self.event_sources:
+            return False
+        if self.event_name_prefixes is not None and not (event_name or '').startswith(self.event_name_prefixes):
+            return False
+        if self.read_only is not None and read_only != self.read_only:
+            return False
+        if self.has_error is not None and (error_code is not None) != self.has_error:
+            return False
+        if self.error_codes is not None and error_code not in self.error_codes:
+            return False
+        return True
+
+
+class RecordFilter:
+    """
+    Drop or project the CloudTrail records before they are published.
+
+    The rules are evaluated in order, the first matching one gives the action
+    of a record, the default projection applies to the records no rule
+    matches. As the rules only depend on the eventSource, eventName, readOnly
+    and errorCode of a record, the action of each combination of these fields
+    is resolved once and then looked up in a dispatch table, in constant time
+    whatever the number of rules.
+    """
+
+    def __init__(self, rules, allow_fields=None, deny_fields=None):
+        """
+        :param rules: the list of Rules
+        :param allow_fields: the fields kept by default, all of them if None
+        :param deny_fields: the fields removed by default
+        """
+        self.rules = rules
+        self._default = compile_projection(allow_fields, deny_fields) or KEEP
+        self._dispatch = {}
+        self._published = CLOUDTRAIL_RECORDS.labels(result='published')
+        self._dropped = CLOUDTRAIL_RECORDS.labels(result='dropped')
+        self._rule_dropped = {rule.name: CLOUDTRAIL_DROPPED.labels(rule=rule.name) for rule in rules}
+
+    def _resolve(self, kind):
+        for rule in self.rules:
+            if rule.matches(*kind):
+                return rule.name, rule.action
+        return None, self._default
+
+    def apply(self, record):
+        """
+        :param record: a decoded CloudTrail record
+        :return: the record to publish, projected, None if it is dropped
+        """
+        kind = (record.get('eventSource'), record.get('eventName'), _as_bool(record.get('readOnly')),
+                record.get('errorCode'))
+        try:
+            rule, action = self._dispatch[kind]
+        except KeyError:
+            rule, action = self._resolve(kind)
+            if len(self._dispatch) < MAX_CACHED_KINDS:
+                self._dispatch[kind] = rule, action
+        if action is DROP:
+            self._dropped.inc()
+            self._rule_dropped[rule].inc()
+            return None
+        self._published.inc()
+        return record if action is KEEP else action(record)
+
+
+def load_filter(path):
+    """
+    :param path: a JSON rules file, e.g.
+        {"rules": [{"name": "read-noise", "read_only": true, "event_name_prefix": ["Describe", "List", "Get"],
+                    "error_code": false, "drop": true}],
+         "deny_fields": ["responseElements"]}
+    :return: the RecordFilter of the rules file
+    """
+    with open(path) as f:
+        definition = json.load(f)
+    rules = []
+    for rule in definition.get('rules', ()):
+        rule = dict(rule)
+        rules.append(Rule(rule.pop('name'), **rule))
+    return RecordFilter(rules, definition.get('allow_fields'), definition.get('deny_fields'))
+
+
+_filters = {}
+
+
+def default_filter(config=CloudTrailFilterConfig):
+    """
+    :return: the RecordFilter of the CloudTrail handlers, loaded once, None without rules file
+    """
+    if not config.rules_file:
+        return None
+    record_filter = _filters.get(config.rules_file)
+    if record_filter is None:
+        record_filter = _filters[config.rules_file] = load_filter(config.rules_file)
+    return record_filter
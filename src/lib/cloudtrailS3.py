@@ -0,0 +1,255 @@
+import codecs
+import json
+import logging
+import os
+import zlib
+from urllib.parse import unquote_plus
+
+from tornado import gen
+from tornado.locks import Semaphore
+
+from src.config import CloudTrailS3Config
+from src.lib.cloudtrailFilter import default_filter
+from src.lib.metrics import Counter
+from src.lib.objectStore import LocalObjectStore, S3ObjectStore
+
+CLOUDTRAIL_OBJECTS = Counter('cloudtrail_s3_objects_total', 'CloudTrail log files notified by S3', ('result',))
+CLOUDTRAIL_S3_RECORDS = Counter('cloudtrail_s3_records_total', 'CloudTrail records read from S3')
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def parse_notification(body):
+    """
+    :param body: a JSON notification: an S3 event notification, the notification
+        CloudTrail sends when it delivers a log file, or any of them wrapped in an
+        SNS message, itself possibly the body of an SQS message
+    :return: the list of the (bucket, key) of the notified objects
+    """
+    notification = json.loads(body) if isinstance(body, (str, bytes)) else body
+    if not isinstance(notification, dict):
+        raise ValueError("Not a notification: {}".format(body))
+    if notification.get('Type') == 'Notification' or 'Message' in notification:
+        # SNS envelope, the message is the JSON notification
+        return parse_notification(notification['Message'])
+    if 'Records' in notification:
+        return [(record['s3']['bucket']['name'], unquote_plus(record['s3']['object']['key']))
+                for record in notification['Records'] if 's3' in record]
+    if 's3Bucket' in notification:
+        return [(notification['s3Bucket'], key) for key in notification.get('s3ObjectKey', ())]
+    if 'Event' in notification:
+        # s3:TestEvent, sent when the notifications are configured
+        return []
+    raise ValueError("Unknown notification: {}".format(body))
+
+
+class RecordStream:
+    """
+    Decode the records of a CloudTrail log file as its chunks are received,
+    without holding the whole file: the gzip stream is inflated incrementally,
+    and each record of the Records array is decoded as soon as it is complete.
+    """
+
+    def __init__(self):
+        self._inflater = None
+        self._head = b''
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._json = json.JSONDecoder()
+        self._buffer = ''
+        self._in_records = False
+        self.done = False
+
+    def feed(self, chunk):
+        """
+        :param chunk: the next bytes of the file, gzipped or not
+        :return: the list of the records completed by this chunk
+        """
+        if self._inflater is None:
+            chunk = self._head + chunk
+            if len(chunk) < len(GZIP_MAGIC):
+                self._head = chunk
+                return []
+            # 16 + MAX_WBITS: gzip header
+            self._inflater = zlib.decompressobj(16 + zlib.MAX_WBITS) if chunk.startswith(GZIP_MAGIC) else False
+        if self._inflater:
+            chunk = self._inflater.decompress(chunk)
+        self._buffer += self._decoder.decode(chunk)
+        return self._records()
+
+    def close(self):
+        """
+        :raise: ValueError if the file is truncated
+        """
+        if self._inflater and not self._inflater.eof:
+            raise ValueError("Truncated gzip stream")
+        if not self.done:
+            raise ValueError("Truncated Records array")
+
+    def _records(self):
+        buffer = self._buffer
+        position = 0
+        if not self._in_records:
+            start = buffer.find('"Records"')
+            bracket = buffer.find('[', start) if start >= 0 else -1
+            if bracket < 0:
+                return []
+            self._in_records = True
+            position = bracket + 1
+
+        records = []
+        length = len(buffer)
+        while not self.done:
+            while position < length and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position == length:
+                break
+            if buffer[position] == ']':
+                self.done = True
+                break
+            try:
+                record, position = self._json.raw_decode(buffer, position)
+            except ValueError:
+                # the record is not complete yet
+                break
+            records.append(record)
+        self._buffer = buffer[position:]
+        return records
+
+
+class Checkpoint:
+    """
+    The objects already ingested, one bucket/key per line of an append-only
+    file shared by the workers: the lines appended by the other workers are
+    read before each lookup.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._keys = set()
+        self._position = 0
+        self._refresh()
+
+    def _refresh(self):
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(self._position)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        # an incomplete last line is being appended by another worker
+        end = data.rfind(b'\n') + 1
+        self._keys.update(data[:end].decode('utf-8').splitlines())
+        self._position += end
+
+    def __contains__(self, item):
+        key = '{}/{}'.format(*item)
+        if key not in self._keys:
+            self._refresh()
+        return key in self._keys
+
+    def add(self, item):
+        key = '{}/{}'.format(*item)
+        with open(self.path, 'ab') as f:
+            f.write(key.encode('utf-8') + b'\n')
+        self._keys.add(key)
+
+
+class CloudTrailIngester:
+    """
+    Ingest the CloudTrail log files notified by S3: at most
+    max_concurrent_fetches objects are read at once from the object store,
+    their records are published one by one while they are read, through the
+    CloudTrail filter. An object is checkpointed once all its records are
+    confirmed, and is skipped when notified again.
+    """
+
+    def __init__(self, store, checkpoint=None, config=CloudTrailS3Config, record_filter=None):
+        """
+        :param store: the ObjectStore of the log files
+        :param checkpoint: the Checkpoint of the ingested objects, None to ingest them every time
+        :param record_filter: the RecordFilter of the records, the CLOUDTRAIL_RULES_FILE one by default
+        """
+        self.store = store
+        self.checkpoint = checkpoint
+        self.record_filter = record_filter or default_filter()
+        self._semaphore = Semaphore(config.max_concurrent_fetches)
+        self.logger = logging.getLogger("tornado.application")
+
+    @gen.coroutine
+    def ingest(self, objects, publish):
+        """
+        :param objects: a list of (bucket, key)
+        :param publish: called with each JSON record, returning a Future resolved to True once it is stored
+        :return: the number of records published
+        :raise: the first error of an object, once every object is ingested or failed
+        """
+        results = yield [self._ingest_guarded(item, publish) for item in objects]
+        for result in results:
+            if isinstance(result, Exception):
+                raise result
+        return sum(results)
+
+    @gen.coroutine
+    def _ingest_guarded(self, item, publish):
+        try:
+            return (yield self.ingest_object(item, publish))
+        except Exception as e:
+            CLOUDTRAIL_OBJECTS.labels(result='failed').inc()
+            self.logger.warning("pid:{} CloudTrail log file {}/{} not ingested: {}".format(os.getpid(), *item, e))
+            return e
+
+    @gen.coroutine
+    def ingest_object(self, item, publish):
+        """
+        :param item: the (bucket, key) of the object
+        :return: the number of records published
+        """
+        if self.checkpoint is not None and item in self.checkpoint:
+            CLOUDTRAIL_OBJECTS.labels(result='skipped').inc()
+            return 0
+        with (yield self._semaphore.acquire()):
+            stream = RecordStream()
+            confirmations = []
+
+            def on_chunk(chunk):
+                records = stream.feed(chunk)
+                CLOUDTRAIL_S3_RECORDS.inc(len(records))
+                for record in records:
+                    if self.record_filter is not None:
+                        record = self.record_filter.apply(record)
+                        if record is None:
+                            continue
+                    confirmations.append(publish(json.dumps(record)))
+
+            yield self.store.fetch(item[0], item[1], on_chunk)
+            stream.close()
+            confirmed = yield confirmations
+        if not all(confirmed):
+            raise IOError("{} of {} records not confirmed".format(confirmed.count(False), len(confirmed)))
+        if self.checkpoint is not None:
+            self.checkpoint.add(item)
+        CLOUDTRAIL_OBJECTS.labels(result='ingested').inc()
+        return len(confirmed)
+
+
+_ingesters = {}
+
+
+def default_ingester(config=CloudTrailS3Config):
+    """
+    :return: the CloudTrailIngester of the notification handlers, built once
+    """
+    ingester = _ingesters.get(config)
+    if ingester is None:
+        if config.store == 's3':
+            if not config.access_key or not config.secret_key:
+                raise ValueError("The s3 object store needs AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY")
+            store = S3ObjectStore(config.region, config.access_key, config.secret_key, config.session_token or None,
+                                  config.endpoint or None, config.request_timeout)
+        elif config.store == 'local':
+            store = LocalObjectStore(config.directory, config.chunk_size)
+        else:
+            raise ValueError("Unknown object store: {}".format(config.store))
+        checkpoint = Checkpoint(config.checkpoint_file) if config.checkpoint_file else None
+        ingester = _ingesters[config] = CloudTrailIngester(store, checkpoint, config)
+    return ingester
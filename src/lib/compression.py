@@ -0,0 +1,153 @@
+import gzip
+import zlib
+
+from src.config import CompressionConfig
+
+# codecs cached per routing key, enough for every Heroku app of the drains
+MAX_CACHED_KEYS = 10000
+
+
+def _gzip(body, level):
+    return gzip.compress(body, compresslevel=level)
+
+
+def _deflate(body, level):
+    return zlib.compress(body, level)
+
+
+def _inflate(body):
+    try:
+        return zlib.decompress(body)
+    except zlib.error:
+        # HTTP clients disagree on deflate: some send a raw deflate stream, without the zlib header
+        return zlib.decompress(body, -zlib.MAX_WBITS)
+
+
+# content_encoding -> compress function
+CODECS = {
+    'gzip': _gzip,
+    'deflate': _deflate,
+}
+
+# content_encoding -> decompress function
+DECODERS = {
+    'gzip': gzip.decompress,
+    'deflate': _inflate,
+}
+
+# accepted aliases in the configuration
+ALIASES = {
+    'zlib': 'deflate',
+}
+
+try:
+    import lz4.frame
+
+    def _lz4(body, level):
+        return lz4.frame.compress(body, compression_level=level)
+
+    CODECS['lz4'] = _lz4
+    DECODERS['lz4'] = lz4.frame.decompress
+except ImportError:
+    pass
+
+try:
+    import zstandard
+
+    def _zstd(body, level):
+        return zstandard.ZstdCompressor(level=level).compress(body)
+
+    def _unzstd(body):
+        return zstandard.ZstdDecompressor().decompress(body)
+
+    CODECS['zstd'] = _zstd
+    DECODERS['zstd'] = _unzstd
+except ImportError:
+    pass
+
+try:
+    import brotli
+
+    # brotli is only accepted from the HTTP clients, messages are not compressed with it
+    DECODERS['br'] = brotli.decompress
+except ImportError:
+    pass
+
+
+def parse_routes(routes):
+    """
+    Parse a "prefix:codec,prefix:codec" string into a list of (prefix, codec) tuples,
+    longest prefixes first so the most specific route wins
+    :param routes: the configuration string
+    :return: a list of tuples
+    """
+    parsed = []
+    for route in routes.split(','):
+        route = route.strip()
+        if not route:
+            continue
+        prefix, codec = route.rsplit(':', 1)
+        codec = ALIASES.get(codec, codec)
+        if codec not in CODECS:
+            raise ValueError("Unsupported compression codec: {}".format(codec))
+        parsed.append((prefix, codec))
+    return sorted(parsed, key=lambda r: len(r[0]), reverse=True)
+
+
+class Compressor:
+    """
+    Compress AMQP message bodies according to their routing key.
+    The codec lookup is cached per routing key.
+    """
+
+    def __init__(self, config=CompressionConfig):
+        self._config = config
+        self._routes = parse_routes(config.routes)
+        self._codecs = {}
+
+    def add_route(self, prefix, codec):
+        """
+        Compress the messages whose routing key starts with prefix, the
+        AMQP_COMPRESSION_ROUTES ones having the precedence.
+        :param prefix: the routing key prefix
+        :param codec: the codec name
+        """
+        if any(route_prefix == prefix for route_prefix, _ in self._routes):
+            return
+        self._routes = parse_routes(','.join('{}:{}'.format(*route) for route in self._routes + [(prefix, codec)]))
+        self._codecs = {}
+
+    def codec_for(self, routing_key):
+        """
+        :param routing_key: the message routing key
+        :return: the content_encoding to use for this routing key, or None
+        """
+        try:
+            return self._codecs[routing_key]
+        except KeyError:
+            codec = None
+            for prefix, name in self._routes:
+                if routing_key.startswith(prefix):
+                    codec = name
+                    break
+            if len(self._codecs) < MAX_CACHED_KEYS:
+                self._codecs[routing_key] = codec
+            return codec
+
+    def compress(self, routing_key, body):
+        """
+        Compress the body if a codec is configured for the routing key and the body
+        is bigger than the configured threshold.
+        :param routing_key: the message routing key
+        :param body: str or bytes message body
+        :return: a tuple (body, content_encoding), content_encoding is None if not compressed
+        """
+        codec = self.codec_for(routing_key) if self._routes else None
+        if codec is None:
+            return body, None
+
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        if len(body) < self._config.min_size:
+            return body, None
+        return CODECS[codec](body, self._config.level), codec
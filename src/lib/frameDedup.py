@@ -0,0 +1,164 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import time
+
+from src.config import FrameDedupConfig
+from src.lib.metrics import Counter
+
+FRAMES = Counter('heroku_frames_total', 'Heroku drain frames received, by deduplication result', ('result',))
+
+MAGIC = b'H2EDEDUP'
+# [magic][uint32 capacity][4 bytes padding]
+HEADER = struct.Struct('<8sI4x')
+# [uint64 key hash][float64 expiry time], a 0 hash being an empty slot
+SLOT = struct.Struct('<Qd')
+# slots probed from the slot of a key, the oldest one is evicted when they are all used
+PROBES = 8
+
+
+def frame_key(drain_token, frame_id):
+    """
+    :return: the 64 bits hash of a frame, never 0
+    """
+    digest = hashlib.blake2b('{}\0{}'.format(drain_token, frame_id).encode('utf-8'), digest_size=8).digest()
+    return struct.unpack('<Q', digest)[0] or 1
+
+
+class FrameDedup:
+    """
+    The Logplex frames received recently, to acknowledge the frames sent again
+    without publishing their messages twice.
+
+    The frames are kept in an open addressing hash table of fixed size, in a
+    memory mapped file shared by the workers, each lookup being done under
+    an exclusive lock of the file. A frame expires ttl seconds after it was
+    received; when the slots probed for a new frame are all used, the oldest
+    one is evicted, so that the table never grows.
+    """
+
+    def __init__(self, path, capacity=65536, ttl=3600):
+        """
+        :param path: the file of the table, created if needed; suffixed with the capacity if it holds
+            a table of another capacity
+        :param capacity: the number of slots of the table, 16 bytes each
+        :param ttl: the time in seconds a frame is remembered
+        """
+        if capacity < PROBES:
+            raise ValueError("The frame table needs at least {} slots".format(PROBES))
+        self.path = path
+        self.capacity = capacity
+        self.ttl = ttl
+        size = HEADER.size + capacity * SLOT.size
+        self._fd = self._open(path, size)
+        if self._fd is None:
+            # the table of another capacity, still mapped by the workers of the previous
+            # configuration: truncating it would crash them, the table gets a file of its own
+            self.path = '{}.{}'.format(path, capacity)
+            self._fd = self._open(self.path, size)
+            if self._fd is None:
+                raise ValueError("{} is not a frame table of {} slots".format(self.path, capacity))
+        self._map = mmap.mmap(self._fd, size)
+
+    def _open(self, path, size):
+        """
+        :return: the file descriptor of the table, None if the file holds another table
+        """
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        with _FileLock(fd):
+            header = HEADER.pack(MAGIC, self.capacity)
+            file_size = os.fstat(fd).st_size
+            if file_size == 0:
+                # a new table
+                os.ftruncate(fd, size)
+                os.pwrite(fd, header, 0)
+                return fd
+            if file_size == size and os.pread(fd, HEADER.size, 0) == header:
+                return fd
+        os.close(fd)
+        return None
+
+    def _locked(self):
+        return _FileLock(self._fd)
+
+    def _slots(self, key):
+        start = key % self.capacity
+        for probe in range(PROBES):
+            yield HEADER.size + ((start + probe) % self.capacity) * SLOT.size
+
+    def seen(self, drain_token, frame_id, now=None):
+        """
+        Record a frame.
+        :return: True if the frame was already received less than ttl seconds ago
+        """
+        if drain_token is None or frame_id is None:
+            FRAMES.labels(result='untracked').inc()
+            return False
+        key = frame_key(drain_token, frame_id)
+        now = time.time() if now is None else now
+        data = self._map
+        with self._locked():
+            free = None
+            oldest = None
+            for position in self._slots(key):
+                slot_key, expiry = SLOT.unpack_from(data, position)
+                if slot_key == key and expiry > now:
+                    FRAMES.labels(result='duplicate').inc()
+                    return True
+                if free is None and (slot_key == 0 or expiry <= now or slot_key == key):
+                    free = position
+                if oldest is None or expiry < oldest[1]:
+                    oldest = position, expiry
+            SLOT.pack_into(data, free if free is not None else oldest[0], key, now + self.ttl)
+        FRAMES.labels(result='new').inc()
+        return False
+
+    def forget(self, drain_token, frame_id):
+        """
+        Remove a frame whose messages were not published, so that it is accepted when sent again.
+        """
+        if drain_token is None or frame_id is None:
+            return
+        key = frame_key(drain_token, frame_id)
+        data = self._map
+        with self._locked():
+            for position in self._slots(key):
+                if SLOT.unpack_from(data, position)[0] == key:
+                    SLOT.pack_into(data, position, 0, 0.0)
+
+    def close(self):
+        self._map.close()
+        os.close(self._fd)
+
+
+class _FileLock:
+    """
+    An exclusive lock of a file, shared by the processes.
+    """
+    __slots__ = ('_fd',)
+
+    def __init__(self, fd):
+        self._fd = fd
+
+    def __enter__(self):
+        fcntl.flock(self._fd, fcntl.LOCK_EX)
+
+    def __exit__(self, *exc_info):
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+
+_dedups = {}
+
+
+def default_dedup(config=FrameDedupConfig):
+    """
+    :return: the FrameDedup of the worker, opened once, None if the deduplication is not activated
+    """
+    if not config.activated:
+        return None
+    dedup = _dedups.get(config)
+    if dedup is None:
+        dedup = _dedups[config] = FrameDedup(config.file, config.capacity, config.ttl)
+    return dedup
@@ -0,0 +1,19 @@
+from gunicorn.workers.gtornado import TornadoWorker as BaseTornadoWorker
+from tornado.ioloop import IOLoop
+
+from src.lib.serverSettings import tune_server
+
+
+class TornadoWorker(BaseTornadoWorker):
+    """
+    gunicorn tornado worker applying the HTTPServerConfig settings.
+    gunicorn creates the HTTPServer itself without any tuning parameter,
+    the settings are applied as soon as the ioloop starts, before the first
+    connection is accepted.
+
+    usage: gunicorn -k src.lib.gunicornWorker.TornadoWorker main:app
+    """
+
+    def run(self):
+        IOLoop.instance().add_callback(lambda: tune_server(self.server))
+        super(TornadoWorker, self).run()
@@ -0,0 +1,120 @@
+from collections import deque
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+from tornado.ioloop import IOLoop, PeriodicCallback
+
+from src.config import LoopMonitorConfig
+from src.lib.metrics import Counter, Gauge, Histogram
+
+LAG_BUCKETS = (.001, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+IOLOOP_LAG = Histogram('ioloop_lag_seconds', 'Delay of the ioloop callbacks', buckets=LAG_BUCKETS)
+IOLOOP_LAG_MAX = Gauge('ioloop_lag_max_seconds', 'Highest ioloop lag over the monitor window', mode='max')
+IOLOOP_SLOW = Counter('ioloop_slow_callbacks_total', 'Callbacks blocking the ioloop over the slow threshold')
+
+
+def percentile(values, p):
+    """
+    :param values: a sorted list
+    :return: the nearest-rank p-th percentile of the values
+    """
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+
+class LoopLagMonitor:
+    """
+    Measure the ioloop scheduling lag: a periodic callback is expected every
+    interval, the lag is how late it actually runs. A high lag means a callback
+    blocked the ioloop, delaying every other connection of the worker.
+
+    When slow_threshold_ms is set, a watchdog thread logs the stack of the
+    ioloop thread while it is blocked, pointing at the offending handler.
+    """
+
+    def __init__(self, interval_ms=None, window=None, slow_threshold_ms=None, config=LoopMonitorConfig):
+        interval_ms = interval_ms or config.interval_ms
+        slow_threshold_ms = config.slow_threshold_ms if slow_threshold_ms is None else slow_threshold_ms
+        self.logger = logging.getLogger("tornado.application")
+        self._interval = interval_ms / 1000
+        self._slow_threshold = slow_threshold_ms / 1000
+        self._callback = PeriodicCallback(self._check, interval_ms)
+        self._last = None
+        self._lags = deque(maxlen=window or config.window)
+        self.lag = 0.0
+        self._checks = 0
+        self._tick = time.monotonic()
+        self._reported_tick = None
+        self._thread_id = None
+        self._watchdog = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        self._last = None
+        self._tick = time.monotonic()
+        self._callback.start()
+        if self._slow_threshold and self._watchdog is None:
+            self._thread_id = threading.get_ident()
+            self._stopped.clear()
+            self._watchdog = threading.Thread(target=self._watch, name='ioloop-watchdog', daemon=True)
+            self._watchdog.start()
+
+    def stop(self):
+        self._callback.stop()
+        if self._watchdog is not None:
+            self._stopped.set()
+            self._watchdog.join()
+            self._watchdog = None
+
+    @property
+    def max_lag(self):
+        return max(self._lags, default=0.0)
+
+    def stats(self):
+        """
+        :return: the last, max and percentile lags over the window, in milliseconds
+        """
+        lags = sorted(self._lags)
+        return {
+            'lag_ms': round(self.lag * 1000, 3),
+            'max_ms': round(lags[-1] * 1000 if lags else 0.0, 3),
+            'p50_ms': round(percentile(lags, 50) * 1000, 3),
+            'p90_ms': round(percentile(lags, 90) * 1000, 3),
+            'p99_ms': round(percentile(lags, 99) * 1000, 3),
+            'samples': len(lags),
+        }
+
+    def _check(self):
+        self._tick = time.monotonic()
+        now = IOLoop.current().time()
+        if self._last is not None:
+            self.lag = max(0.0, now - self._last - self._interval)
+            self._lags.append(self.lag)
+            IOLOOP_LAG.observe(self.lag)
+            # the window max is exported about once per second
+            self._checks += 1
+            if self._checks * self._interval >= 1:
+                self._checks = 0
+                IOLOOP_LAG_MAX.set(self.max_lag)
+            if self._slow_threshold and self.lag > self._slow_threshold:
+                IOLOOP_SLOW.inc()
+        self._last = now
+
+    def _watch(self):
+        """
+        Watchdog thread: log the stack of the ioloop thread once per blocking callback
+        """
+        while not self._stopped.wait(self._slow_threshold / 2):
+            tick = self._tick
+            blocked = time.monotonic() - tick - self._interval
+            if blocked > self._slow_threshold and tick != self._reported_tick:
+                self._reported_tick = tick
+                frame = sys._current_frames().get(self._thread_id)
+                if frame is not None:
+                    self.logger.warning("pid:{} ioloop blocked for more than {:.0f}ms\n{}".format(
+                        os.getpid(), blocked * 1000, ''.join(traceback.format_stack(frame))))
@@ -0,0 +1,391 @@
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+import fcntl
+import glob
+import json
+import mmap
+import os
+import struct
+
+from src.config import MetricsConfig
+
+INF = float('inf')
+DEFAULT_BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, INF)
+# the samples of the dead processes, merged
+AGGREGATE_FILE = 'aggregate.db'
+LOCK_FILE = 'metrics.lock'
+
+
+class MmapDict:
+    """
+    A str -> float dict stored in a memory mapped file, written by a single process
+    and readable by the others without any lock.
+
+    Layout: [uint32 used bytes][4 bytes padding] followed by the entries
+    [uint32 key length][utf-8 key, padded to 8 bytes][float64 value]
+    New entries are written before the used size is updated, so readers never see a partial entry.
+    """
+    _INITIAL_SIZE = 1 << 16
+
+    def __init__(self, filename):
+        self._f = open(filename, 'a+b')
+        capacity = os.fstat(self._f.fileno()).st_size
+        if capacity == 0:
+            self._f.truncate(self._INITIAL_SIZE)
+            capacity = self._INITIAL_SIZE
+        self._capacity = capacity
+        self._m = mmap.mmap(self._f.fileno(), capacity)
+        self._used = struct.unpack_from('<i', self._m, 0)[0] or 8
+        self._positions = {key: pos for key, _, pos in _read_entries(self._m, self._used)}
+
+    def _init_value(self, key):
+        encoded = key.encode('utf-8')
+        padded = encoded + b' ' * (7 - (len(encoded) + 3) % 8)
+        entry = struct.pack('<i{}sd'.format(len(padded)), len(encoded), padded, 0.0)
+        while self._used + len(entry) > self._capacity:
+            self._capacity *= 2
+            self._m.close()
+            self._f.truncate(self._capacity)
+            self._m = mmap.mmap(self._f.fileno(), self._capacity)
+        self._m[self._used:self._used + len(entry)] = entry
+        self._used += len(entry)
+        struct.pack_into('<i', self._m, 0, self._used)
+        pos = self._positions[key] = self._used - 8
+        return pos
+
+    def __contains__(self, key):
+        return key in self._positions
+
+    def read_value(self, key):
+        pos = self._positions.get(key)
+        return struct.unpack_from('<d', self._m, pos)[0] if pos is not None else 0.0
+
+    def write_value(self, key, value):
+        pos = self._positions.get(key)
+        if pos is None:
+            pos = self._init_value(key)
+        struct.pack_into('<d', self._m, pos, value)
+
+    def inc_value(self, key, amount):
+        pos = self._positions.get(key)
+        if pos is None:
+            pos = self._init_value(key)
+        struct.pack_into('<d', self._m, pos, struct.unpack_from('<d', self._m, pos)[0] + amount)
+
+    def close(self):
+        self._m.close()
+        self._f.close()
+
+    @staticmethod
+    def read_all_values(filename):
+        """
+        :return: a list of (key, value) tuples stored in the given file
+        """
+        with open(filename, 'rb') as f:
+            data = f.read()
+        used = struct.unpack_from('<i', data, 0)[0] if len(data) >= 8 else 0
+        return [(key, value) for key, value, _ in _read_entries(data, used)]
+
+
+def _read_entries(data, used):
+    pos = 8
+    while pos < used:
+        key_len = struct.unpack_from('<i', data, pos)[0]
+        key = data[pos + 4:pos + 4 + key_len].decode('utf-8')
+        pos += 4 + key_len + (7 - (key_len + 3) % 8)
+        yield key, struct.unpack_from('<d', data, pos)[0], pos
+        pos += 8
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _format_value(value):
+    if value == INF:
+        return '+Inf'
+    return str(int(value)) if value == int(value) else repr(value)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(k, str(v).replace('\\', r'\\').replace('"', r'\"'))
+                          for k, v in labels) + '}'
+
+
+@contextmanager
+def _locked(directory):
+    """
+    An exclusive lock of the metrics directory, shared by the processes
+    """
+    with open(os.path.join(directory, LOCK_FILE), 'a') as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class Registry:
+    """
+    The metrics of the service. Each process writes its samples into its own
+    MmapDict file (metrics_<pid>.db), collect aggregates the files of every process:
+    counters and histograms are summed, gauges are aggregated according to their mode.
+
+    The file of a dead process is merged into the aggregate file then removed,
+    by the next collect or by the process reusing its pid: its counters and
+    histograms are kept, its 'livesum' gauges are dropped.
+    """
+
+    def __init__(self, directory=None):
+        self._directory = directory
+        self._metrics = {}
+        self._storage = None
+        self._pid = None
+
+    @property
+    def directory(self):
+        return self._directory or MetricsConfig.directory
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError("Duplicated metric: {}".format(metric.name))
+        self._metrics[metric.name] = metric
+
+    @property
+    def storage(self):
+        """
+        :return: the MmapDict of the current process, reopened after a fork
+        """
+        pid = os.getpid()
+        if self._pid != pid:
+            directory = self.directory
+            os.makedirs(directory, exist_ok=True)
+            filename = os.path.join(directory, 'metrics_{}.db'.format(pid))
+            with _locked(directory):
+                if os.path.exists(filename):
+                    # left by a dead process of the same pid, its values are not ours
+                    self._merge(filename)
+                self._storage = MmapDict(filename)
+            self._pid = pid
+        return self._storage
+
+    def _mode(self, name):
+        return getattr(self._metrics.get(name), 'mode', 'sum')
+
+    def _merge(self, filename):
+        """
+        Merge the samples of the file of a dead process into the aggregate file, and remove it.
+        Called under the lock of the directory.
+        """
+        aggregate = MmapDict(os.path.join(os.path.dirname(filename), AGGREGATE_FILE))
+        try:
+            for key, value in MmapDict.read_all_values(filename):
+                mode = self._mode(json.loads(key)[0])
+                if mode == 'max':
+                    aggregate.write_value(key, max(aggregate.read_value(key), value) if key in aggregate else value)
+                elif mode != 'livesum':
+                    aggregate.inc_value(key, value)
+        finally:
+            aggregate.close()
+        os.remove(filename)
+
+    def collect(self):
+        """
+        :return: a dict (metric name, sample name, labels) -> aggregated value
+        """
+        directory = self.directory
+        os.makedirs(directory, exist_ok=True)
+        samples = defaultdict(float)
+        with _locked(directory):
+            filenames = []
+            for filename in glob.glob(os.path.join(directory, 'metrics_*.db')):
+                pid = int(os.path.basename(filename)[8:-3])
+                if pid == os.getpid() or _pid_alive(pid):
+                    filenames.append(filename)
+                else:
+                    self._merge(filename)
+            aggregate = os.path.join(directory, AGGREGATE_FILE)
+            if os.path.exists(aggregate):
+                filenames.append(aggregate)
+
+            for filename in filenames:
+                for key, value in MmapDict.read_all_values(filename):
+                    name, sample, labels = json.loads(key)
+                    sample_key = (name, sample, tuple(tuple(label) for label in labels))
+                    if self._mode(name) == 'max':
+                        samples[sample_key] = max(samples.get(sample_key, value), value)
+                    else:
+                        samples[sample_key] += value
+        return samples
+
+    def exposition(self):
+        """
+        :return: the metrics in the Prometheus text exposition format
+        """
+        by_metric = defaultdict(list)
+        for (name, sample, labels), value in self.collect().items():
+            by_metric[name].append((sample, labels, value))
+
+        lines = []
+        for name in sorted(by_metric):
+            metric = self._metrics.get(name)
+            if metric is not None:
+                lines.append('# HELP {} {}'.format(name, metric.documentation))
+                lines.append('# TYPE {} {}'.format(name, metric.type))
+            samples = by_metric[name]
+            if metric is not None and metric.type == 'histogram':
+                samples = metric.cumulate(samples)
+            else:
+                samples = sorted(samples)
+            for sample, labels, value in samples:
+                lines.append('{}{} {}'.format(sample, _format_labels(labels), _format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+class _Sample:
+    """
+    A metric bound to its label values
+    """
+    __slots__ = ('_registry', '_key')
+
+    def __init__(self, registry, name, sample, labels):
+        self._registry = registry
+        self._key = json.dumps([name, sample, labels])
+
+    def inc(self, amount=1):
+        self._registry.storage.inc_value(self._key, amount)
+
+    def dec(self, amount=1):
+        self.inc(-amount)
+
+    def set(self, value):
+        self._registry.storage.write_value(self._key, value)
+
+    def get(self):
+        return self._registry.storage.read_value(self._key)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._registry = registry
+        self._children = {}
+        registry.register(self)
+
+    def labels(self, **labels):
+        """
+        :return: the metric bound to the given label values, cached
+        """
+        values = tuple(str(labels[name]) for name in self.labelnames)
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._make_child(list(zip(self.labelnames, values)))
+        return child
+
+    def _make_child(self, labels):
+        return _Sample(self._registry, self.name, self.name, labels)
+
+    def _default(self):
+        if self.labelnames:
+            raise ValueError("{} has labels, use labels()".format(self.name))
+        return self.labels()
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+
+class Gauge(_Metric):
+    """
+    mode: how the values of the processes are aggregated,
+    'livesum' sums the values of the running processes, 'sum' of all of them, 'max' keeps the highest one
+    """
+    type = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY, mode='livesum'):
+        super(Gauge, self).__init__(name, documentation, labelnames, registry)
+        self.mode = mode
+
+    def set(self, value):
+        self._default().set(value)
+
+    def inc(self, amount=1):
+        self._default().inc(amount)
+
+    def dec(self, amount=1):
+        self._default().inc(-amount)
+
+
+class _HistogramChild:
+    __slots__ = ('_buckets', '_bucket_samples', '_sum', '_count')
+
+    def __init__(self, registry, name, buckets, labels):
+        self._buckets = buckets
+        self._bucket_samples = [_Sample(registry, name, name + '_bucket', labels + [('le', _format_value(b))])
+                                for b in buckets]
+        self._sum = _Sample(registry, name, name + '_sum', labels)
+        self._count = _Sample(registry, name, name + '_count', labels)
+
+    def observe(self, value):
+        self._bucket_samples[bisect_left(self._buckets, value)].inc()
+        self._sum.inc(value)
+        self._count.inc()
+
+
+class Histogram(_Metric):
+    """
+    Each observation is counted in its own bucket only, buckets are cumulated on exposition
+    """
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), registry=REGISTRY, buckets=DEFAULT_BUCKETS):
+        super(Histogram, self).__init__(name, documentation, labelnames, registry)
+        self.buckets = tuple(sorted(buckets))
+        if self.buckets[-1] != INF:
+            self.buckets += (INF,)
+
+    def _make_child(self, labels):
+        return _HistogramChild(self._registry, self.name, self.buckets, labels)
+
+    def observe(self, value):
+        self._default().observe(value)
+
+    def cumulate(self, samples):
+        """
+        :param samples: a list of (sample name, labels, value) of this histogram
+        :return: the samples, with cumulative buckets sorted by upper bound
+        """
+        buckets = defaultdict(list)
+        res = []
+        for sample, labels, value in sorted(samples):
+            if sample.endswith('_bucket'):
+                le = dict(labels)['le']
+                other_labels = tuple(label for label in labels if label[0] != 'le')
+                buckets[other_labels].append((float(le), le, value))
+            else:
+                res.append((sample, labels, value))
+        for labels in sorted(buckets):
+            total = 0
+            for _, le, value in sorted(buckets[labels]):
+                total += value
+                res.append((self.name + '_bucket', labels + (('le', le),), total))
+        return res
@@ -0,0 +1,200 @@
+import json
+import math
+
+from src.config import MobileSchemaConfig
+from src.lib.metrics import Counter
+
+MOBILE_NORMALIZED = Counter('mobile_normalized_total', 'Mobile events through the normalization', ('result',))
+MOBILE_FIELDS_DROPPED = Counter('mobile_fields_dropped_total', 'Mobile event fields dropped', ('reason',))
+_NORMALIZED = MOBILE_NORMALIZED.labels(result='normalized')
+
+# field types of the mobile events, per API version
+SCHEMAS = {
+    'v1': {
+        'message': 'str',
+        'level': 'str',
+        'timestamp': 'str',
+        'userId': 'int',
+        'requestId': 'str',
+    },
+}
+
+
+def _to_str(value):
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, separators=(',', ':'))
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return str(value)
+
+
+def _to_int(value):
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise ValueError(value)
+        return int(value)
+    return int(value)
+
+
+def _to_float(value):
+    value = float(value)
+    if not math.isfinite(value):
+        # NaN and Infinity are not JSON, Elasticsearch rejects them
+        raise ValueError(value)
+    return value
+
+
+def _to_bool(value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        lowered = value.lower()
+        if lowered in ('true', '1'):
+            return True
+        if lowered in ('false', '0'):
+            return False
+        raise ValueError(value)
+    if isinstance(value, (int, float)):
+        return bool(value)
+    raise ValueError(value)
+
+
+# type name -> coercion function, raising ValueError or TypeError
+TYPES = {
+    'str': _to_str,
+    'int': _to_int,
+    'float': _to_float,
+    'bool': _to_bool,
+}
+
+
+def compile_schema(fields):
+    """
+    :param fields: a dict of field name -> type name
+    :return: a dict of field name -> coercion function
+    """
+    try:
+        return {name: TYPES[type_name] for name, type_name in fields.items()}
+    except KeyError as e:
+        raise ValueError("Unknown field type: {}".format(e.args[0]))
+
+
+def flatten(event, prefix='', flat=None):
+    """
+    :return: the event with its nested objects flattened, the names of their fields joined with dots
+    """
+    if flat is None:
+        flat = {}
+    for name, value in event.items():
+        if isinstance(value, dict) and value:
+            flatten(value, prefix + name + '.', flat)
+        else:
+            flat[prefix + name] = value
+    return flat
+
+
+class Normalizer:
+    """
+    Decode the mobile events once, flatten them, coerce their known fields to
+    the types of their schema version, drop the fields which cannot be
+    coerced, the non-finite numbers and the strings longer than max_field_size, and
+    encode them again as compact JSON: Logstash then receives events Elasticsearch can index
+    without mapping conflicts.
+
+    The events of an unknown version are left as they are, without being decoded. The
+    events still holding a non-finite number, e.g. in an array, are dropped.
+    """
+
+    def __init__(self, schemas, max_field_size):
+        self._schemas = {version: compile_schema(fields) for version, fields in schemas.items()}
+        self._max_field_size = max_field_size
+
+    def normalize(self, version, events):
+        """
+        :param version: the API version of the events, e.g. v1
+        :param events: a list of bytes JSON events, or JSON arrays of events
+        :return: the list of the bytes normalized events, the events themselves if their version is unknown
+        """
+        schema = self._schemas.get(version)
+        if schema is None:
+            MOBILE_NORMALIZED.labels(result='skipped').inc(len(events))
+            return events
+        normalized = [self._normalize_body(schema, body) for body in events]
+        return [body for body in normalized if body is not None]
+
+    def _normalize_body(self, schema, body):
+        """
+        :return: the bytes normalized body, the body itself if it is not a JSON object or array,
+        None if it cannot be encoded as JSON
+        """
+        try:
+            decoded = json.loads(body.decode('utf-8'))
+        except ValueError:
+            MOBILE_NORMALIZED.labels(result='invalid').inc()
+            return body
+        if isinstance(decoded, dict):
+            decoded = self._normalize_event(schema, decoded)
+        elif isinstance(decoded, list):
+            decoded = [self._normalize_event(schema, event) if isinstance(event, dict) else event
+                       for event in decoded]
+        else:
+            MOBILE_NORMALIZED.labels(result='invalid').inc()
+            return body
+        try:
+            # NaN and Infinity are not JSON, Elasticsearch rejects them
+            encoded = json.dumps(decoded, separators=(',', ':'), ensure_ascii=False, allow_nan=False)
+        except ValueError:
+            MOBILE_NORMALIZED.labels(result='dropped').inc()
+            return None
+        _NORMALIZED.inc()
+        return encoded.encode('utf-8')
+
+    def _normalize_event(self, schema, event):
+        normalized = {}
+        for name, value in flatten(event).items():
+            coerce = schema.get(name)
+            if coerce is not None and value is not None:
+                try:
+                    value = coerce(value)
+                except (ValueError, TypeError, OverflowError):
+                    MOBILE_FIELDS_DROPPED.labels(reason='type').inc()
+                    continue
+            elif isinstance(value, float) and not math.isfinite(value):
+                MOBILE_FIELDS_DROPPED.labels(reason='non_finite').inc()
+                continue
+            if isinstance(value, str) and len(value) > self._max_field_size:
+                MOBILE_FIELDS_DROPPED.labels(reason='size').inc()
+                continue
+            normalized[name] = value
+        return normalized
+
+
+def load_schemas(config=MobileSchemaConfig):
+    """
+    :return: the schemas of every version, merged with the MOBILE_SCHEMAS_FILE ones
+    """
+    schemas = {version: dict(fields) for version, fields in SCHEMAS.items()}
+    if config.schemas_file:
+        with open(config.schemas_file) as f:
+            for version, fields in json.load(f).items():
+                schemas.setdefault(version, {}).update(fields)
+    return schemas
+
+
+_normalizers = {}
+
+
+def default_normalizer(config=MobileSchemaConfig):
+    """
+    :return: the Normalizer of the mobile handlers, built once, None if the normalization is disabled
+    """
+    if not config.normalize:
+        return None
+    normalizer = _normalizers.get(config)
+    if normalizer is None:
+        normalizer = _normalizers[config] = Normalizer(load_schemas(config), config.max_field_size)
+    return normalizer
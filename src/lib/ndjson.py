@@ -0,0 +1,20 @@
+# Content-Type of the bodies holding one JSON event per line
+NDJSON_TYPES = frozenset(('application/x-ndjson', 'application/ndjson', 'application/jsonl',
+                          'application/x-jsonlines'))
+
+
+def is_ndjson(content_type):
+    """
+    :param content_type: the Content-Type header value, parameters included
+    :return: True if the body holds one JSON event per line
+    """
+    return content_type.split(';', 1)[0].strip().lower() in NDJSON_TYPES
+
+
+def split_events(body):
+    """
+    Split a NDJSON body into its events, the blank lines are skipped.
+    :param body: bytes NDJSON body
+    :return: the list of bytes events
+    """
+    return [line.rstrip(b'\r') for line in body.split(b'\n') if line.strip()]
@@ -0,0 +1,196 @@
+from datetime import datetime, timezone
+from urllib.parse import quote, urlsplit
+from xml.etree import ElementTree
+import hashlib
+import hmac
+import os
+
+from tornado import gen
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+
+# the SHA256 of an empty payload, the body of the GET requests
+EMPTY_SHA256 = hashlib.sha256(b'').hexdigest()
+S3_NAMESPACE = '{http://s3.amazonaws.com/doc/2006-03-01/}'
+
+
+class ObjectStore:
+    """
+    The storage of the objects notified by S3, e.g. the CloudTrail log files.
+    """
+
+    @gen.coroutine
+    def fetch(self, bucket, key, streaming_callback):
+        """
+        Read an object, chunk by chunk.
+        :param bucket: the bucket name
+        :param key: the object key
+        :param streaming_callback: called with each bytes chunk of the object
+        :raise: KeyError if the object does not exist
+        """
+        raise NotImplementedError()
+
+    @gen.coroutine
+    def list(self, bucket, prefix=''):
+        """
+        :return: the sorted keys of the objects of a bucket starting with prefix
+        """
+        raise NotImplementedError()
+
+
+class LocalObjectStore(ObjectStore):
+    """
+    Objects stored in a local directory, a sub-directory per bucket: a stand-in
+    for S3 in the tests, and the store of the backfills of downloaded log files.
+    """
+
+    def __init__(self, directory, chunk_size=64 * 1024):
+        self.directory = directory
+        self.chunk_size = chunk_size
+
+    def _path(self, bucket, key):
+        path = os.path.normpath(os.path.join(self.directory, bucket, key))
+        if not path.startswith(os.path.join(os.path.normpath(self.directory), bucket) + os.sep):
+            raise KeyError("{}/{}".format(bucket, key))
+        return path
+
+    @gen.coroutine
+    def fetch(self, bucket, key, streaming_callback):
+        try:
+            f = open(self._path(bucket, key), 'rb')
+        except FileNotFoundError:
+            raise KeyError("{}/{}".format(bucket, key))
+        with f:
+            while True:
+                chunk = f.read(self.chunk_size)
+                if not chunk:
+                    break
+                streaming_callback(chunk)
+                # let the other requests be served between the chunks
+                yield gen.moment
+
+    @gen.coroutine
+    def list(self, bucket, prefix=''):
+        root = os.path.join(self.directory, bucket)
+        keys = []
+        for directory, _, files in os.walk(root):
+            for name in files:
+                key = os.path.relpath(os.path.join(directory, name), root).replace(os.sep, '/')
+                if key.startswith(prefix):
+                    keys.append(key)
+        return sorted(keys)
+
+
+class S3ObjectStore(ObjectStore):
+    """
+    Objects stored in S3, read with requests signed with AWS Signature Version 4.
+    The objects are streamed to the callback as they are received.
+    """
+
+    def __init__(self, region, access_key, secret_key, session_token=None, endpoint=None, request_timeout=60,
+                 client=None):
+        """
+        :param region: the region of the buckets, e.g. eu-west-1
+        :param session_token: the token of temporary credentials, e.g. the ones of an assumed role
+        :param endpoint: the URL of an S3 compatible service, the buckets being in its path;
+            None for AWS, the buckets being in the host name
+        """
+        self.region = region
+        self.access_key = access_key
+        self.secret_key = secret_key
+        self.session_token = session_token
+        self.endpoint = endpoint.rstrip('/') if endpoint else None
+        self.request_timeout = request_timeout
+        self.client = client or AsyncHTTPClient()
+
+    def _url(self, bucket, key):
+        """
+        :return: the tuple (scheme, host, path) of an object
+        """
+        path = '/' + quote(key, safe='/~')
+        if self.endpoint is None:
+            return 'https', '{}.s3.{}.amazonaws.com'.format(bucket, self.region), path
+        endpoint = urlsplit(self.endpoint)
+        return endpoint.scheme, endpoint.netloc, endpoint.path + '/' + quote(bucket, safe='~') + path
+
+    def authorization(self, method, path, query, headers, now=None):
+        """
+        :param path: the URI encoded path
+        :param query: a dict of the query arguments
+        :param headers: the headers to sign, the host, x-amz-date and x-amz-content-sha256 ones included
+        :return: the Authorization header of the request
+        """
+        now = now or datetime.now(timezone.utc)
+        date = now.strftime('%Y%m%d')
+        scope = '{}/{}/s3/aws4_request'.format(date, self.region)
+        names = sorted(name.lower() for name in headers)
+        values = {name.lower(): ' '.join(str(value).split()) for name, value in headers.items()}
+        canonical_request = '\n'.join([
+            method,
+            path,
+            '&'.join('{}={}'.format(quote(name, safe='-_.~'), quote(value, safe='-_.~'))
+                     for name, value in sorted(query.items())),
+            ''.join('{}:{}\n'.format(name, values[name]) for name in names),
+            ';'.join(names),
+            values['x-amz-content-sha256'],
+        ])
+        string_to_sign = '\n'.join(['AWS4-HMAC-SHA256', values['x-amz-date'], scope,
+                                    hashlib.sha256(canonical_request.encode('utf-8')).hexdigest()])
+        key = ('AWS4' + self.secret_key).encode('utf-8')
+        for part in (date, self.region, 's3', 'aws4_request'):
+            key = hmac.new(key, part.encode('utf-8'), hashlib.sha256).digest()
+        signature = hmac.new(key, string_to_sign.encode('utf-8'), hashlib.sha256).hexdigest()
+        return 'AWS4-HMAC-SHA256 Credential={}/{},SignedHeaders={},Signature={}'.format(
+            self.access_key, scope, ';'.join(names), signature)
+
+    def _request(self, bucket, key, query=None, **kwargs):
+        """
+        :return: the signed HTTPRequest of a GET of the object, or of the bucket for an empty key
+        """
+        query = query or {}
+        scheme, host, path = self._url(bucket, key)
+        now = datetime.now(timezone.utc)
+        headers = {'Host': host, 'X-Amz-Date': now.strftime('%Y%m%dT%H%M%SZ'), 'X-Amz-Content-Sha256': EMPTY_SHA256}
+        if self.session_token:
+            headers['X-Amz-Security-Token'] = self.session_token
+        headers['Authorization'] = self.authorization('GET', path, query, headers, now)
+        url = '{}://{}{}'.format(scheme, host, path)
+        if query:
+            url += '?' + '&'.join('{}={}'.format(quote(name, safe='-_.~'), quote(value, safe='-_.~'))
+                                  for name, value in sorted(query.items()))
+        return HTTPRequest(url, headers=headers, decompress_response=False, follow_redirects=False,
+                           request_timeout=self.request_timeout, **kwargs)
+
+    @gen.coroutine
+    def fetch(self, bucket, key, streaming_callback):
+        status = []
+
+        def on_header(line):
+            if line.startswith('HTTP/'):
+                status[:] = [int(line.split(' ', 2)[1])]
+
+        def on_chunk(chunk):
+            # the body of an error is not the object
+            if status == [200]:
+                streaming_callback(chunk)
+
+        response = yield self.client.fetch(self._request(bucket, key, header_callback=on_header,
+                                                         streaming_callback=on_chunk), raise_error=False)
+        if response.code == 404:
+            raise KeyError("{}/{}".format(bucket, key))
+        if response.code != 200:
+            raise IOError("S3 GET {}/{} answered {}".format(bucket, key, response.code))
+
+    @gen.coroutine
+    def list(self, bucket, prefix=''):
+        keys = []
+        query = {'list-type': '2', 'prefix': prefix}
+        while True:
+            response = yield self.client.fetch(self._request(bucket, '', query), raise_error=False)
+            if response.code != 200:
+                raise IOError("S3 list of {}/{} answered {}".format(bucket, prefix, response.code))
+            result = ElementTree.fromstring(response.body)
+            keys += [element.text for element in result.iter(S3_NAMESPACE + 'Key')]
+            token = result.findtext(S3_NAMESPACE + 'NextContinuationToken')
+            if result.findtext(S3_NAMESPACE + 'IsTruncated') != 'true' or not token:
+                return sorted(keys)
+            query = dict(query, **{'continuation-token': token})
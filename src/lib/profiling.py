@@ -0,0 +1,162 @@
+from collections import Counter, defaultdict
+from linecache import getline
+from os import sep
+import signal
+import tracemalloc
+
+KB = 2**10
+HANDLERS_DIR = '{0}handlers{0}'.format(sep)
+
+SNAPSHOT_FILTERS = (
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<unknown>"),
+    tracemalloc.Filter(False, tracemalloc.__file__),
+)
+
+
+def short_filename(filename):
+    """
+    replace "/path/to/module/file.py" with "module/file.py"
+    """
+    return sep.join(filename.split(sep)[-2:])
+
+
+def stat_to_dict(stat):
+    """
+    :param stat: a tracemalloc Statistic or StatisticDiff
+    :return: a json serializable description of the statistic
+    """
+    # the most recent frame, the allocation site
+    frame = stat.traceback[-1]
+    res = {
+        'file': short_filename(frame.filename),
+        'line': frame.lineno,
+        'size_kb': round(stat.size / KB, 1),
+        'count': stat.count,
+        'code': getline(frame.filename, frame.lineno).strip(),
+    }
+    if isinstance(stat, tracemalloc.StatisticDiff):
+        res['size_diff_kb'] = round(stat.size_diff / KB, 1)
+        res['count_diff'] = stat.count_diff
+    return res
+
+
+class MemoryProfiler:
+    """
+    tracemalloc based memory profiler.
+    Each call to diff compares a new snapshot to the previous one, to find what grows over time.
+    """
+
+    def __init__(self):
+        self._previous = None
+
+    @property
+    def tracing(self):
+        return tracemalloc.is_tracing()
+
+    def start(self, nframes=25):
+        """
+        :param nframes: number of frames stored per allocation, enough to reach the handler frames
+        """
+        tracemalloc.start(nframes)
+        self._previous = None
+
+    def stop(self):
+        tracemalloc.stop()
+        self._previous = None
+
+    def snapshot(self):
+        return tracemalloc.take_snapshot().filter_traces(SNAPSHOT_FILTERS)
+
+    def top(self, key_type='lineno', limit=10):
+        """
+        :return: the top allocators, the size of the others and the total allocated size
+        """
+        stats = self.snapshot().statistics(key_type)
+        other = stats[limit:]
+        return {
+            'top': [stat_to_dict(stat) for stat in stats[:limit]],
+            'other_count': len(other),
+            'other_kb': round(sum(stat.size for stat in other) / KB, 1),
+            'total_kb': round(sum(stat.size for stat in stats) / KB, 1),
+        }
+
+    def diff(self, key_type='lineno', limit=10):
+        """
+        :return: the allocators that grew the most since the previous call
+        """
+        snapshot = self.snapshot()
+        previous, self._previous = self._previous, snapshot
+        if previous is None:
+            return []
+        stats = snapshot.compare_to(previous, key_type)
+        return [stat_to_dict(stat) for stat in stats[:limit]]
+
+    def top_by_route(self, limit=5):
+        """
+        Group the allocations by the request handler in their traceback,
+        e.g. allocations made while handling a mobile request are grouped under "mobile".
+        :return: a dict route -> total size and top allocation lines
+        """
+        sizes = Counter()
+        lines = defaultdict(Counter)
+        for trace in self.snapshot().traces:
+            route = None
+            # the tracebacks are ordered from the oldest frame: the handler is the most recent one
+            for frame in reversed(trace.traceback):
+                if HANDLERS_DIR in frame.filename:
+                    route = frame.filename.rsplit(sep, 1)[-1][:-3]
+                    break
+            if route is None:
+                continue
+            sizes[route] += trace.size
+            frame = trace.traceback[-1]
+            lines[route][(frame.filename, frame.lineno)] += trace.size
+
+        return {
+            route: {
+                'size_kb': round(size / KB, 1),
+                'top': [{'file': short_filename(filename), 'line': lineno, 'size_kb': round(line_size / KB, 1),
+                         'code': getline(filename, lineno).strip()}
+                        for (filename, lineno), line_size in lines[route].most_common(limit)],
+            }
+            for route, size in sizes.most_common()
+        }
+
+
+class CPUSampler:
+    """
+    Statistical CPU profiler: the stack of the main thread is sampled on SIGPROF,
+    every `interval` seconds of CPU time. The samples are dumped as collapsed stacks
+    (one "frame;frame;frame count" line per stack), the flamegraph input format.
+    """
+
+    def __init__(self):
+        self.stacks = Counter()
+        self.running = False
+
+    def start(self, interval=0.005):
+        self.stacks = Counter()
+        signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, interval, interval)
+        self.running = True
+
+    def stop(self):
+        signal.setitimer(signal.ITIMER_PROF, 0, 0)
+        signal.signal(signal.SIGPROF, signal.SIG_IGN)
+        self.running = False
+
+    @property
+    def samples(self):
+        return sum(self.stacks.values())
+
+    def _sample(self, signum, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append('{}:{}'.format(short_filename(code.co_filename), code.co_name))
+            frame = frame.f_back
+        self.stacks[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return '\n'.join('{} {}'.format(stack, count) for stack, count in self.stacks.most_common())
@@ -0,0 +1,149 @@
+import json
+import zlib
+
+from src.config import BatchConfig, RoutesConfig
+
+# routing keys cached per route, enough for every Heroku app of the drains
+MAX_CACHED_KEYS = 10000
+
+DEFAULTS = {
+    'queues': (),
+    'compression': None,
+    'batch': None,
+    'max_body_size': None,
+    'shards': 1,
+    'shard_by': None,
+    'sink': 'amqp',
+    'archive': False,
+}
+
+SINKS = ('amqp', 'elasticsearch', 'appendlog')
+
+
+class Route:
+    """
+    A log source of the registry, compiled for the request path:
+    the routing key of an URL path is computed once, then looked up in a dict.
+
+    A sharded route publishes to `shards` routing keys, suffixed with the shard
+    number, each one bound to its own queue. The shard is the crc32 hash of the
+    `shard_by` request header (the drain or request id), so that the messages
+    of a source keep their order within a shard; requests without this header
+    are spread round-robin.
+    """
+    __slots__ = ('name', 'pattern', 'handler', 'routing_key_template', 'prefix', 'queues',
+                 'compression', 'batch', 'max_body_size', 'shards', 'shard_by', 'sink', 'archive',
+                 '_keys', '_next_shard')
+
+    def __init__(self, name, pattern, handler, routing_key, queues=(), compression=None, batch=None,
+                 max_body_size=None, shards=1, shard_by=None, sink='amqp', archive=False):
+        if shards < 1:
+            raise ValueError("Route {} needs at least one shard".format(name))
+        if sink not in SINKS:
+            raise ValueError("Route {} has an unknown sink: {}".format(name, sink))
+        self.name = name
+        self.pattern = pattern
+        self.handler = handler
+        self.routing_key_template = routing_key
+        # the constant head of the routing keys, e.g. 'mobile' for 'mobile.{path}'
+        self.prefix = routing_key.split('{', 1)[0].rstrip('.')
+        self.shards = shards
+        self.shard_by = shard_by
+        if shards == 1:
+            self.queues = tuple((queue['name'], queue['key']) for queue in queues)
+        else:
+            self.queues = tuple(('{}_{}'.format(queue['name'], shard), '{}.{}'.format(queue['key'], shard))
+                                for queue in queues for shard in range(shards))
+        self.compression = compression
+        self.batch = batch
+        self.max_body_size = max_body_size
+        self.sink = sink
+        self.archive = archive
+        self._keys = {}
+        self._next_shard = 0
+
+    def routing_key(self, path, shard=0):
+        """
+        :param path: the request URL path, e.g. /heroku/v1/integration/myapp
+        :param shard: the shard number, for a sharded route
+        :return: the routing key of the path, e.g. heroku.v1.integration.myapp
+        """
+        try:
+            return self._keys[path][shard]
+        except KeyError:
+            segments = path.strip('/').split('/')
+            key = self.routing_key_template.format(*segments, path='.'.join(segments[1:]))
+            if self.shards == 1:
+                keys = (key,)
+            else:
+                keys = tuple('{}.{}'.format(key, n) for n in range(self.shards))
+            if len(self._keys) < MAX_CACHED_KEYS:
+                self._keys[path] = keys
+            return keys[shard]
+
+    def shard(self, headers):
+        """
+        :param headers: the request headers
+        :return: the shard number of the request
+        """
+        if self.shards == 1:
+            return 0
+        shard_id = headers.get(self.shard_by) if self.shard_by else None
+        if shard_id is None:
+            self._next_shard = (self._next_shard + 1) % self.shards
+            return self._next_shard
+        return zlib.crc32(shard_id.encode('utf-8')) % self.shards
+
+    def request_routing_key(self, request):
+        """
+        :param request: the tornado HTTPServerRequest
+        :return: the routing key of the request messages
+        """
+        return self.routing_key(request.path, self.shard(request.headers))
+
+    @property
+    def batched(self):
+        """
+        :return: True if the messages of the route go through the micro-batching publisher
+        """
+        return self.batch if self.batch is not None else BatchConfig.batch_activated
+
+
+_default_routes = {}
+
+
+def default_route(name):
+    """
+    :return: the Route of the registry named name, compiled once
+    """
+    route = _default_routes.get(name)
+    if route is None:
+        route = _default_routes[name] = Route(name, **dict(DEFAULTS, **RoutesConfig.routes[name]))
+    return route
+
+
+def load_routes(config=RoutesConfig):
+    """
+    :return: the route definitions of the registry, merged with the ROUTES_FILE ones
+    """
+    routes = dict(config.routes)
+    if config.routes_file:
+        with open(config.routes_file) as f:
+            routes.update(json.load(f))
+    return routes
+
+
+def compile_routes(config=RoutesConfig):
+    """
+    :return: the list of the enabled Routes, in the order they are enabled
+    """
+    definitions = load_routes(config)
+    routes = []
+    for name in config.enabled:
+        if name not in definitions:
+            raise ValueError("Unknown route: {}".format(name))
+        route = Route(name, **dict(DEFAULTS, **definitions[name]))
+        if route.compression and not route.prefix:
+            raise ValueError("Route {} is compressed, its routing key needs a constant prefix".format(name))
+        routes.append(route)
+    return routes
@@ -0,0 +1,51 @@
+from tornado.http1connection import HTTP1ConnectionParameters
+from tornado.httpserver import HTTPServer
+
+from src.config import HTTPServerConfig
+
+
+def server_settings(config=HTTPServerConfig):
+    """
+    :param config: the HTTP server configuration
+    :return: the keyword arguments of tornado.httpserver.HTTPServer
+    """
+    return dict(
+        no_keep_alive=config.no_keep_alive,
+        idle_connection_timeout=config.idle_connection_timeout,
+        body_timeout=config.body_timeout,
+        max_header_size=config.max_header_size,
+        max_body_size=config.max_body_size,
+        max_buffer_size=config.max_buffer_size,
+        chunk_size=config.chunk_size,
+        decompress_request=config.decompress_request,
+    )
+
+
+def make_server(application, config=HTTPServerConfig):
+    """
+    Create the HTTP server of the application
+    :param application: the tornado application
+    :param config: the HTTP server configuration
+    :return: a tornado HTTPServer
+    """
+    return HTTPServer(application, **server_settings(config))
+
+
+def tune_server(server, config=HTTPServerConfig):
+    """
+    Apply the configuration to an HTTPServer created by someone else (e.g. gunicorn),
+    the same way HTTPServer.initialize does it.
+    :param server: a tornado HTTPServer
+    :param config: the HTTP server configuration
+    """
+    settings = server_settings(config)
+    server.max_buffer_size = settings['max_buffer_size']
+    server.read_chunk_size = settings['chunk_size']
+    server.conn_params = HTTP1ConnectionParameters(
+        decompress=settings['decompress_request'],
+        chunk_size=settings['chunk_size'],
+        max_header_size=settings['max_header_size'],
+        header_timeout=settings['idle_connection_timeout'],
+        max_body_size=settings['max_body_size'],
+        body_timeout=settings['body_timeout'],
+        no_keep_alive=settings['no_keep_alive'])
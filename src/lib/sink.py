@@ -0,0 +1,54 @@
+class Sink:
+    """
+    The output of the log messages. Handlers publish every message to the
+    sink of their route: the AMQPConnection (possibly through the
+    BatchPublisher), the ElasticsearchSink or the AppendLogSink.
+    """
+
+    @property
+    def started(self):
+        """
+        :return: a Future resolved to True once the sink is ready, False if it failed to start
+        """
+        raise NotImplementedError()
+
+    @property
+    def is_open(self):
+        """
+        :return: True if messages can be published
+        """
+        raise NotImplementedError()
+
+    def publish(self, routing_key, msg, content_encoding=None, headers=None):
+        """
+        :param routing_key: the message routing key
+        :param msg: str or bytes message body
+        :param content_encoding: the encoding of an already compressed body
+        :param headers: a dict of message headers, e.g. the tracing ones
+        :return: a Future resolved to True once the message is stored, False otherwise
+        """
+        raise NotImplementedError()
+
+
+class TeeSink(Sink):
+    """
+    Publish every message to a primary sink, and a copy to a secondary one,
+    e.g. the AppendLogSink archiving what is published to AMQP.
+    The primary sink gives the state and the confirmations.
+    """
+
+    def __init__(self, primary, secondary):
+        self.primary = primary
+        self.secondary = secondary
+
+    @property
+    def started(self):
+        return self.primary.started
+
+    @property
+    def is_open(self):
+        return self.primary.is_open
+
+    def publish(self, routing_key, msg, content_encoding=None, headers=None):
+        self.secondary.publish(routing_key, msg, content_encoding, headers)
+        return self.primary.publish(routing_key, msg, content_encoding, headers)
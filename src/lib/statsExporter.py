@@ -0,0 +1,85 @@
+import fcntl
+import logging
+import os
+
+from statsd import StatsClient
+from tornado.ioloop import PeriodicCallback
+
+from src.config import MonitoringConfig
+from src.lib.Statsd import STATS, STATS_GAUGES
+from src.lib.metrics import REGISTRY
+
+
+class StatsdExporter:
+    """
+    Send the stats of the instance to statsd: every worker runs the exporter,
+    but only the one holding the lock file reads the shared memory metrics of
+    all the workers, and sends the increments of the counters since its
+    previous export, and the gauges, in a single pipeline.
+    When this worker exits, another one takes the lock over; its first export
+    only records the current values.
+    """
+
+    def __init__(self, registry=REGISTRY, config=MonitoringConfig, client=None):
+        self._registry = registry
+        self._config = config
+        self._client = client
+        self._callback = PeriodicCallback(self.export, config.statsd_export_interval_ms)
+        self._lock_fd = None
+        self._last = None
+        self.logger = logging.getLogger("tornado.application")
+
+    def start(self):
+        self._callback.start()
+
+    def stop(self):
+        self._callback.stop()
+
+    @property
+    def leader(self):
+        """
+        :return: True if this worker exports the stats of the instance
+        """
+        if self._lock_fd is None:
+            os.makedirs(self._registry.directory, exist_ok=True)
+            fd = os.open(os.path.join(self._registry.directory, 'statsd_exporter.lock'), os.O_RDWR | os.O_CREAT)
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                os.close(fd)
+                return False
+            self._lock_fd = fd
+            self.logger.info("pid:{} exports the stats to statsd".format(os.getpid()))
+        return True
+
+    def export(self):
+        """
+        :return: the number of stats sent
+        """
+        if not self.leader:
+            return 0
+        counters = {}
+        gauges = {}
+        for (name, _, labels), value in self._registry.collect().items():
+            if name == STATS.name:
+                counters[dict(labels)['stat']] = value
+            elif name == STATS_GAUGES.name:
+                gauges[dict(labels)['stat']] = value
+        last, self._last = self._last, counters
+        if last is None:
+            return 0
+
+        if self._client is None:
+            self._client = StatsClient(self._config.metrics_host, self._config.metrics_port,
+                                       prefix=self._config.metrics_prefix)
+        sent = 0
+        with self._client.pipeline() as pipe:
+            for stat, value in counters.items():
+                count = int(value - last.get(stat, 0))
+                if count:
+                    pipe.incr(stat, count)
+                    sent += 1
+            for stat, value in gauges.items():
+                pipe.gauge(stat, value)
+                sent += 1
+        return sent
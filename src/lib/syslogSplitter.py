@@ -1,41 +1,157 @@
 import re
 from src.config import TruncateConfig
 from src.lib.Statsd import StatsClientSingleton
+from src.lib.metrics import Counter
 
 patternStackTrace = re.compile(TruncateConfig.stack_pattern)
 patternToken = re.compile(TruncateConfig.token_pattern)
 
+# the head of a frame: its octet count then the syslog PRI, e.g. b'83 <40>', optionally preceded by a line break
+patternFrame = re.compile(rb'[\r\n ]*([0-9]{1,9}) <[0-9]{1,3}>')
+# the next frame head in a malformed payload, not preceded by a digit
+patternResync = re.compile(rb'(?<![0-9])[0-9]{1,9} <[0-9]{1,3}>')
+
+# the kinds of frames, as SPLIT_FRAMES results
+VALID = 'valid'
+TRUNCATED = 'truncated'
+QUARANTINED = 'quarantined'
+
+SPLIT_FRAMES = Counter('heroku_split_frames_total', 'Heroku drain frames split', ('result',))
+MSG_COUNT_MISMATCHES = Counter('heroku_msg_count_mismatches_total',
+                               'Heroku drain payloads whose frame count differs from Logplex-Msg-Count')
+
+
+class SplitResult:
+    """
+    The frames of a drain payload
+    * lines: the decoded messages of the valid frames
+    * quarantined: the malformed parts of the payload, as bytes
+    * frames: the number of frames found, valid or not
+    * msg_count_mismatch: True if the frames found differ from the Logplex-Msg-Count header
+    """
+    __slots__ = ('lines', 'quarantined', 'frames', 'msg_count_mismatch')
+
+    def __init__(self, lines, quarantined, frames, msg_count_mismatch):
+        self.lines = lines
+        self.quarantined = quarantined
+        self.frames = frames
+        self.msg_count_mismatch = msg_count_mismatch
+
 
 def split(bytes, config):
     """ Split an heroku syslog encoded payload using the octet counting method as described here
         https://tools.ietf.org/html/rfc6587#section-3.4.1
+        The malformed parts of the payload are skipped, see split_frames.
     """
+    return split_frames(bytes, config).lines
+
 
+def split_frames(data, config, msg_count=None):
+    """
+    Split an heroku syslog encoded payload in a single pass, checking each frame boundary:
+    a frame is valid when its octet count is followed by a PRI, and ends at the end of the
+    payload or at the head of the next frame. The splitter resynchronizes on the next
+    frame head after a malformed frame, the skipped bytes are quarantined.
+    :param data: the request body
+    :param msg_count: the Logplex-Msg-Count header, None if the request has none
+    :return: a SplitResult
+    """
     lines = []
-    while len(bytes) > 0:
-        # find first space character
-        i = 0
-        while bytes[i] != 32:  # 32 is white space in unicode
-            i += 1
-        msg_len = int(bytes[0:i].decode('utf-8'))
-        msg = bytes[i + 1:i + msg_len + 1]
-
-        # remove \n at the end of the line if found
-        eol = msg[len(msg)-1]
-        if eol == 10 or eol == 13:  # \n or \r in unicode
-            msg = msg[:-1]
-
-        decoded_msg = msg.decode('utf-8', 'replace')
-        if config.truncate_activated:
-            # replace token by __TOKEN_REPLACED__
-            decoded_msg = patternToken.sub(lambda x: '{}__TOKEN_REPLACED__{}'.format(x.group(1), x.group(3)), decoded_msg)
-
-            # TRUNCATE Big logs except stack traces
-            if not patternStackTrace.search(decoded_msg) and len(decoded_msg) > config.truncate_max_msg_length:
-                decoded_msg = '{} __TRUNCATED__ {}'.format(decoded_msg[:config.truncate_max_msg_length//2], decoded_msg[-config.truncate_max_msg_length//2:])
-                StatsClientSingleton().incr('truncate', count=1)
-
-        lines.append(decoded_msg)
-
-        bytes = bytes[i + 1 + msg_len:]
-    return lines
+    quarantined = []
+    truncated = 0
+    for kind, start, end in iter_frames(data):
+        if kind == QUARANTINED:
+            quarantined.append(data[start:end])
+            continue
+        lines.append(decode(data[start:end], config))
+        if kind == TRUNCATED:
+            truncated += 1
+
+    frames = len(lines) + len(quarantined)
+    if truncated:
+        SPLIT_FRAMES.labels(result=TRUNCATED).inc(truncated)
+    SPLIT_FRAMES.labels(result=VALID).inc(len(lines) - truncated)
+    if quarantined:
+        SPLIT_FRAMES.labels(result=QUARANTINED).inc(len(quarantined))
+        StatsClientSingleton().incr('split.quarantined', count=len(quarantined))
+    msg_count_mismatch = msg_count is not None and str(frames) != msg_count.strip()
+    if msg_count_mismatch:
+        MSG_COUNT_MISMATCHES.inc()
+    return SplitResult(lines, quarantined, frames, msg_count_mismatch)
+
+
+def iter_frames(data, position=0):
+    """
+    Find the frames of an heroku syslog encoded payload, see split_frames, from a frame head
+    :param data: the payload, bytes or a mmap
+    :param position: where to start, the payload start or the end of a frame
+    :return: a generator of (kind, start, end): the message of a VALID or TRUNCATED frame, the
+    skipped bytes when QUARANTINED. The end is where the next frame is looked for.
+    """
+    length = len(data)
+    match = patternFrame.match(data, position)
+    while position < length:
+        if match is None:
+            # no frame head: quarantine up to the next one
+            resync = patternResync.search(data, position + 1)
+            stop = resync.start() if resync is not None else length
+            if _significant(data, position, stop):
+                yield QUARANTINED, position, stop
+            position = stop
+            match = patternFrame.match(data, position) if resync is not None else None
+            continue
+
+        start = match.end(1) + 1
+        end = start + int(match.group(1))
+        if end == length:
+            yield VALID, start, end
+            return
+        next_match = patternFrame.match(data, end) if end < length else None
+        if next_match is not None:
+            yield VALID, start, end
+            position, match = end, next_match
+            continue
+
+        # the frame does not end on a frame head: look for the next one from its message
+        resync = patternResync.search(data, start)
+        if resync is not None and resync.start() < end:
+            # wrong octet count, the frame overlaps the next one
+            if _significant(data, position, resync.start()):
+                yield QUARANTINED, position, resync.start()
+            position, match = resync.start(), patternFrame.match(data, resync.start())
+            continue
+        if end > length:
+            # last frame shorter than its octet count, kept as is
+            yield TRUNCATED, start, length
+            return
+        yield VALID, start, end
+        stop = resync.start() if resync is not None else length
+        if _significant(data, end, stop):
+            yield QUARANTINED, end, stop
+        position = stop
+        match = patternFrame.match(data, position) if resync is not None else None
+
+
+def _significant(data, start, stop):
+    return bool(data[start:stop].strip(b'\r\n '))
+
+
+def decode(msg, config):
+    """
+    Decode the message of a frame, the tokens replaced and the big logs truncated per config
+    """
+    # remove \n at the end of the line if found
+    if msg and msg[-1] in (10, 13):  # \n or \r in unicode
+        msg = msg[:-1]
+
+    decoded_msg = msg.decode('utf-8', 'replace')
+    if config.truncate_activated:
+        # replace token by __TOKEN_REPLACED__
+        decoded_msg = patternToken.sub(lambda x: '{}__TOKEN_REPLACED__{}'.format(x.group(1), x.group(3)), decoded_msg)
+
+        # TRUNCATE Big logs except stack traces
+        if not patternStackTrace.search(decoded_msg) and len(decoded_msg) > config.truncate_max_msg_length:
+            max_length = config.truncate_max_msg_length
+            decoded_msg = '{} __TRUNCATED__ {}'.format(decoded_msg[:max_length // 2], decoded_msg[-max_length // 2:])
+            StatsClientSingleton().incr('truncate', count=1)
+    return decoded_msg
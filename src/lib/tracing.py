@@ -0,0 +1,148 @@
+import json
+import logging
+import os
+import random
+import time
+import uuid
+from time import perf_counter
+
+from src.config import TracingConfig
+from src.lib.metrics import Counter
+
+TRACES = Counter('traces_emitted_total', 'Request traces written to the collector', ('reason',))
+
+
+class Collector:
+    """
+    Append the traces to a JSON lines file, shared by the workers.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self.logger = logging.getLogger("tornado.application")
+
+    def emit(self, trace):
+        """
+        :param trace: a dict
+        """
+        try:
+            if self._file is None:
+                self._file = open(self.path, 'a', buffering=1)
+            # a single write per line, appended whole by the other workers
+            self._file.write(json.dumps(trace, default=str) + '\n')
+        except OSError as e:
+            self.logger.warning("pid:{} cannot write the trace: {}".format(os.getpid(), e))
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+_collectors = {}
+
+
+def default_collector(config=TracingConfig):
+    """
+    :return: the Collector of the worker, created once
+    """
+    collector = _collectors.get(config.collector_file)
+    if collector is None:
+        collector = _collectors[config.collector_file] = Collector(config.collector_file)
+    return collector
+
+
+class Trace:
+    """
+    The tracing context of a request: its correlation ids, sent with each of
+    its AMQP messages as headers, and the duration of its stages (split,
+    publish, confirm) in milliseconds.
+
+    Every request is timed, which only costs a few clock reads; the trace is
+    written to the collector once the messages are confirmed, for a sample of
+    the requests and for the slow ones.
+    """
+    __slots__ = ('request_id', 'frame_id', 'drain_token', 'received_at', 'route', 'headers', 'spans', 'messages',
+                 'status', 'sampled', '_start', '_published', '_confirmed', '_finished', '_config', '_collector')
+
+    def __init__(self, request, route, config=TracingConfig, collector=None):
+        """
+        :param request: the tornado HTTPServerRequest
+        :param route: the route name
+        """
+        request_headers = request.headers
+        self.request_id = request_headers.get('X-Request-ID') or uuid.uuid4().hex
+        self.frame_id = request_headers.get('Logplex-Frame-Id')
+        self.drain_token = request_headers.get('Logplex-Drain-Token')
+        self.received_at = time.time()
+        self.route = route
+        self.headers = {'x-request-id': self.request_id, 'x-received-at': int(self.received_at * 1000)}
+        if self.frame_id is not None:
+            self.headers['x-logplex-frame-id'] = self.frame_id
+        if self.drain_token is not None:
+            self.headers['x-logplex-drain-token'] = self.drain_token
+        self.spans = {}
+        self.messages = 0
+        self.status = None
+        self.sampled = random.random() < config.sample_rate
+        self._start = perf_counter()
+        self._published = None
+        self._confirmed = False
+        self._finished = False
+        self._config = config
+        self._collector = collector
+
+    def span(self, name, start):
+        """
+        Record the duration of a stage.
+        :param name: the stage name, e.g. split
+        :param start: the perf_counter() value at the start of the stage
+        """
+        self.spans[name] = (perf_counter() - start) * 1000
+
+    def published(self, confirmations):
+        """
+        Record the publication of the messages of the request, the trace is
+        complete when the last one is confirmed.
+        :param confirmations: the list of the Futures of the published messages
+        """
+        self.messages += len(confirmations)
+        if not confirmations:
+            return
+        self._published = perf_counter()
+        self._confirmed = False
+        confirmations[-1].add_done_callback(self._on_confirmed)
+
+    def _on_confirmed(self, confirmation):
+        self.spans['confirm'] = (perf_counter() - self._published) * 1000
+        self._confirmed = True
+        if self._finished:
+            self._emit()
+
+    def finish(self, status):
+        """
+        Record the end of the request handling
+        :param status: the HTTP status of the response
+        """
+        self.status = status
+        self.spans['request'] = (perf_counter() - self._start) * 1000
+        self._finished = True
+        if self._published is None or self._confirmed:
+            self._emit()
+
+    def _emit(self):
+        total = (perf_counter() - self._start) * 1000
+        if self.sampled:
+            reason = 'sampled'
+        elif self._config.slow_threshold_ms and total >= self._config.slow_threshold_ms:
+            reason = 'slow'
+        else:
+            return
+        TRACES.labels(reason=reason).inc()
+        (self._collector or default_collector(self._config)).emit({
+            'request_id': self.request_id, 'route': self.route, 'frame_id': self.frame_id,
+            'drain_token': self.drain_token, 'received_at': self.received_at, 'status': self.status,
+            'messages': self.messages, 'spans_ms': self.spans, 'total_ms': total, 'reason': reason,
+            'pid': os.getpid(),
+        })
@@ -0,0 +1,9 @@
+import atexit
+import os
+import shutil
+import tempfile
+
+if 'METRICS_DIRECTORY' not in os.environ:
+    # the metrics of the tests are written to their own directory, not to the service one
+    os.environ['METRICS_DIRECTORY'] = tempfile.mkdtemp(prefix='heroku2elk-metrics-tests-')
+    atexit.register(shutil.rmtree, os.environ['METRICS_DIRECTORY'], True)
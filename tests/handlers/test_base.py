@@ -0,0 +1,96 @@
+import tornado
+from tornado.concurrent import Future
+from tornado.testing import AsyncHTTPTestCase, ExpectLog
+from unittest.mock import Mock, patch
+
+from src.handlers.base import BaseHandler
+from src.handlers.metrics import MetricsHandler
+
+
+class EchoHandler(BaseHandler):
+    route = 'echo'
+
+    def initialize(self, amqp_con, routing):
+        self.amqp_con = amqp_con
+        self.routing = routing
+
+    def post(self):
+        self.amqp_con.publish('echo', self.request.body)
+
+
+class TestBaseHandler(AsyncHTTPTestCase):
+    def get_app(self):
+        self.amqp_con = Mock(is_open=True, started=Future())
+        self.routing = Mock(max_body_size=None)
+        return tornado.web.Application([
+            (r"/echo", EchoHandler, dict(amqp_con=self.amqp_con, routing=self.routing)),
+            (r"/metrics", MetricsHandler),
+        ])
+
+    def samples(self):
+        """
+        :return: the exposed samples of the echo route, as a dict
+        """
+        body = self.fetch('/metrics').body.decode('utf-8')
+        return dict(line.rsplit(' ', 1) for line in body.splitlines()
+                    if 'route="echo"' in line and not line.startswith('#'))
+
+    def test_connected(self):
+        response = self.fetch('/echo', method='POST', body='log')
+        self.assertEqual(response.code, 200)
+        self.amqp_con.publish.assert_called_once_with('echo', b'log')
+
+    def test_metrics(self):
+        before = self.samples()
+        response = self.fetch('/echo', method='POST', body='log')
+        self.assertEqual(response.code, 200)
+        after = self.samples()
+
+        def delta(sample):
+            return float(after[sample]) - float(before.get(sample, 0))
+        self.assertEqual(float(after['http_requests_in_flight{route="echo"}']), 0)
+        self.assertEqual(delta('http_requests_total{route="echo",code="200"}'), 1)
+        self.assertEqual(delta('http_request_duration_seconds_count{route="echo"}'), 1)
+
+    def test_wait_for_connection(self):
+        self.amqp_con.is_open = False
+
+        def connected():
+            self.amqp_con.is_open = True
+            self.amqp_con.started.set_result(True)
+        self.io_loop.call_later(0.05, connected)
+
+        response = self.fetch('/echo', method='POST', body='log')
+        self.assertEqual(response.code, 200)
+        self.amqp_con.publish.assert_called_once_with('echo', b'log')
+
+    def test_connection_failure(self):
+        self.amqp_con.is_open = False
+        self.amqp_con.started.set_result(False)
+        response = self.fetch('/echo', method='POST', body='log')
+        self.assertEqual(response.code, 503)
+        self.amqp_con.publish.assert_not_called()
+
+    def test_channel_closed_after_startup(self):
+        self.amqp_con.started.set_result(True)
+        self.amqp_con.is_open = False
+        self.amqp_con.publish.side_effect = AttributeError
+        with ExpectLog('tornado.application', 'Uncaught exception'):
+            response = self.fetch('/echo', method='POST', body='log')
+        # not a 503: the request reaches the handler, whose publish fails
+        self.assertEqual(response.code, 500)
+        self.amqp_con.publish.assert_called_once_with('echo', b'log')
+
+    @patch('src.handlers.base.AmqpConfig')
+    def test_connection_timeout(self, config):
+        config.connect_timeout = 0.05
+        self.amqp_con.is_open = False
+        response = self.fetch('/echo', method='POST', body='log')
+        self.assertEqual(response.code, 503)
+        self.assertEqual(BaseHandler.in_flight, 0)
+
+    def test_max_body_size(self):
+        self.routing.max_body_size = 2
+        response = self.fetch('/echo', method='POST', body='log')
+        self.assertEqual(response.code, 413)
+        self.amqp_con.publish.assert_not_called()
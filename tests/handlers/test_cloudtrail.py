@@ -1,7 +1,14 @@
+import gzip
+import json
 import unittest
-from unittest.mock import Mock, patch
+from unittest.mock import ANY, Mock, patch
+
+import tornado.web
+from tornado.concurrent import Future
+from tornado.testing import AsyncHTTPTestCase
 
 from src.handlers.cloudtrail import CloudTrailHandler
+from src.lib.cloudtrailFilter import RecordFilter, Rule
 
 
 class TestCloudTrail(unittest.TestCase):
@@ -30,3 +37,55 @@ class TestCloudTrail(unittest.TestCase):
 
         handler.get_status()
         self.assertEqual(handler.get_status(), 500)
+
+    def test_cloudtrail_filter(self):
+        """
+        Dropped records are not published, the others are projected
+        :return:
+        """
+        amqp_con = Mock()
+        application = Mock()
+        application.ui_methods = Mock()
+        application.ui_methods.items = Mock(return_value=[])
+        request = Mock()
+        request.uri = request.path = "/cloudtrail/v1/integration"
+        request.headers = {}
+        request.body = json.dumps({'Records': [
+            {'eventName': 'DescribeInstances', 'readOnly': True},
+            {'eventName': 'RunInstances', 'readOnly': False, 'responseElements': {'instances': []}},
+        ]}).encode()
+        record_filter = RecordFilter([Rule('read', read_only=True, drop=True)], deny_fields=['responseElements'])
+        handler = CloudTrailHandler(application, request, amqp_con=amqp_con, record_filter=record_filter)
+
+        handler.post()
+
+        amqp_con.publish.assert_called_once_with('cloudtrail.v1.integration',
+                                                 json.dumps({'eventName': 'RunInstances', 'readOnly': False}),
+                                                 headers=ANY)
+
+
+class TestCloudTrailDecompressRequest(AsyncHTTPTestCase):
+    def get_app(self):
+        self.amqp_con = Mock(is_open=True, started=Future())
+        self.amqp_con.started.set_result(True)
+        confirmation = Future()
+        confirmation.set_result(True)
+        self.amqp_con.publish.return_value = confirmation
+        return tornado.web.Application([
+            (r"/cloudtrail/v1/.*", CloudTrailHandler, dict(amqp_con=self.amqp_con, record_filter=RecordFilter([]))),
+        ])
+
+    def get_httpserver_options(self):
+        # HTTP_DECOMPRESS_REQUEST=true
+        return {'decompress_request': True}
+
+    @patch('src.handlers.cloudtrail.StatsClientSingleton', Mock())
+    def test_inflated_by_the_server(self):
+        body = gzip.compress(json.dumps({'Records': [{'eventName': 'RunInstances'}]}).encode())
+        for headers in ({'Content-Encoding': 'gzip', 'Accept-Encoding': 'gzip'}, {'Accept-Encoding': 'gzip'}):
+            self.amqp_con.publish.reset_mock()
+            response = self.fetch('/cloudtrail/v1/integration', method='POST', body=body, headers=headers,
+                                  decompress_response=False)
+            self.assertEqual(response.code, 200)
+            self.amqp_con.publish.assert_called_once_with('cloudtrail.v1.integration',
+                                                          json.dumps({'eventName': 'RunInstances'}), headers=ANY)
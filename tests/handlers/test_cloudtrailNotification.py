@@ -0,0 +1,64 @@
+import gzip
+import json
+import os
+import tempfile
+
+import tornado.web
+from tornado.concurrent import Future
+from tornado.testing import AsyncHTTPTestCase
+from unittest.mock import ANY, Mock
+
+from src.handlers.cloudtrailNotification import CloudTrailNotificationHandler
+from src.lib.cloudtrailS3 import Checkpoint, CloudTrailIngester
+from src.lib.objectStore import LocalObjectStore
+
+
+class CloudTrailS3ConfigTest:
+    max_concurrent_fetches = 2
+
+
+class TestCloudTrailNotification(AsyncHTTPTestCase):
+    def get_app(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        os.makedirs(os.path.join(self.tmp.name, 'trail'))
+        with open(os.path.join(self.tmp.name, 'trail', 'a.json.gz'), 'wb') as f:
+            f.write(gzip.compress(json.dumps({'Records': [{'eventName': 'RunInstances'}]}).encode()))
+        ingester = CloudTrailIngester(LocalObjectStore(self.tmp.name), Checkpoint(os.path.join(self.tmp.name, 'cp')),
+                                      CloudTrailS3ConfigTest)
+        self.amqp_con = Mock()
+        confirmation = Future()
+        confirmation.set_result(True)
+        self.amqp_con.publish.return_value = confirmation
+        return tornado.web.Application([(r"/cloudtrail-s3/.*", CloudTrailNotificationHandler,
+                                         dict(amqp_con=self.amqp_con, ingester=ingester))])
+
+    def tearDown(self):
+        super().tearDown()
+        self.tmp.cleanup()
+
+    def notify(self, key, headers=None):
+        message = json.dumps({'s3Bucket': 'trail', 's3ObjectKey': [key]})
+        return self.fetch('/cloudtrail-s3/v1/production', method='POST', headers=headers,
+                          body=json.dumps({'Type': 'Notification', 'Message': message}))
+
+    def test_notification(self):
+        self.assertEqual(self.notify('a.json.gz').code, 200)
+        self.amqp_con.publish.assert_called_once_with('cloudtrail.v1.production', '{"eventName": "RunInstances"}',
+                                                      headers=ANY)
+        # already ingested
+        self.assertEqual(self.notify('a.json.gz').code, 200)
+        self.assertEqual(self.amqp_con.publish.call_count, 1)
+
+    def test_missing_object(self):
+        self.assertEqual(self.notify('missing.json.gz').code, 500)
+
+    def test_unknown_notification(self):
+        response = self.fetch('/cloudtrail-s3/v1/production', method='POST', body='{"foo": 1}')
+        self.assertEqual(response.code, 400)
+
+    def test_subscription_confirmation(self):
+        response = self.fetch('/cloudtrail-s3/v1/production', method='POST',
+                              headers={'x-amz-sns-message-type': 'SubscriptionConfirmation'},
+                              body=json.dumps({'Type': 'SubscriptionConfirmation', 'Message': 'You have chosen'}))
+        self.assertEqual(response.code, 200)
+        self.amqp_con.publish.assert_not_called()
@@ -1,6 +1,10 @@
+import json
 import tornado
 from tornado.testing import AsyncHTTPTestCase
-from src.handlers.heartbeat import HeartbeatHandler
+from unittest.mock import Mock
+
+from src.config import HealthConfig
+from src.handlers.heartbeat import HeartbeatHandler, HealthCheckHandler
 
 
 class TestHeartbeat(AsyncHTTPTestCase):
@@ -20,3 +24,47 @@ class TestHeartbeat(AsyncHTTPTestCase):
     def test_heartbeat(self):
         response = self.fetch('/api/heartbeat')
         self.assertEqual(response.code, 200)
+
+
+class TestHealthCheck(AsyncHTTPTestCase):
+    def get_app(self):
+        self.amqp_con = Mock(is_open=True, outstanding_confirms=0)
+        self.loop_monitor = Mock(lag=0.0)
+        return tornado.web.Application([
+            (r"/api/healthcheck", HealthCheckHandler, dict(amqp_con=self.amqp_con, loop_monitor=self.loop_monitor)),
+        ])
+
+    def setUp(self):
+        super(TestHealthCheck, self).setUp()
+        HealthCheckHandler._cache = None
+
+    def test_ready(self):
+        response = self.fetch('/api/healthcheck')
+        self.assertEqual(response.code, 200)
+        body = json.loads(response.body.decode())
+        self.assertTrue(body['ready'])
+        self.assertTrue(body['amqp_channel_open'])
+        self.assertEqual(body['in_flight'], 0)
+
+    def test_channel_closed(self):
+        self.amqp_con.is_open = False
+        response = self.fetch('/api/healthcheck')
+        self.assertEqual(response.code, 503)
+        self.assertFalse(json.loads(response.body.decode())['amqp_channel_open'])
+
+    def test_confirms_backlog(self):
+        self.amqp_con.outstanding_confirms = HealthConfig.max_outstanding_confirms + 1
+        response = self.fetch('/api/healthcheck')
+        self.assertEqual(response.code, 503)
+
+    def test_loop_lag(self):
+        self.loop_monitor.lag = HealthConfig.max_loop_lag_ms / 1000 + 1
+        response = self.fetch('/api/healthcheck')
+        self.assertEqual(response.code, 503)
+
+    def test_cached(self):
+        self.assertEqual(self.fetch('/api/healthcheck').code, 200)
+        self.amqp_con.is_open = False
+        self.assertEqual(self.fetch('/api/healthcheck').code, 200)
+        HealthCheckHandler._cache_time -= HealthConfig.cache_ms / 1000 + 1
+        self.assertEqual(self.fetch('/api/healthcheck').code, 503)
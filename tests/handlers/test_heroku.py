@@ -1,7 +1,11 @@
+import json
+import os
+import tempfile
 import unittest
 from unittest.mock import Mock, patch
 
-from src.handlers.heroku import HerokuHandler
+from src.handlers.heroku import HerokuHandler, format_message
+from src.lib.frameDedup import FrameDedup
 
 
 class TestHeroku(unittest.TestCase):
@@ -31,3 +35,68 @@ class TestHeroku(unittest.TestCase):
 
         handler.get_status()
         self.assertEqual(handler.get_status(), 500)
+
+    @patch('src.handlers.heroku.StatsClientSingleton', Mock())
+    def test_duplicate_frame(self):
+        amqp_con = Mock()
+        application = Mock()
+        application.ui_methods = Mock()
+        application.ui_methods.items = Mock(return_value=[])
+        with tempfile.TemporaryDirectory() as directory:
+            dedup = FrameDedup(os.path.join(directory, 'frames.dedup'), capacity=64)
+            for status in (200, 200):
+                request = Mock()
+                request.uri = request.path = "/heroku/v1/integration/toto"
+                request.headers = {'Logplex-Drain-Token': 'd.token', 'Logplex-Frame-Id': 'frame1'}
+                request.body = b"83 <40>1 2017-06-21T17:02:55+00:00 host ponzi web.1 - " \
+                    b"State changed from up to down\n"
+                handler = HerokuHandler(application, request, amqp_con=amqp_con, dedup=dedup)
+                handler.post()
+                self.assertEqual(handler.get_status(), status)
+            dedup.close()
+        self.assertEqual(amqp_con.publish.call_count, 1)
+
+    @patch('src.handlers.heroku.StatsClientSingleton', Mock())
+    def test_quarantine(self):
+        amqp_con = Mock()
+        application = Mock()
+        application.ui_methods = Mock()
+        application.ui_methods.items = Mock(return_value=[])
+        request = Mock()
+        request.uri = request.path = "/heroku/v1/integration/toto"
+        request.headers = {'Logplex-Msg-Count': '2'}
+        request.body = b"xx83 <40>1 2017-06-14T13:52:29+00:00 host app web.3 - State changed from starting to up\n"
+        handler = HerokuHandler(application, request, amqp_con=amqp_con)
+        handler.post()
+        self.assertEqual(handler.get_status(), 200)
+        messages = [json.loads(c[0][1]) for c in amqp_con.publish.call_args_list]
+        self.assertEqual([m['message'] for m in messages],
+                         ["<40>1 2017-06-14T13:52:29+00:00 host app web.3 - State changed from starting to up", 'xx'])
+        self.assertEqual([m.get('quarantined') for m in messages], [None, True])
+
+    @patch('src.handlers.heroku.StatsClientSingleton', Mock())
+    def test_empty_payload(self):
+        amqp_con = Mock()
+        application = Mock()
+        application.ui_methods = Mock()
+        application.ui_methods.items = Mock(return_value=[])
+        request = Mock()
+        request.uri = request.path = "/heroku/v1"
+        request.headers = {}
+        request.body = b""
+        handler = HerokuHandler(application, request, amqp_con=amqp_con)
+        handler.post()
+        self.assertEqual(handler.get_status(), 200)
+        amqp_con.publish.assert_not_called()
+
+    def test_format_message(self):
+        message = json.loads(format_message('/heroku/v1/integration/toto', 'State changed from up to down'))
+        self.assertEqual(message, {'type': 'heroku', 'parser_ver': 'v1', 'env': 'integration', 'app': 'toto',
+                                   'message': 'State changed from up to down', 'http_content_length': 29})
+
+    def test_format_message_as_json_dumps(self):
+        for msg in ('State changed from up to down', 'quote " and \\\\ backslash', 'café ☃', ''):
+            self.assertEqual(format_message('/heroku/v1/integration/toto', msg),
+                             json.dumps({'type': 'heroku', 'parser_ver': 'v1', 'env': 'integration', 'app': 'toto',
+                                         'message': msg, 'http_content_length': len(msg)}))
+        self.assertEqual(json.loads(format_message('/heroku/v1/integration/toto', 'xx', True))['quarantined'], True)
@@ -0,0 +1,27 @@
+import tempfile
+import tornado
+from tornado.testing import AsyncHTTPTestCase
+
+from src.handlers.metrics import MetricsHandler
+from src.lib.metrics import Registry, Counter
+
+
+class TestMetrics(AsyncHTTPTestCase):
+    def get_app(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.registry = Registry(self.directory.name)
+        self.counter = Counter('requests_total', 'Requests', registry=self.registry)
+        return tornado.web.Application([
+            (r"/metrics", MetricsHandler, dict(registry=self.registry)),
+        ])
+
+    def tearDown(self):
+        super(TestMetrics, self).tearDown()
+        self.directory.cleanup()
+
+    def test_metrics(self):
+        self.counter.inc()
+        response = self.fetch('/metrics')
+        self.assertEqual(response.code, 200)
+        self.assertTrue(response.headers['Content-Type'].startswith('text/plain; version=0.0.4'))
+        self.assertIn(b'requests_total 1\n', response.body)
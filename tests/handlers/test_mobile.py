@@ -1,7 +1,10 @@
+import gzip
+import zlib
 import unittest
-from unittest.mock import Mock, patch
+from unittest.mock import ANY, Mock, patch
 
 from src.handlers.mobile import MobileHandler
+from src.lib.mobileSchema import Normalizer
 
 
 class TestMobile(unittest.TestCase):
@@ -31,3 +34,89 @@ class TestMobile(unittest.TestCase):
 
         handler.get_status()
         self.assertEqual(handler.get_status(), 500)
+
+    def test_mobile_gzip_passthrough(self):
+        """
+        Gzipped payload is forwarded without being decompressed
+        :return:
+        """
+        class CompressionConfig:
+            mobile_gzip_passthrough = True
+
+        amqp_con = Mock()
+        application = Mock()
+        application.ui_methods = Mock()
+        application.ui_methods.items = Mock(return_value=[])
+        request = Mock()
+        request.uri = request.path = "/mobile/v1/integration"
+        request.headers = {'Accept-Encoding': 'gzip'}
+        request.body = gzip.compress(b'{"message": "this is a log message"}')
+        handler = MobileHandler(application, request, amqp_con=amqp_con, config=CompressionConfig)
+
+        handler.post()
+
+        amqp_con.publish.assert_called_with('mobile.v1.integration', request.body, content_encoding='gzip', headers=ANY)
+
+
+class TestMobileEncoding(unittest.TestCase):
+    def post(self, body, headers):
+        amqp_con = Mock()
+        application = Mock()
+        application.ui_methods = Mock()
+        application.ui_methods.items = Mock(return_value=[])
+        request = Mock()
+        request.uri = request.path = "/mobile/v1/integration"
+        request.headers = headers
+        request.body = body
+        handler = MobileHandler(application, request, amqp_con=amqp_con)
+        handler.post()
+        return handler, amqp_con
+
+    def test_content_encoding(self):
+        body = b'{"message": "this is a log message"}'
+        for encoding, payload in (('gzip', gzip.compress(body)), ('deflate', zlib.compress(body)),
+                                  ('deflate', zlib.compress(body)[2:-4]), ('identity', body)):
+            handler, amqp_con = self.post(payload, {'Content-Encoding': encoding})
+            self.assertEqual(handler.get_status(), 200)
+            amqp_con.publish.assert_called_once_with('mobile.v1.integration', body, headers=ANY)
+
+    def test_legacy_accept_encoding(self):
+        body = b'{"message": "this is a log message"}'
+        handler, amqp_con = self.post(gzip.compress(body), {'Accept-Encoding': 'gzip'})
+        amqp_con.publish.assert_called_once_with('mobile.v1.integration', body, headers=ANY)
+
+        # already inflated by the HTTP server
+        handler, amqp_con = self.post(body, {'Accept-Encoding': 'gzip', 'X-Consumed-Content-Encoding': 'gzip'})
+        amqp_con.publish.assert_called_once_with('mobile.v1.integration', body, headers=ANY)
+
+    def test_unsupported_encoding(self):
+        handler, amqp_con = self.post(b'...', {'Content-Encoding': 'compress'})
+        self.assertEqual(handler.get_status(), 415)
+        amqp_con.publish.assert_not_called()
+
+    def test_corrupted_body(self):
+        handler, amqp_con = self.post(b'not gzipped', {'Content-Encoding': 'gzip'})
+        self.assertEqual(handler.get_status(), 400)
+        amqp_con.publish.assert_not_called()
+
+    def test_ndjson(self):
+        body = b'{"message": "first"}\n{"message": "second"}\r\n\n{"message": "third"}'
+        handler, amqp_con = self.post(gzip.compress(body), {'Content-Encoding': 'gzip',
+                                                            'Content-Type': 'application/x-ndjson; charset=utf-8'})
+        self.assertEqual(handler.get_status(), 200)
+        self.assertEqual([c[0][1] for c in amqp_con.publish.call_args_list],
+                         [b'{"message": "first"}', b'{"message": "second"}', b'{"message": "third"}'])
+
+    def test_normalize(self):
+        amqp_con = Mock()
+        application = Mock()
+        application.ui_methods = Mock()
+        application.ui_methods.items = Mock(return_value=[])
+        request = Mock()
+        request.uri = request.path = "/mobile/v1/integration"
+        request.headers = {'Content-Type': 'application/x-ndjson'}
+        request.body = b'{"userId": "1"}\n{"userId": 2}'
+        handler = MobileHandler(application, request, amqp_con=amqp_con,
+                                normalizer=Normalizer({'v1': {'userId': 'int'}}, 100))
+        handler.post()
+        self.assertEqual([c[0][1] for c in amqp_con.publish.call_args_list], [b'{"userId":1}', b'{"userId":2}'])
@@ -0,0 +1,84 @@
+import json
+import os
+import tornado
+from tornado.testing import AsyncHTTPTestCase
+
+from src.handlers.profiling import ProfilingHandler
+
+
+class ProfilingConfig:
+    admin_token = 'secret'
+    tracemalloc_frames = 25
+    cpu_interval = 0.005
+    max_duration = 60
+
+
+class DisabledProfilingConfig(ProfilingConfig):
+    admin_token = ''
+
+
+class TestProfiling(AsyncHTTPTestCase):
+    def get_app(self):
+        return tornado.web.Application([
+            (r"/api/admin/(tracemalloc|cpu)/(\w+)", ProfilingHandler, dict(config=ProfilingConfig)),
+            (r"/disabled/(tracemalloc|cpu)/(\w+)", ProfilingHandler, dict(config=DisabledProfilingConfig)),
+        ])
+
+    def fetch_admin(self, path, method='GET'):
+        return self.fetch(path, method=method, body=b'' if method == 'POST' else None,
+                          headers={'X-Admin-Token': 'secret'})
+
+    def test_disabled(self):
+        response = self.fetch('/disabled/tracemalloc/top', headers={'X-Admin-Token': ''})
+        self.assertEqual(response.code, 404)
+
+    def test_wrong_token(self):
+        response = self.fetch('/api/admin/tracemalloc/top', headers={'X-Admin-Token': 'guess'})
+        self.assertEqual(response.code, 404)
+
+    def test_tracemalloc(self):
+        response = self.fetch_admin('/api/admin/tracemalloc/top')
+        self.assertEqual(response.code, 409)
+
+        response = self.fetch_admin('/api/admin/tracemalloc/start', method='POST')
+        self.assertEqual(response.code, 200)
+        self.assertTrue(json.loads(response.body.decode())['running'])
+
+        response = self.fetch_admin('/api/admin/tracemalloc/top?limit=2')
+        self.assertEqual(response.code, 200)
+        self.assertEqual(len(json.loads(response.body.decode())['top']), 2)
+
+        response = self.fetch_admin('/api/admin/tracemalloc/routes')
+        self.assertEqual(response.code, 200)
+        self.assertIn('profiling', json.loads(response.body.decode())['routes'])
+
+        response = self.fetch_admin('/api/admin/tracemalloc/stop', method='POST')
+        self.assertFalse(json.loads(response.body.decode())['running'])
+
+    def test_cpu(self):
+        response = self.fetch_admin('/api/admin/cpu/start', method='POST')
+        self.assertEqual(response.code, 200)
+        response = self.fetch_admin('/api/admin/cpu/stop', method='POST')
+        self.assertEqual(response.code, 200)
+        response = self.fetch_admin('/api/admin/cpu/collapsed')
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.headers['Content-Type'], 'text/plain')
+        self.assertEqual(response.headers['X-Worker-Pid'], str(os.getpid()))
+
+    def test_invalid_arguments(self):
+        for path, method in (('/api/admin/tracemalloc/top?limit=ten', 'GET'),
+                             ('/api/admin/tracemalloc/start?frames=0', 'POST'),
+                             ('/api/admin/cpu/start?interval=fast', 'POST')):
+            response = self.fetch_admin(path, method=method)
+            self.assertEqual(response.code, 400)
+        response = self.fetch_admin('/api/admin/tracemalloc/top')
+        self.assertEqual(response.code, 409)
+
+        self.fetch_admin('/api/admin/tracemalloc/start', method='POST')
+        try:
+            response = self.fetch_admin('/api/admin/tracemalloc/top?key_type=bogus')
+            self.assertEqual(response.code, 400)
+            response = self.fetch_admin('/api/admin/tracemalloc/diff?key_type=filename')
+            self.assertEqual(response.code, 200)
+        finally:
+            self.fetch_admin('/api/admin/tracemalloc/stop', method='POST')
@@ -3,6 +3,7 @@ import tornado.web
 from tornado.testing import AsyncHTTPTestCase, gen_test
 from tornado.concurrent import Future
 import json
+import gzip
 
 from src.lib.AMQPConnection import AMQPConnection
 from src.config import AmqpConfig
@@ -52,6 +53,25 @@ class TestAMQPConnection(AsyncHTTPTestCase):
             self.futureMsg.set_result(json.loads(body.decode('utf-8')))
         channel.basic_ack(basic_deliver.delivery_tag)
 
+    def test_properties_reused(self):
+        con = AMQPConnection()
+        con._channel = Mock()
+        headers = {'x-request-id': 'abc'}
+        con.publish('toto', 'msg1', headers=headers)
+        con.publish('toto', 'msg2', headers=headers)
+        con.publish('toto', 'msg3', headers={'x-request-id': 'def'})
+        con.publish('toto', 'msg4')
+        con.publish('toto', 'msg5')
+        con.publish('toto', 'msg6', content_encoding='gzip')
+        properties = [c[1]['properties'] for c in con._channel.basic_publish.call_args_list]
+        self.assertIs(properties[0], properties[1])
+        self.assertIsNot(properties[1], properties[2])
+        self.assertEqual(properties[2].headers, {'x-request-id': 'def'})
+        self.assertIs(properties[3], properties[4])
+        self.assertEqual((properties[4].delivery_mode, properties[4].content_encoding, properties[4].headers),
+                         (2, None, None))
+        self.assertEqual(properties[5].content_encoding, 'gzip')
+
     def test_delivery_confirmation_nack(self):
         con = AMQPConnection()
         frame = Mock()
@@ -71,3 +91,47 @@ class TestAMQPConnection(AsyncHTTPTestCase):
         con.statsdClient.incr = Mock()
         con._on_delivery_confirmation(frame)
         con.statsdClient.incr.assert_called_with('amqp.output_delivered', count=1)
+
+    def test_publish_compressed(self):
+        class CompressionConfig:
+            routes = 'toto:gzip'
+            min_size = 0
+            level = 6
+
+        con = AMQPConnection(compression_config=CompressionConfig)
+        con._channel = Mock()
+        con.publish('toto.tutu', '{"toto": "tutu"}')
+        kwargs = con._channel.basic_publish.call_args[1]
+        self.assertEqual(kwargs['properties'].content_encoding, 'gzip')
+        self.assertEqual(gzip.decompress(kwargs['body']), b'{"toto": "tutu"}')
+
+    def test_publish_already_encoded(self):
+        con = AMQPConnection()
+        con._channel = Mock()
+        body = gzip.compress(b'{"toto": "tutu"}')
+        con.publish('toto', body, content_encoding='gzip')
+        kwargs = con._channel.basic_publish.call_args[1]
+        self.assertEqual(kwargs['properties'].content_encoding, 'gzip')
+        self.assertEqual(kwargs['body'], body)
+
+    def test_publish_confirmation(self):
+        con = AMQPConnection()
+        con._channel = Mock()
+        con.statsdClient = Mock()
+        confirmations = [con.publish('toto', 'msg') for _ in range(3)]
+        self.assertEqual(con.outstanding_confirms, 3)
+
+        frame = Mock()
+        frame.method.NAME = 'Basic.Ack'
+        frame.method.delivery_tag = 2
+        frame.method.multiple = True
+        con._on_delivery_confirmation(frame)
+        self.assertEqual([c.done() for c in confirmations], [True, True, False])
+        self.assertEqual(con.outstanding_confirms, 1)
+
+        frame.method.NAME = 'Basic.Nack'
+        frame.method.delivery_tag = 3
+        frame.method.multiple = False
+        con._on_delivery_confirmation(frame)
+        self.assertEqual([c.result() for c in confirmations], [True, True, False])
+        self.assertEqual(con.outstanding_confirms, 0)
@@ -0,0 +1,92 @@
+import gzip
+import os
+import tempfile
+from unittest.mock import Mock
+
+from tornado.concurrent import Future
+from tornado.testing import AsyncTestCase, gen_test
+
+from src.lib.AppendLogSink import AppendLogSink
+from src.lib.appendLog import PartitionReader
+from src.lib.sink import TeeSink
+
+
+class AppendLogConfigTest:
+    partitions = 2
+    segment_bytes = 1024 * 1024
+    segment_ms = 3600000
+    retention_bytes = 10 * 1024 * 1024
+    index_interval_bytes = 4096
+    buffer_size = 4096
+    flush_interval_ms = 5
+
+
+class TestAppendLogSink(AsyncTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.config = type('Config', (AppendLogConfigTest,), {'directory': self.tmp.name})
+        self.sinks = []
+
+    def tearDown(self):
+        for sink in self.sinks:
+            sink.close()
+        self.tmp.cleanup()
+        super().tearDown()
+
+    def sink(self):
+        sink = AppendLogSink(self.config, ioloop=self.io_loop)
+        self.sinks.append(sink)
+        return sink
+
+    def read(self, partition=0):
+        return list(PartitionReader(os.path.join(self.tmp.name, 'partition-{}'.format(partition))).read())
+
+    @gen_test
+    def test_publish(self):
+        sink = self.sink()
+        self.assertTrue((yield sink.started))
+        first = sink.publish('mobile.v1.production', '{"message": "a"}')
+        second = sink.publish('mobile.v1.production', gzip.compress(b'{"message": "b"}'), 'gzip')
+        self.assertFalse(first.done())
+        self.assertEqual((yield [first, second]), [True, True])
+        records = self.read()
+        self.assertEqual([record.body for record in records], [b'{"message": "a"}', b'{"message": "b"}'])
+        self.assertEqual(records[0].routing_key, 'mobile.v1.production')
+
+    @gen_test
+    def test_corrupt_message(self):
+        sink = self.sink()
+        self.assertTrue((yield sink.started))
+        corrupt = sink.publish('mobile.v1.production', b'not gzip', 'gzip')
+        self.assertTrue(corrupt.done())
+        self.assertFalse(corrupt.result())
+        self.assertTrue((yield sink.publish('mobile.v1.production', b'{"message": "a"}')))
+        self.assertEqual([record.body for record in self.read()], [b'{"message": "a"}'])
+
+    @gen_test
+    def test_partition_per_worker(self):
+        first, second = self.sink(), self.sink()
+        self.assertTrue(second.is_open)
+        yield second.publish('heroku.v1.production.app', b'message')
+        self.assertEqual(self.read(0), [])
+        self.assertEqual(len(self.read(1)), 1)
+
+        third = self.sink()
+        self.assertFalse(third.is_open)
+        self.assertFalse((yield third.started))
+        self.assertFalse((yield third.publish('heroku.v1.production.app', b'message')))
+
+    @gen_test
+    def test_tee(self):
+        archive = self.sink()
+        primary = Mock()
+        confirmation = Future()
+        confirmation.set_result(True)
+        primary.publish.return_value = confirmation
+        tee = TeeSink(primary, archive)
+
+        self.assertIs(tee.publish('cloudtrail.v1.production', b'{"Records": []}'), confirmation)
+        primary.publish.assert_called_once_with('cloudtrail.v1.production', b'{"Records": []}', None, None)
+        archive.flush()
+        self.assertEqual(self.read()[0].body, b'{"Records": []}')
@@ -0,0 +1,74 @@
+from unittest.mock import Mock, patch
+from tornado.concurrent import Future
+from tornado.testing import AsyncTestCase, gen_test
+from tornado import gen
+
+from src.lib.BatchPublisher import BatchPublisher
+
+
+class BatchConfig:
+    batch_size = 3
+    linger_ms = 10
+
+
+def confirmed_future(result=True):
+    future = Future()
+    future.set_result(result)
+    return future
+
+
+@patch('src.lib.BatchPublisher.StatsClientSingleton', Mock())
+class TestBatchPublisher(AsyncTestCase):
+    def setUp(self):
+        super(TestBatchPublisher, self).setUp()
+        self.amqp_con = Mock()
+        self.amqp_con.publish = Mock(side_effect=lambda *args: confirmed_future())
+        self.publisher = BatchPublisher(self.amqp_con, BatchConfig, self.io_loop)
+
+    def test_flush_on_batch_size(self):
+        self.publisher.publish('a', 'msg1')
+        self.publisher.publish('b', 'msg2')
+        self.assertEqual(self.amqp_con.publish.call_count, 0)
+        self.publisher.publish('a', 'msg3')
+        self.assertEqual(self.amqp_con.publish.call_count, 3)
+        self.assertEqual(len(self.publisher), 0)
+
+    def test_grouped_per_routing_key(self):
+        self.publisher.publish('a', 'msg1')
+        self.publisher.publish('b', 'msg2')
+        self.publisher.publish('a', 'msg3', 'gzip')
+        self.assertEqual([c[0] for c in self.amqp_con.publish.call_args_list],
+                         [('a', 'msg1', None), ('a', 'msg3', 'gzip'), ('b', 'msg2', None)])
+
+    @gen_test
+    def test_flush_on_linger(self):
+        confirmation = self.publisher.publish('a', 'msg1')
+        self.assertEqual(self.amqp_con.publish.call_count, 0)
+        res = yield confirmation
+        self.assertTrue(res)
+        self.amqp_con.publish.assert_called_once_with('a', 'msg1', None)
+
+    @gen_test
+    def test_publish_failure(self):
+        self.amqp_con.publish = Mock(side_effect=AttributeError)
+        confirmation = self.publisher.publish('a', 'msg1')
+        self.publisher.flush()
+        res = yield confirmation
+        self.assertFalse(res)
+
+    def test_closed_channel(self):
+        self.amqp_con.is_open = False
+        with self.assertRaises(ConnectionError):
+            self.publisher.publish('a', 'msg1')
+        self.assertEqual(len(self.publisher), 0)
+
+    @gen_test
+    def test_flush_empty(self):
+        self.publisher.flush()
+        yield gen.moment
+        self.assertEqual(self.amqp_con.publish.call_count, 0)
+
+    def test_headers(self):
+        self.publisher.publish('a', 'msg1', headers={'x-request-id': 'abc'})
+        self.publisher.flush()
+        self.amqp_con.publish.assert_called_once_with('a', 'msg1', None, {'x-request-id': 'abc'})
@@ -0,0 +1,135 @@
+import gzip
+import json
+import tornado.web
+from tornado import gen
+from tornado.testing import AsyncHTTPTestCase, gen_test
+
+from src.lib.ElasticsearchSink import ElasticsearchSink
+from src.lib.keepAliveClient import KeepAliveHTTPClient
+
+
+class ElasticsearchConfigTest:
+    index = 'logs-{source}-{date}'
+    bulk_size = 1000
+    flush_interval_ms = 5
+    max_concurrent_requests = 2
+    max_pending_bytes = 10000
+    max_retries = 2
+    retry_backoff_ms = 1
+    retry_max_backoff_ms = 5
+    request_timeout = 5
+
+
+class FakeBulkHandler(tornado.web.RequestHandler):
+    """
+    A fake Elasticsearch _bulk API, answering the queued responses in order
+    """
+    requests = []
+    # list of (HTTP code, per document status or None)
+    responses = []
+
+    def post(self):
+        lines = self.request.body.decode().splitlines()
+        actions = [json.loads(line) for line in lines[::2]]
+        documents = [json.loads(line) for line in lines[1::2]]
+        FakeBulkHandler.requests.append((self.request.headers['Content-Type'], actions, documents))
+        code, statuses = FakeBulkHandler.responses.pop(0) if FakeBulkHandler.responses else (200, None)
+        self.set_status(code)
+        if code != 200:
+            return
+        statuses = statuses or [201] * len(documents)
+        self.write({'errors': any(status >= 300 for status in statuses),
+                    'items': [{'index': {'status': status}} for status in statuses]})
+
+
+class TestElasticsearchSink(AsyncHTTPTestCase):
+    def get_app(self):
+        FakeBulkHandler.requests = []
+        FakeBulkHandler.responses = []
+        return tornado.web.Application([
+            (r"/_bulk", FakeBulkHandler),
+        ])
+
+    def setUp(self):
+        super(TestElasticsearchSink, self).setUp()
+        self.client = KeepAliveHTTPClient('http://127.0.0.1:{}'.format(self.get_http_port()), max_connections=2)
+        self.sink = ElasticsearchSink(ElasticsearchConfigTest, client=self.client, ioloop=self.io_loop)
+
+    def tearDown(self):
+        self.client.close()
+        super(TestElasticsearchSink, self).tearDown()
+
+    @gen_test
+    def test_flush_interval(self):
+        results = yield [self.sink.publish('heroku.v1.production.myapp', json.dumps({'message': str(n)}))
+                         for n in range(3)]
+        self.assertEqual(results, [True] * 3)
+        self.assertEqual(len(FakeBulkHandler.requests), 1)
+        content_type, actions, documents = FakeBulkHandler.requests[0]
+        self.assertEqual(content_type, 'application/x-ndjson')
+        self.assertTrue(actions[0]['index']['_index'].startswith('logs-heroku-'))
+        self.assertEqual(documents, [{'message': '0'}, {'message': '1'}, {'message': '2'}])
+
+    @gen_test
+    def test_bulk_size(self):
+        futures = [self.sink.publish('mobile.v1.production', json.dumps({'message': 'x' * 100})) for _ in range(20)]
+        self.assertLess(len(self.sink), 20)
+        results = yield futures
+        self.assertEqual(results, [True] * 20)
+        self.assertGreater(len(FakeBulkHandler.requests), 1)
+        self.assertEqual(sum(len(documents) for _, _, documents in FakeBulkHandler.requests), 20)
+        self.assertEqual(self.client.connections, 2)
+
+    @gen_test
+    def test_retry_429(self):
+        FakeBulkHandler.responses = [(429, None), (200, None)]
+        result = yield self.sink.publish('mobile.v1.production', b'{"message": "retried"}')
+        self.assertTrue(result)
+        self.assertEqual(len(FakeBulkHandler.requests), 2)
+
+    @gen_test
+    def test_retry_rejected_documents(self):
+        FakeBulkHandler.responses = [(200, [201, 429, 400]), (200, None)]
+        results = yield [self.sink.publish('mobile.v1.production', json.dumps({'message': str(n)})) for n in range(3)]
+        self.assertEqual(results, [True, True, False])
+        self.assertEqual(FakeBulkHandler.requests[1][2], [{'message': '1'}])
+
+    @gen_test
+    def test_max_retries(self):
+        FakeBulkHandler.responses = [(429, None)] * 3
+        result = yield self.sink.publish('mobile.v1.production', b'{"message": "lost"}')
+        self.assertFalse(result)
+        self.assertEqual(len(FakeBulkHandler.requests), 3)
+
+    @gen_test
+    def test_failure(self):
+        FakeBulkHandler.responses = [(400, None)]
+        result = yield self.sink.publish('mobile.v1.production', b'{"message": "lost"}')
+        self.assertFalse(result)
+        self.assertEqual(len(FakeBulkHandler.requests), 1)
+
+    @gen_test
+    def test_compressed_multiline_document(self):
+        result = yield self.sink.publish('mobile.v1.production', gzip.compress(b'{\n  "message": "gzip"\n}'),
+                                         content_encoding='gzip')
+        self.assertTrue(result)
+        self.assertEqual(FakeBulkHandler.requests[0][2], [{'message': 'gzip'}])
+
+    @gen_test
+    def test_max_pending_bytes(self):
+        futures = [self.sink.publish('mobile.v1.production', json.dumps({'message': 'x' * 900})) for _ in range(20)]
+        results = yield futures
+        self.assertIn(False, results)
+        self.assertIn(True, results)
+        yield gen.sleep(0.01)
+        self.assertEqual(self.sink._pending, 0)
+
+    @gen_test
+    def test_corrupt_document(self):
+        results = yield [
+            self.sink.publish('mobile.v1.production', b'not gzip', content_encoding='gzip'),
+            self.sink.publish('mobile.v1.production', b'not\njson'),
+            self.sink.publish('mobile.v1.production', b'{"message": "valid"}'),
+        ]
+        self.assertEqual(results, [False, False, True])
+        self.assertEqual(FakeBulkHandler.requests[0][2], [{'message': 'valid'}])
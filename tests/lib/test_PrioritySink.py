@@ -0,0 +1,106 @@
+from unittest.mock import Mock
+from tornado import gen
+from tornado.concurrent import Future
+from tornado.testing import AsyncTestCase, gen_test
+
+from src.lib.PrioritySink import PRIORITY_PUBLISHED, PRIORITY_SHED, PrioritySink, parse_lanes
+
+
+class PriorityConfigTest:
+    lanes = 'production:2,integration:1'
+    max_outstanding_confirms = 2
+    max_queued = 4
+    shed_queued = 2
+
+
+class TestPrioritySink(AsyncTestCase):
+    def setUp(self):
+        super(TestPrioritySink, self).setUp()
+        self.published = []
+        self.sink = Mock()
+        self.sink.publish = Mock(side_effect=self._publish)
+        self.lanes = PrioritySink(self.sink, PriorityConfigTest, self.io_loop)
+
+    def _publish(self, routing_key, msg, content_encoding=None, headers=None):
+        future = Future()
+        self.published.append((msg, future))
+        return future
+
+    @gen.coroutine
+    def confirm(self, count):
+        for msg, future in self.published[:count]:
+            if not future.done():
+                future.set_result(True)
+        # the confirmations then the scheduler
+        yield gen.moment
+        yield gen.moment
+
+    def test_parse_lanes(self):
+        self.assertEqual(parse_lanes('production:8, integration:1'), [('production', 8), ('integration', 1)])
+        with self.assertRaises(ValueError):
+            parse_lanes('production:0')
+
+    def test_lane(self):
+        self.assertEqual(self.lanes.lane('heroku.v1.production.app').name, 'production')
+        self.assertEqual(self.lanes.lane('mobile.v1.integration.3').name, 'integration')
+        # unknown env: the last lane
+        self.assertEqual(self.lanes.lane('mobile.v1.staging').name, 'integration')
+        self.assertEqual(self.lanes.lane('other').name, 'integration')
+
+    @gen_test
+    def test_publish_within_window(self):
+        confirmation = self.lanes.publish('heroku.v1.production.app', 'msg1', headers={'x-request-id': 'a'})
+        self.sink.publish.assert_called_once_with('heroku.v1.production.app', 'msg1', None, {'x-request-id': 'a'})
+        yield self.confirm(1)
+        self.assertTrue((yield confirmation))
+        self.assertEqual(self.lanes.outstanding, 0)
+
+    @gen_test
+    def test_weighted_schedule(self):
+        self.lanes.publish('mobile.v1.integration', 'i0')
+        self.lanes.publish('mobile.v1.integration', 'i1')
+        # the window is full
+        self.lanes.publish('mobile.v1.integration', 'i2')
+        self.lanes.publish('mobile.v1.integration', 'i3')
+        for n in range(4):
+            self.lanes.publish('mobile.v1.production', 'p{}'.format(n))
+        self.assertEqual(len(self.lanes), 6)
+
+        # the production lane goes first, then integration, twice as much production
+        yield self.confirm(2)
+        self.assertEqual([msg for msg, _ in self.published], ['i0', 'i1', 'p0', 'p1'])
+        yield self.confirm(4)
+        self.assertEqual([msg for msg, _ in self.published][4:], ['p2', 'p3'])
+        yield self.confirm(6)
+        self.assertEqual([msg for msg, _ in self.published][6:], ['i2', 'i3'])
+        self.assertEqual(len(self.lanes), 0)
+
+    @gen_test
+    def test_shed_lower_lanes_first(self):
+        self.lanes.publish('mobile.v1.integration', 'i0')
+        self.lanes.publish('mobile.v1.integration', 'i1')
+        shed = PRIORITY_SHED.labels(lane='integration', reason='backpressure').get()
+        queued = [self.lanes.publish('mobile.v1.integration', 'i{}'.format(n)) for n in range(2, 5)]
+        self.assertTrue(queued[2].done())
+        self.assertFalse((yield queued[2]))
+        self.assertEqual(PRIORITY_SHED.labels(lane='integration', reason='backpressure').get() - shed, 1)
+
+        # the production lane is only bounded by max_queued
+        production = [self.lanes.publish('mobile.v1.production', 'p{}'.format(n)) for n in range(5)]
+        self.assertEqual([future.done() for future in production], [False] * 4 + [True])
+        self.assertFalse((yield production[4]))
+
+    @gen_test
+    def test_publish_failure(self):
+        published = PRIORITY_PUBLISHED.labels(lane='production').get()
+        self.sink.publish = Mock(side_effect=AttributeError)
+        confirmation = self.lanes.publish('mobile.v1.production', 'msg1')
+        self.assertFalse((yield confirmation))
+        self.assertEqual(self.lanes.outstanding, 0)
+        self.assertEqual(PRIORITY_PUBLISHED.labels(lane='production').get(), published)
+
+    def test_closed_channel(self):
+        self.sink.is_open = False
+        with self.assertRaises(ConnectionError):
+            self.lanes.publish('mobile.v1.production', 'msg1')
+        self.assertEqual(self.published, [])
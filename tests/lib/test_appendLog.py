@@ -0,0 +1,93 @@
+import os
+import tempfile
+import unittest
+
+from src.lib.appendLog import PartitionReader, PartitionWriter, list_segments, read_index, segment_path
+
+
+class AppendLogConfigTest:
+    segment_bytes = 1000
+    segment_ms = 3600000
+    retention_bytes = 100000
+    index_interval_bytes = 200
+    buffer_size = 4096
+
+
+class AppendLogTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.partition = os.path.join(self.directory.name, 'partition-0')
+        self.writer = PartitionWriter(self.partition, AppendLogConfigTest)
+
+    def tearDown(self):
+        if self.writer is not None:
+            self.writer.close()
+        self.directory.cleanup()
+
+    def write(self, count, start=0):
+        for n in range(start, start + count):
+            self.writer.append('heroku.v1.production.app', 'message {}'.format(n).encode(), timestamp=1000 + n)
+        self.writer.flush()
+
+    def test_append_read(self):
+        self.assertEqual(self.writer.append('mobile.v1.production', b'{"message": "a"}'), 0)
+        self.assertEqual(self.writer.append('mobile.v1.production', b'{"message": "b"}'), 1)
+        self.writer.flush()
+        records = list(PartitionReader(self.partition).read())
+        self.assertEqual([record.offset for record in records], [0, 1])
+        self.assertEqual(records[1].routing_key, 'mobile.v1.production')
+        self.assertEqual(records[1].body, b'{"message": "b"}')
+
+    def test_segments_and_index(self):
+        self.write(100)
+        segments = list_segments(self.partition)
+        self.assertGreater(len(segments), 2)
+        self.assertEqual(segments[0], 0)
+        entries = read_index(self.partition, segments[1])
+        self.assertEqual(entries[0][:2], (0, 0))
+        self.assertGreater(len(entries), 1)
+
+    def test_read_from_offset(self):
+        self.write(100)
+        records = list(PartitionReader(self.partition).read(57))
+        self.assertEqual([record.offset for record in records], list(range(57, 100)))
+        self.assertEqual(records[0].body, b'message 57')
+
+    def test_read_from_timestamp(self):
+        self.write(100)
+        reader = PartitionReader(self.partition)
+        self.assertEqual(reader.offset_for_timestamp(1042), 42)
+        self.assertEqual(reader.offset_for_timestamp(0), 0)
+        self.assertIsNone(reader.offset_for_timestamp(5000))
+        self.assertEqual(next(iter(reader.read_from_timestamp(1077))).body, b'message 77')
+
+    def test_recover_truncated_record(self):
+        self.write(10)
+        self.writer.close()
+        path = segment_path(self.partition, list_segments(self.partition)[-1])
+        with open(path, 'ab') as f:
+            f.write(b'\x20\x00\x00\x00partial')
+
+        self.writer = PartitionWriter(self.partition, AppendLogConfigTest)
+        self.assertEqual(self.writer.next_offset, 10)
+        self.write(5, start=10)
+        records = list(PartitionReader(self.partition).read())
+        self.assertEqual([record.offset for record in records], list(range(15)))
+        self.assertEqual(records[-1].body, b'message 14')
+
+    def test_retention(self):
+        class Config(AppendLogConfigTest):
+            retention_bytes = 2500
+
+        self.writer.close()
+        self.writer = PartitionWriter(self.partition, Config)
+        self.write(200)
+        segments = list_segments(self.partition)
+        self.assertLessEqual(len(segments), 4)
+        self.assertGreater(segments[0], 0)
+        records = list(PartitionReader(self.partition).read())
+        self.assertEqual(records[-1].offset, 199)
+
+    def test_single_writer(self):
+        with self.assertRaises(BlockingIOError):
+            PartitionWriter(self.partition, AppendLogConfigTest)
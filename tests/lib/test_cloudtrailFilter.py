@@ -0,0 +1,90 @@
+import json
+import tempfile
+import unittest
+
+from src.lib.cloudtrailFilter import CLOUDTRAIL_DROPPED, RecordFilter, Rule, compile_projection, default_filter, \
+    load_filter
+
+
+def record(source='ec2.amazonaws.com', name='DescribeInstances', read_only=True, error_code=None, **fields):
+    res = dict(eventSource=source, eventName=name, readOnly=read_only, **fields)
+    if error_code:
+        res['errorCode'] = error_code
+    return res
+
+
+class ProjectionTest(unittest.TestCase):
+    def test_deny(self):
+        project = compile_projection(deny=['responseElements', 'requestParameters.policy'])
+        original = record(responseElements={'a': 1}, requestParameters={'policy': '...', 'bucketName': 'b'})
+        projected = project(original)
+        self.assertNotIn('responseElements', projected)
+        self.assertEqual(projected['requestParameters'], {'bucketName': 'b'})
+        self.assertIn('policy', original['requestParameters'])
+
+    def test_allow(self):
+        project = compile_projection(allow=['eventName', 'userIdentity.userName', 'missing.field'])
+        projected = project(record(userIdentity={'type': 'IAMUser', 'userName': 'bob'}))
+        self.assertEqual(projected, {'eventName': 'DescribeInstances', 'userIdentity': {'userName': 'bob'}})
+
+    def test_nothing(self):
+        self.assertIsNone(compile_projection())
+
+
+class RecordFilterTest(unittest.TestCase):
+    def setUp(self):
+        self.filter = RecordFilter([
+            Rule('errors', error_code=True, deny_fields=['responseElements']),
+            Rule('read-noise', event_name_prefix=['Describe', 'List', 'Get'], read_only=True, drop=True),
+            Rule('s3-puts', event_source='s3.amazonaws.com', event_name_prefix='Put', allow_fields=['eventName']),
+        ], deny_fields=['requestParameters'])
+
+    def test_drop(self):
+        dropped = CLOUDTRAIL_DROPPED.labels(rule='read-noise').get()
+        self.assertIsNone(self.filter.apply(record()))
+        self.assertIsNone(self.filter.apply(record(name='ListRoles', read_only='true')))
+        self.assertEqual(CLOUDTRAIL_DROPPED.labels(rule='read-noise').get(), dropped + 2)
+
+    def test_first_rule_wins(self):
+        projected = self.filter.apply(record(error_code='AccessDenied', responseElements={}, requestParameters={}))
+        self.assertNotIn('responseElements', projected)
+        self.assertIn('requestParameters', projected)
+
+    def test_projection(self):
+        self.assertEqual(self.filter.apply(record('s3.amazonaws.com', 'PutObject', False)), {'eventName': 'PutObject'})
+        default = self.filter.apply(record(name='RunInstances', read_only=False, requestParameters={}))
+        self.assertNotIn('requestParameters', default)
+        self.assertEqual(default['eventName'], 'RunInstances')
+
+    def test_dispatch_table(self):
+        self.filter.apply(record())
+        self.filter.apply(record())
+        self.filter.apply(record(name='RunInstances', read_only=False))
+        self.assertEqual(len(self.filter._dispatch), 2)
+
+    def test_error_codes(self):
+        rule = Rule('denied', error_code=['AccessDenied'])
+        self.assertTrue(rule.matches('s3.amazonaws.com', 'GetObject', True, 'AccessDenied'))
+        self.assertFalse(rule.matches('s3.amazonaws.com', 'GetObject', True, None))
+        self.assertTrue(Rule('ok', error_code=False).matches('s3.amazonaws.com', 'GetObject', True, None))
+
+
+class LoadFilterTest(unittest.TestCase):
+    def test_load_filter(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as f:
+            json.dump({'rules': [{'name': 'read-noise', 'read_only': True, 'drop': True}],
+                       'deny_fields': ['responseElements']}, f)
+            f.flush()
+            record_filter = load_filter(f.name)
+
+            class Config:
+                rules_file = f.name
+            self.assertIs(default_filter(Config), default_filter(Config))
+        self.assertIsNone(record_filter.apply(record()))
+        self.assertEqual(record_filter.apply(record(read_only=False, responseElements={})),
+                         record(read_only=False))
+
+    def test_no_rules(self):
+        class Config:
+            rules_file = None
+        self.assertIsNone(default_filter(Config))
@@ -0,0 +1,153 @@
+import gzip
+import json
+import os
+import tempfile
+import unittest
+
+from tornado import gen
+from tornado.concurrent import Future
+from tornado.testing import AsyncTestCase, gen_test
+
+from src.lib.cloudtrailFilter import RecordFilter, Rule
+from src.lib.cloudtrailS3 import Checkpoint, CloudTrailIngester, RecordStream, parse_notification
+from src.lib.objectStore import LocalObjectStore
+
+RECORDS = [{'eventName': 'RunInstances', 'readOnly': False, 'requestParameters': {'note': 'a ] b } ,'}},
+           {'eventName': 'DescribeInstances', 'readOnly': True},
+           {'eventName': 'ConsoleLogin', 'readOnly': False, 'userIdentity': {'userName': 'élodie'}}]
+LOG_FILE = gzip.compress(json.dumps({'Records': RECORDS}, ensure_ascii=False).encode('utf-8'))
+
+
+class ParseNotificationTest(unittest.TestCase):
+    def test_s3_event(self):
+        body = {'Records': [{'eventSource': 'aws:s3', 's3': {'bucket': {'name': 'trail'},
+                                                             'object': {'key': 'AWSLogs/a+b%3D.json.gz'}}}]}
+        self.assertEqual(parse_notification(json.dumps(body)), [('trail', 'AWSLogs/a b=.json.gz')])
+
+    def test_cloudtrail_sns(self):
+        message = {'s3Bucket': 'trail', 's3ObjectKey': ['a.json.gz', 'b.json.gz']}
+        body = {'Type': 'Notification', 'Message': json.dumps(message)}
+        self.assertEqual(parse_notification(json.dumps(body)), [('trail', 'a.json.gz'), ('trail', 'b.json.gz')])
+
+    def test_test_event(self):
+        self.assertEqual(parse_notification('{"Service": "Amazon S3", "Event": "s3:TestEvent"}'), [])
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            parse_notification('{"foo": 1}')
+        with self.assertRaises(ValueError):
+            parse_notification('[]')
+
+
+class RecordStreamTest(unittest.TestCase):
+    def read(self, data, chunk_size):
+        stream = RecordStream()
+        records = []
+        for position in range(0, len(data), chunk_size):
+            records += stream.feed(data[position:position + chunk_size])
+        stream.close()
+        return records
+
+    def test_gzip_chunks(self):
+        for chunk_size in (1, 7, 64, len(LOG_FILE)):
+            self.assertEqual(self.read(LOG_FILE, chunk_size), RECORDS)
+
+    def test_plain(self):
+        self.assertEqual(self.read(json.dumps({'Records': RECORDS}).encode(), 5), RECORDS)
+
+    def test_empty(self):
+        self.assertEqual(self.read(b'{"Records": []}', 3), [])
+
+    def test_truncated(self):
+        with self.assertRaises(ValueError):
+            self.read(LOG_FILE[:-20], 64)
+        with self.assertRaises(ValueError):
+            self.read(json.dumps({'Records': RECORDS}).encode()[:-10], 64)
+
+
+class CheckpointTest(unittest.TestCase):
+    def test_shared(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'checkpoint')
+            first, second = Checkpoint(path), Checkpoint(path)
+            self.assertNotIn(('trail', 'a.json.gz'), first)
+            second.add(('trail', 'a.json.gz'))
+            self.assertIn(('trail', 'a.json.gz'), first)
+            self.assertIn(('trail', 'a.json.gz'), Checkpoint(path))
+
+
+class CloudTrailS3ConfigTest:
+    max_concurrent_fetches = 2
+
+
+class CloudTrailIngesterTest(AsyncTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.makedirs(os.path.join(self.tmp.name, 'trail', 'logs'))
+        for n in range(5):
+            with open(os.path.join(self.tmp.name, 'trail', 'logs', '{}.json.gz'.format(n)), 'wb') as f:
+                f.write(LOG_FILE)
+        self.store = LocalObjectStore(self.tmp.name, chunk_size=16)
+        self.published = []
+
+    def tearDown(self):
+        self.tmp.cleanup()
+        super().tearDown()
+
+    def publish(self, record, result=True):
+        self.published.append(json.loads(record))
+        confirmation = Future()
+        confirmation.set_result(result)
+        return confirmation
+
+    @gen_test
+    def test_store_list(self):
+        self.assertEqual((yield self.store.list('trail')), ['logs/{}.json.gz'.format(n) for n in range(5)])
+        self.assertEqual((yield self.store.list('trail', 'logs/3')), ['logs/3.json.gz'])
+        with self.assertRaises(KeyError):
+            self.store._path('trail', '../other/key')
+
+    @gen_test
+    def test_ingest(self):
+        checkpoint = Checkpoint(os.path.join(self.tmp.name, 'checkpoint'))
+        ingester = CloudTrailIngester(self.store, checkpoint, CloudTrailS3ConfigTest,
+                                      record_filter=RecordFilter([Rule('read', read_only=True, drop=True)]))
+        objects = [('trail', key) for key in (yield self.store.list('trail'))]
+        count = yield ingester.ingest(objects, self.publish)
+        self.assertEqual(count, 10)
+        self.assertEqual(self.published.count(RECORDS[0]), 5)
+        self.assertNotIn(RECORDS[1], self.published)
+
+        # notified again
+        count = yield ingester.ingest(objects[:1], self.publish)
+        self.assertEqual(count, 0)
+
+    @gen_test
+    def test_bounded_concurrency(self):
+        fetching = []
+        fetch = self.store.fetch
+
+        @gen.coroutine
+        def counting_fetch(bucket, key, streaming_callback):
+            fetching.append(key)
+            self.assertLessEqual(len(fetching), 2)
+            yield fetch(bucket, key, streaming_callback)
+            fetching.remove(key)
+
+        self.store.fetch = counting_fetch
+        ingester = CloudTrailIngester(self.store, None, CloudTrailS3ConfigTest)
+        count = yield ingester.ingest([('trail', key) for key in (yield self.store.list('trail'))], self.publish)
+        self.assertEqual(count, 15)
+
+    @gen_test
+    def test_failures(self):
+        checkpoint = Checkpoint(os.path.join(self.tmp.name, 'checkpoint'))
+        ingester = CloudTrailIngester(self.store, checkpoint, CloudTrailS3ConfigTest)
+        with self.assertRaises(KeyError):
+            yield ingester.ingest([('trail', 'logs/0.json.gz'), ('trail', 'missing')], self.publish)
+        self.assertIn(('trail', 'logs/0.json.gz'), checkpoint)
+
+        with self.assertRaises(IOError):
+            yield ingester.ingest([('trail', 'logs/1.json.gz')], lambda record: self.publish(record, False))
+        self.assertNotIn(('trail', 'logs/1.json.gz'), checkpoint)
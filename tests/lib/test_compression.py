@@ -0,0 +1,62 @@
+import gzip
+import zlib
+import unittest
+from unittest.mock import patch
+
+from src.lib.compression import Compressor, parse_routes
+
+
+class CompressionConfigTest:
+    routes = 'mobile:gzip,mobile.v1.production:zlib'
+    min_size = 10
+    level = 6
+
+
+class CompressorTest(unittest.TestCase):
+    def setUp(self):
+        self.compressor = Compressor(CompressionConfigTest)
+
+    def test_parse_routes_longest_prefix_first(self):
+        self.assertEqual(parse_routes(CompressionConfigTest.routes),
+                         [('mobile.v1.production', 'deflate'), ('mobile', 'gzip')])
+
+    def test_parse_routes_unknown_codec(self):
+        with self.assertRaises(ValueError):
+            parse_routes('mobile:rot13')
+
+    def test_compress_gzip(self):
+        body, encoding = self.compressor.compress('mobile.v1.integration', '{"message": "a log message"}')
+        self.assertEqual(encoding, 'gzip')
+        self.assertEqual(gzip.decompress(body), b'{"message": "a log message"}')
+
+    def test_compress_most_specific_route(self):
+        body, encoding = self.compressor.compress('mobile.v1.production', b'{"message": "a log message"}')
+        self.assertEqual(encoding, 'deflate')
+        self.assertEqual(zlib.decompress(body), b'{"message": "a log message"}')
+
+    def test_compress_below_threshold(self):
+        body, encoding = self.compressor.compress('mobile.v1.integration', b'{}')
+        self.assertIsNone(encoding)
+        self.assertEqual(body, b'{}')
+
+    def test_compress_no_route(self):
+        body, encoding = self.compressor.compress('cloudtrail.v1.integration', '{"message": "a log message"}')
+        self.assertIsNone(encoding)
+        self.assertEqual(body, '{"message": "a log message"}')
+
+    def test_add_route(self):
+        self.assertIsNone(self.compressor.codec_for('cloudtrail.v1.integration'))
+        self.compressor.add_route('cloudtrail', 'zlib')
+        self.assertEqual(self.compressor.codec_for('cloudtrail.v1.integration'), 'deflate')
+        # configured routes have the precedence
+        self.compressor.add_route('mobile', 'deflate')
+        self.assertEqual(self.compressor.codec_for('mobile.v1.integration'), 'gzip')
+        with self.assertRaises(ValueError):
+            self.compressor.add_route('heroku', 'rot13')
+
+    @patch('src.lib.compression.MAX_CACHED_KEYS', 1)
+    def test_codec_cache_bounded(self):
+        self.assertEqual(self.compressor.codec_for('mobile.v1.integration'), 'gzip')
+        self.assertEqual(self.compressor.codec_for('mobile.v1.production'), 'deflate')
+        self.assertIsNone(self.compressor.codec_for('heroku.v1.production.app'))
+        self.assertEqual(len(self.compressor._codecs), 1)
@@ -0,0 +1,63 @@
+import os
+import tempfile
+import unittest
+
+from src.lib.frameDedup import FRAMES, FrameDedup
+
+
+class TestFrameDedup(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'frames.dedup')
+        self.dedup = FrameDedup(self.path, capacity=64, ttl=60)
+
+    def tearDown(self):
+        self.dedup.close()
+        self.tmp.cleanup()
+
+    def test_seen(self):
+        self.assertFalse(self.dedup.seen('d.token', 'frame1', now=1000))
+        self.assertTrue(self.dedup.seen('d.token', 'frame1', now=1001))
+        self.assertFalse(self.dedup.seen('d.other', 'frame1', now=1001))
+        self.assertFalse(self.dedup.seen('d.token', 'frame2', now=1001))
+
+    def test_expiry(self):
+        self.assertFalse(self.dedup.seen('d.token', 'frame1', now=1000))
+        self.assertFalse(self.dedup.seen('d.token', 'frame1', now=1061))
+        self.assertTrue(self.dedup.seen('d.token', 'frame1', now=1062))
+
+    def test_untracked(self):
+        untracked = FRAMES.labels(result='untracked').get()
+        self.assertFalse(self.dedup.seen(None, 'frame1'))
+        self.assertFalse(self.dedup.seen(None, 'frame1'))
+        self.assertEqual(FRAMES.labels(result='untracked').get() - untracked, 2)
+
+    def test_forget(self):
+        self.dedup.seen('d.token', 'frame1', now=1000)
+        self.dedup.forget('d.token', 'frame1')
+        self.assertFalse(self.dedup.seen('d.token', 'frame1', now=1001))
+
+    def test_fixed_size(self):
+        size = os.path.getsize(self.path)
+        for n in range(1000):
+            self.dedup.seen('d.token', n, now=1000)
+        self.assertEqual(os.path.getsize(self.path), size)
+        # the most recent frames are kept
+        self.assertTrue(self.dedup.seen('d.token', 999, now=1000))
+
+    def test_shared(self):
+        self.dedup.seen('d.token', 'frame1', now=1000)
+        other = FrameDedup(self.path, capacity=64, ttl=60)
+        try:
+            self.assertTrue(other.seen('d.token', 'frame1', now=1001))
+        finally:
+            other.close()
+
+        other = FrameDedup(self.path, capacity=128, ttl=60)
+        try:
+            self.assertEqual(other.path, self.path + '.128')
+            self.assertFalse(other.seen('d.token', 'frame1', now=1001))
+        finally:
+            other.close()
+        # the table of the other capacity is left as is
+        self.assertTrue(self.dedup.seen('d.token', 'frame1', now=1002))
@@ -0,0 +1,60 @@
+import time
+from unittest import TestCase
+from unittest.mock import patch
+from tornado import gen
+from tornado.testing import AsyncTestCase, gen_test
+
+from src.lib.loopMonitor import LoopLagMonitor, percentile
+
+
+def blocking_handler():
+    time.sleep(0.3)
+
+
+class TestLoopLagMonitor(AsyncTestCase):
+    @gen_test
+    def test_no_lag(self):
+        monitor = LoopLagMonitor(interval_ms=10, slow_threshold_ms=0)
+        monitor.start()
+        yield gen.sleep(0.05)
+        monitor.stop()
+        self.assertLess(monitor.lag, 0.05)
+        self.assertGreater(monitor.stats()['samples'], 0)
+
+    @gen_test
+    def test_slow_callback_stack(self):
+        monitor = LoopLagMonitor(interval_ms=10, slow_threshold_ms=100)
+        with patch.object(monitor, 'logger') as logger:
+            monitor.start()
+            yield gen.sleep(0.02)
+            self.io_loop.add_callback(blocking_handler)
+            yield gen.sleep(0.05)
+            monitor.stop()
+        self.assertEqual(logger.warning.call_count, 1)
+        self.assertIn('blocking_handler', logger.warning.call_args[0][0])
+        self.assertGreater(monitor.max_lag, 0.2)
+
+
+class TestLoopLagMeasure(TestCase):
+    @patch('src.lib.loopMonitor.IOLoop')
+    def test_lag(self, ioloop):
+        monitor = LoopLagMonitor(interval_ms=100, slow_threshold_ms=0)
+        for now in (1.0, 1.1, 1.45):
+            ioloop.current.return_value.time.return_value = now
+            monitor._check()
+        self.assertAlmostEqual(monitor.lag, 0.25)
+        ioloop.current.return_value.time.return_value = 1.55
+        monitor._check()
+        self.assertAlmostEqual(monitor.lag, 0.0)
+        self.assertAlmostEqual(monitor.max_lag, 0.25)
+        stats = monitor.stats()
+        self.assertEqual(stats['samples'], 3)
+        self.assertEqual(stats['max_ms'], 250)
+        self.assertEqual(stats['p50_ms'], 0)
+
+    def test_percentile(self):
+        values = list(range(100))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile(values, 100), 99)
+        self.assertEqual(percentile([], 50), 0.0)
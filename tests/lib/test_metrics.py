@@ -0,0 +1,116 @@
+import json
+import os
+import tempfile
+import unittest
+
+from src.lib.metrics import MmapDict, Registry, Counter, Gauge, Histogram
+
+
+class MmapDictTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, 'metrics_1.db')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_read_write(self):
+        d = MmapDict(self.filename)
+        d.write_value('a', 1.5)
+        d.inc_value('a', 1)
+        d.inc_value('bcdef', 3)
+        self.assertEqual(d.read_value('a'), 2.5)
+        self.assertEqual(d.read_value('unknown'), 0.0)
+        self.assertEqual(MmapDict.read_all_values(self.filename), [('a', 2.5), ('bcdef', 3.0)])
+        d.close()
+
+    def test_reopen_and_grow(self):
+        d = MmapDict(self.filename)
+        for i in range(5000):
+            d.inc_value('key_{}'.format(i), i)
+        d.close()
+        d = MmapDict(self.filename)
+        self.assertEqual(d.read_value('key_4999'), 4999)
+        self.assertEqual(len(MmapDict.read_all_values(self.filename)), 5000)
+        d.close()
+
+
+class RegistryTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.registry = Registry(self.directory.name)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_counter(self):
+        counter = Counter('requests_total', 'Requests', ('route',), registry=self.registry)
+        counter.labels(route='mobile').inc()
+        counter.labels(route='mobile').inc(2)
+        counter.labels(route='heroku').inc()
+        self.assertEqual(self.registry.exposition(),
+                         '# HELP requests_total Requests\n'
+                         '# TYPE requests_total counter\n'
+                         'requests_total{route="heroku"} 1\n'
+                         'requests_total{route="mobile"} 3\n')
+
+    def test_counter_with_labels(self):
+        counter = Counter('requests_total', 'Requests', ('route',), registry=self.registry)
+        with self.assertRaises(ValueError):
+            counter.inc()
+
+    def test_duplicated_metric(self):
+        Counter('requests_total', 'Requests', registry=self.registry)
+        with self.assertRaises(ValueError):
+            Counter('requests_total', 'Requests', registry=self.registry)
+
+    def test_aggregate_processes(self):
+        counter = Counter('requests_total', 'Requests', registry=self.registry)
+        gauge = Gauge('in_flight', 'In flight', registry=self.registry)
+        counter.inc()
+        gauge.set(2)
+        # a dead worker
+        dead = MmapDict(os.path.join(self.directory.name, 'metrics_999999999.db'))
+        dead.write_value(json.dumps(['requests_total', 'requests_total', []]), 4)
+        dead.write_value(json.dumps(['in_flight', 'in_flight', []]), 7)
+        dead.close()
+
+        samples = self.registry.collect()
+        self.assertEqual(samples[('requests_total', 'requests_total', ())], 5)
+        self.assertEqual(samples[('in_flight', 'in_flight', ())], 2)
+
+        # the file of the dead worker is merged once
+        self.assertFalse(os.path.exists(os.path.join(self.directory.name, 'metrics_999999999.db')))
+        samples = self.registry.collect()
+        self.assertEqual(samples[('requests_total', 'requests_total', ())], 5)
+        self.assertEqual(samples[('in_flight', 'in_flight', ())], 2)
+
+    def test_pid_reuse(self):
+        # the file of a dead worker of the same pid
+        dead = MmapDict(os.path.join(self.directory.name, 'metrics_{}.db'.format(os.getpid())))
+        dead.write_value(json.dumps(['requests_total', 'requests_total', []]), 4)
+        dead.write_value(json.dumps(['in_flight', 'in_flight', []]), 7)
+        dead.close()
+
+        counter = Counter('requests_total', 'Requests', registry=self.registry)
+        gauge = Gauge('in_flight', 'In flight', registry=self.registry)
+        counter.inc()
+        gauge.inc()
+        self.assertEqual(gauge.labels().get(), 1)
+        samples = self.registry.collect()
+        self.assertEqual(samples[('requests_total', 'requests_total', ())], 5)
+        self.assertEqual(samples[('in_flight', 'in_flight', ())], 1)
+
+    def test_histogram(self):
+        histogram = Histogram('duration_seconds', 'Duration', buckets=(0.1, 1), registry=self.registry)
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5)
+        self.assertEqual(self.registry.exposition(),
+                         '# HELP duration_seconds Duration\n'
+                         '# TYPE duration_seconds histogram\n'
+                         'duration_seconds_count 3\n'
+                         'duration_seconds_sum 5.55\n'
+                         'duration_seconds_bucket{le="0.1"} 1\n'
+                         'duration_seconds_bucket{le="1"} 2\n'
+                         'duration_seconds_bucket{le="+Inf"} 3\n')
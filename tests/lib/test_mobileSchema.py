@@ -0,0 +1,80 @@
+import json
+import tempfile
+import unittest
+
+from src.lib.mobileSchema import Normalizer, compile_schema, default_normalizer, flatten, load_schemas
+
+SCHEMAS = {'v1': {'message': 'str', 'userId': 'int', 'device.battery': 'float', 'debug': 'bool'}}
+
+
+class MobileSchemaTest(unittest.TestCase):
+    def setUp(self):
+        self.normalizer = Normalizer(SCHEMAS, max_field_size=20)
+
+    def normalize(self, event, version='v1'):
+        body = json.dumps(event).encode()
+        return json.loads(self.normalizer.normalize(version, [body])[0].decode())
+
+    def test_flatten(self):
+        self.assertEqual(flatten({'a': {'b': {'c': 1}, 'd': 2}, 'e': {}}), {'a.b.c': 1, 'a.d': 2, 'e': {}})
+
+    def test_coerce(self):
+        event = self.normalize({'message': 42, 'userId': '12', 'device': {'battery': '0.5', 'os': 'ios'},
+                                'debug': 'true', 'other': [1]})
+        self.assertEqual(event, {'message': '42', 'userId': 12, 'device.battery': 0.5, 'device.os': 'ios',
+                                 'debug': True, 'other': [1]})
+
+    def test_drop_fields(self):
+        event = self.normalize({'message': 'x' * 21, 'userId': 'abc', 'debug': None, 'level': 'info'})
+        self.assertEqual(event, {'debug': None, 'level': 'info'})
+
+    def test_non_finite_float(self):
+        for battery in ('NaN', 'inf', '1e999', float('nan'), float('-inf')):
+            self.assertEqual(self.normalize({'device': {'battery': battery}, 'level': 'info'}), {'level': 'info'})
+
+    def test_non_finite_unknown_field(self):
+        # fields outside the schema are not coerced, their non-finite numbers are dropped too
+        self.assertEqual(self.normalize({'device': {'temperature': float('nan')}, 'ratio': float('inf'),
+                                         'level': 'info'}), {'level': 'info'})
+        # an event still holding one, in an array, is dropped
+        bodies = [json.dumps({'samples': [1.0, float('nan')]}).encode(), json.dumps({'level': 'info'}).encode()]
+        self.assertEqual(self.normalizer.normalize('v1', bodies), [b'{"level":"info"}'])
+
+    def test_compact(self):
+        body = b'{\n  "message": "a",\n  "userId": 1\n}'
+        self.assertEqual(self.normalizer.normalize('v1', [body]), [b'{"message":"a","userId":1}'])
+
+    def test_array(self):
+        self.assertEqual(self.normalize([{'userId': '1'}, 'raw']), [{'userId': 1}, 'raw'])
+
+    def test_unknown_version(self):
+        events = [b'{"userId": "1"}']
+        self.assertIs(self.normalizer.normalize('v2', events), events)
+
+    def test_invalid_json(self):
+        self.assertEqual(self.normalizer.normalize('v1', [b'not json', b'42']), [b'not json', b'42'])
+
+    def test_unknown_type(self):
+        with self.assertRaises(ValueError):
+            compile_schema({'userId': 'long'})
+
+    def test_schemas_file(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as f:
+            json.dump({'v1': {'userId': 'str'}, 'v2': {'count': 'int'}}, f)
+            f.flush()
+
+            class Config:
+                schemas_file = f.name
+            schemas = load_schemas(Config)
+        self.assertEqual(schemas['v1']['userId'], 'str')
+        self.assertEqual(schemas['v1']['message'], 'str')
+        self.assertEqual(schemas['v2'], {'count': 'int'})
+
+    def test_default_normalizer(self):
+        class Config:
+            normalize = False
+        self.assertIsNone(default_normalizer(Config))
+        Config.normalize = True
+        Config.schemas_file = None
+        Config.max_field_size = 100
+        self.assertIs(default_normalizer(Config), default_normalizer(Config))
@@ -0,0 +1,15 @@
+import unittest
+
+from src.lib.ndjson import is_ndjson, split_events
+
+
+class NdjsonTest(unittest.TestCase):
+    def test_is_ndjson(self):
+        self.assertTrue(is_ndjson('application/x-ndjson'))
+        self.assertTrue(is_ndjson('Application/JSONL; charset=utf-8'))
+        self.assertFalse(is_ndjson('application/json'))
+        self.assertFalse(is_ndjson(''))
+
+    def test_split_events(self):
+        self.assertEqual(split_events(b'{"a": 1}\r\n\n  \n{"b": 2}\n'), [b'{"a": 1}', b'{"b": 2}'])
+        self.assertEqual(split_events(b''), [])
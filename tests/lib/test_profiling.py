@@ -0,0 +1,59 @@
+import importlib.util
+import os
+import tempfile
+import unittest
+from time import process_time
+
+from src.lib.profiling import MemoryProfiler, CPUSampler
+
+
+class MemoryProfilerTest(unittest.TestCase):
+    def setUp(self):
+        self.profiler = MemoryProfiler()
+        self.profiler.start()
+
+    def tearDown(self):
+        self.profiler.stop()
+
+    def test_top(self):
+        data = [bytearray(1024) for _ in range(100)]
+        top = self.profiler.top(limit=3)
+        self.assertEqual(len(top['top']), 3)
+        self.assertGreaterEqual(top['total_kb'], 100)
+        self.assertIn('lib/test_profiling.py', [stat['file'] for stat in top['top']])
+        del data
+
+    def test_diff(self):
+        self.assertEqual(self.profiler.diff(), [])
+        data = [bytearray(1024) for _ in range(100)]
+        diff = self.profiler.diff(limit=1)
+        self.assertEqual(diff[0]['file'], 'lib/test_profiling.py')
+        self.assertGreaterEqual(diff[0]['size_diff_kb'], 100)
+        del data
+
+    def test_top_by_route(self):
+        with tempfile.TemporaryDirectory() as directory:
+            os.mkdir(os.path.join(directory, 'handlers'))
+            path = os.path.join(directory, 'handlers', 'foo.py')
+            with open(path, 'w') as module_file:
+                module_file.write('def allocate():\n    return [bytearray(1024) for _ in range(100)]\n')
+            spec = importlib.util.spec_from_file_location('foo', path)
+            module = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(module)
+            data = module.allocate()
+            routes = self.profiler.top_by_route(limit=1)
+        self.assertEqual(routes['foo']['top'][0]['file'], 'handlers/foo.py')
+        self.assertEqual(routes['foo']['top'][0]['line'], 2)
+        del data
+
+
+class CPUSamplerTest(unittest.TestCase):
+    def test_collapsed(self):
+        sampler = CPUSampler()
+        sampler.start(0.001)
+        start = process_time()
+        while process_time() - start < 0.1:
+            pass
+        sampler.stop()
+        self.assertGreater(sampler.samples, 0)
+        self.assertIn('test_profiling.py:test_collapsed', sampler.collapsed())
@@ -0,0 +1,152 @@
+import json
+import tempfile
+import unittest
+import zlib
+from unittest.mock import Mock, patch
+
+from src.lib import routing
+from src.lib.routing import Route, compile_routes, default_route
+
+
+class RoutesConfigTest:
+    enabled = ['heroku', 'mobile']
+    routes_file = ''
+    routes = {
+        'heroku': {
+            'pattern': r"/heroku/.*",
+            'handler': 'src.handlers.heroku.HerokuHandler',
+            'routing_key': 'heroku.{1}.{2}.{3}',
+            'queues': [{'name': 'heroku_production_queue', 'key': 'heroku.v1.production.*'}],
+        },
+        'mobile': {
+            'pattern': r"/mobile/.*",
+            'handler': 'src.handlers.mobile.MobileHandler',
+            'routing_key': 'mobile.{path}',
+            'compression': 'gzip',
+            'batch': True,
+        },
+    }
+
+
+class RouteTest(unittest.TestCase):
+    def test_routing_key(self):
+        heroku = Route('heroku', r"/heroku/.*", 'HerokuHandler', 'heroku.{1}.{2}.{3}')
+        mobile = Route('mobile', r"/mobile/.*", 'MobileHandler', 'mobile.{path}')
+        self.assertEqual(heroku.routing_key('/heroku/v1/integration/myapp'), 'heroku.v1.integration.myapp')
+        self.assertEqual(mobile.routing_key('/mobile/v1/production'), 'mobile.v1.production')
+        self.assertEqual(heroku.prefix, 'heroku')
+        with self.assertRaises(IndexError):
+            heroku.routing_key('/heroku/v1')
+
+    def test_routing_key_cached(self):
+        route = Route('mobile', r"/mobile/.*", 'MobileHandler', 'mobile.{path}')
+        key = route.routing_key('/mobile/v1/production')
+        self.assertIs(route.routing_key('/mobile/v1/production'), key)
+
+    def test_routing_key_cache_bounded(self):
+        route = Route('heroku', r"/heroku/.*", 'HerokuHandler', 'heroku.{1}.{2}.{3}')
+        with patch.object(routing, 'MAX_CACHED_KEYS', 2):
+            for app in ('a', 'b', 'c'):
+                self.assertEqual(route.routing_key('/heroku/v1/production/' + app), 'heroku.v1.production.' + app)
+        self.assertEqual(len(route._keys), 2)
+
+    def test_batched(self):
+        route = Route('mobile', r"/mobile/.*", 'MobileHandler', 'mobile.{path}')
+        with patch('src.lib.routing.BatchConfig') as config:
+            config.batch_activated = True
+            self.assertTrue(route.batched)
+            route.batch = False
+            self.assertFalse(route.batched)
+
+    def test_default_route(self):
+        route = default_route('mobile')
+        self.assertIs(default_route('mobile'), route)
+        self.assertEqual(route.queues[1], ('mobile_production_queue', 'mobile.v1.production'))
+
+
+class ShardedRouteTest(unittest.TestCase):
+    def setUp(self):
+        self.route = Route('mobile', r"/mobile/.*", 'MobileHandler', 'mobile.{path}',
+                           shards=4, shard_by='X-Request-ID',
+                           queues=[{'name': 'mobile_production_queue', 'key': 'mobile.v1.production'}])
+
+    def test_queues(self):
+        self.assertEqual(self.route.queues[0], ('mobile_production_queue_0', 'mobile.v1.production.0'))
+        self.assertEqual(self.route.queues[3], ('mobile_production_queue_3', 'mobile.v1.production.3'))
+        self.assertEqual(len(self.route.queues), 4)
+
+    def test_routing_key(self):
+        self.assertEqual(self.route.routing_key('/mobile/v1/production', 2), 'mobile.v1.production.2')
+
+    def test_shard_by_header(self):
+        shard = self.route.shard({'X-Request-ID': 'abc'})
+        self.assertEqual(shard, zlib.crc32(b'abc') % 4)
+        self.assertEqual({self.route.shard({'X-Request-ID': 'abc'}) for _ in range(10)}, {shard})
+        self.assertEqual(len({self.route.shard({'X-Request-ID': str(n)}) for n in range(100)}), 4)
+
+    def test_shard_round_robin(self):
+        self.assertEqual(sorted(self.route.shard({}) for _ in range(4)), [0, 1, 2, 3])
+
+    def test_request_routing_key(self):
+        request = Mock(path='/mobile/v1/production', headers={'X-Request-ID': 'abc'})
+        self.assertEqual(self.route.request_routing_key(request),
+                         'mobile.v1.production.{}'.format(zlib.crc32(b'abc') % 4))
+
+    def test_not_sharded(self):
+        route = Route('mobile', r"/mobile/.*", 'MobileHandler', 'mobile.{path}', shard_by='X-Request-ID')
+        request = Mock(path='/mobile/v1/production', headers={'X-Request-ID': 'abc'})
+        self.assertEqual(route.request_routing_key(request), 'mobile.v1.production')
+
+    def test_unknown_sink(self):
+        with self.assertRaises(ValueError):
+            Route('mobile', r"/mobile/.*", 'MobileHandler', 'mobile.{path}', sink='kafka')
+
+    def test_archive(self):
+        route = Route('mobile', r"/mobile/.*", 'MobileHandler', 'mobile.{path}', sink='appendlog', archive=True)
+        self.assertEqual(route.sink, 'appendlog')
+        self.assertTrue(route.archive)
+
+    def test_no_shard(self):
+        with self.assertRaises(ValueError):
+            Route('mobile', r"/mobile/.*", 'MobileHandler', 'mobile.{path}', shards=0)
+
+
+class CompileRoutesTest(unittest.TestCase):
+    def test_compile(self):
+        heroku, mobile = compile_routes(RoutesConfigTest)
+        self.assertEqual(heroku.queues, (('heroku_production_queue', 'heroku.v1.production.*'),))
+        self.assertIsNone(heroku.compression)
+        self.assertEqual(mobile.compression, 'gzip')
+        self.assertTrue(mobile.batch)
+        self.assertEqual(mobile.queues, ())
+
+    def test_unknown_route(self):
+        class Config(RoutesConfigTest):
+            enabled = ['syslog']
+
+        with self.assertRaises(ValueError):
+            compile_routes(Config)
+
+    def test_compression_without_prefix(self):
+        class Config(RoutesConfigTest):
+            enabled = ['mobile']
+            routes = {'mobile': dict(RoutesConfigTest.routes['mobile'], routing_key='{path}')}
+
+        with self.assertRaises(ValueError):
+            compile_routes(Config)
+
+    def test_routes_file(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.json') as f:
+            json.dump({
+                'mobile': dict(RoutesConfigTest.routes['mobile'], compression=None),
+                'syslog': {'pattern': r"/syslog/.*", 'handler': 'SyslogHandler', 'routing_key': 'syslog.{path}'},
+            }, f)
+            f.flush()
+
+            class Config(RoutesConfigTest):
+                enabled = ['heroku', 'mobile', 'syslog']
+                routes_file = f.name
+
+            heroku, mobile, syslog = compile_routes(Config)
+        self.assertIsNone(mobile.compression)
+        self.assertEqual(syslog.routing_key('/syslog/v1/production'), 'syslog.v1.production')
@@ -0,0 +1,42 @@
+import unittest
+import tornado.web
+from tornado.httpserver import HTTPServer
+
+from src.lib.serverSettings import make_server, server_settings, tune_server
+
+
+class HTTPServerConfig:
+    no_keep_alive = False
+    idle_connection_timeout = 42
+    body_timeout = 12
+    max_header_size = 1024
+    max_body_size = 2048
+    max_buffer_size = 4096
+    chunk_size = 512
+    decompress_request = True
+
+
+class ServerSettingsTest(unittest.TestCase):
+    def assert_tuned(self, server):
+        self.assertEqual(server.max_buffer_size, 4096)
+        self.assertEqual(server.read_chunk_size, 512)
+        self.assertEqual(server.conn_params.header_timeout, 42)
+        self.assertEqual(server.conn_params.body_timeout, 12)
+        self.assertEqual(server.conn_params.max_header_size, 1024)
+        self.assertEqual(server.conn_params.max_body_size, 2048)
+        self.assertEqual(server.conn_params.chunk_size, 512)
+        self.assertTrue(server.conn_params.decompress)
+        self.assertFalse(server.conn_params.no_keep_alive)
+
+    def test_server_settings(self):
+        settings = server_settings(HTTPServerConfig)
+        self.assertEqual(settings['idle_connection_timeout'], 42)
+        self.assertEqual(settings['max_body_size'], 2048)
+
+    def test_make_server(self):
+        self.assert_tuned(make_server(tornado.web.Application(), HTTPServerConfig))
+
+    def test_tune_server(self):
+        server = HTTPServer(tornado.web.Application())
+        tune_server(server, HTTPServerConfig)
+        self.assert_tuned(server)
@@ -0,0 +1,58 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import MagicMock
+
+from src.lib.metrics import MmapDict, Registry, Counter, Gauge
+from src.lib.statsExporter import StatsdExporter
+
+
+class ExporterConfig:
+    statsd_export_interval_ms = 1000
+
+
+class StatsdExporterTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.registry = Registry(self.directory.name)
+        self.stats = Counter('stats_total', 'Stats', ('stat',), registry=self.registry)
+        self.gauges = Gauge('stats_gauge', 'Gauges', ('stat',), registry=self.registry)
+        self.client = MagicMock()
+        self.pipe = self.client.pipeline.return_value.__enter__.return_value
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_export_increments(self):
+        exporter = StatsdExporter(self.registry, ExporterConfig, self.client)
+        self.stats.labels(stat='amqp.output').inc(5)
+        # the first export records the current values
+        self.assertEqual(exporter.export(), 0)
+
+        self.stats.labels(stat='amqp.output').inc(2)
+        self.stats.labels(stat='input.mobile').inc()
+        self.gauges.labels(stat='queue').set(3)
+        # another worker
+        worker = MmapDict(os.path.join(self.directory.name, 'metrics_999999999.db'))
+        worker.write_value(json.dumps(['stats_total', 'stats_total', [['stat', 'amqp.output']]]), 10)
+        worker.close()
+
+        self.assertEqual(exporter.export(), 3)
+        self.pipe.incr.assert_any_call('amqp.output', 12)
+        self.pipe.incr.assert_any_call('input.mobile', 1)
+        self.pipe.gauge.assert_called_once_with('queue', 3)
+
+        self.pipe.reset_mock()
+        exporter.export()
+        self.assertEqual(self.pipe.incr.call_count, 0)
+
+    def test_single_exporter(self):
+        leader = StatsdExporter(self.registry, ExporterConfig, self.client)
+        other = StatsdExporter(self.registry, ExporterConfig, self.client)
+        self.assertTrue(leader.leader)
+        self.assertFalse(other.leader)
+        self.assertEqual(other.export(), 0)
+        os.close(leader._lock_fd)
+        self.assertTrue(other.leader)
+        os.close(other._lock_fd)
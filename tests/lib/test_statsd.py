@@ -1,5 +1,5 @@
 import unittest
-from src.lib.Statsd import StatsClientSingleton
+from src.lib.Statsd import STATS, STATS_GAUGES, SharedStatsClient, StatsClientSingleton
 
 
 class StatsdSingletonTest(unittest.TestCase):
@@ -7,3 +7,14 @@ class StatsdSingletonTest(unittest.TestCase):
         instance1 = StatsClientSingleton()
         instance2 = StatsClientSingleton()
         self.assertEqual(instance1, instance2)
+
+    def test_shared_counters(self):
+        client = SharedStatsClient()
+        count = STATS.labels(stat='test.stat').get()
+        client.incr('test.stat')
+        client.incr('test.stat', count=3)
+        self.assertEqual(STATS.labels(stat='test.stat').get() - count, 4)
+
+        client.gauge('test.gauge', 5)
+        client.gauge('test.gauge', 2, delta=True)
+        self.assertEqual(STATS_GAUGES.labels(stat='test.gauge').get(), 7)
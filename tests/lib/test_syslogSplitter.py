@@ -1,5 +1,5 @@
 import unittest
-from src.lib.syslogSplitter import split
+from src.lib.syslogSplitter import QUARANTINED, TRUNCATED, VALID, iter_frames, split, split_frames
 from src.config import TruncateConfig
 
 
@@ -146,5 +146,44 @@ class SyslogSplitterTest(unittest.TestCase):
             " consecteteur adipiscing."
         ])
 
+    def test_splitFramesMsgCount(self):
+        frame = b"83 <40>1 2017-06-14T13:52:29+00:00 host app web.3 - State changed from starting to up\n"
+        result = split_frames(frame * 2, self.conf, '2')
+        self.assertEqual(len(result.lines), 2)
+        self.assertEqual(result.quarantined, [])
+        self.assertFalse(result.msg_count_mismatch)
+        self.assertTrue(split_frames(frame * 2, self.conf, '3').msg_count_mismatch)
+
+    def test_splitFramesResync(self):
+        frame = b"83 <40>1 2017-06-14T13:52:29+00:00 host app web.3 - State changed from starting to up\n"
+        line = "<40>1 2017-06-14T13:52:29+00:00 host app web.3 - State changed from starting to up"
+
+        # garbage before a frame
+        result = split_frames(b"xx" + frame, self.conf, '2')
+        self.assertEqual((result.lines, result.quarantined, result.frames), ([line], [b"xx"], 2))
+        # octet count too large, the frame overlaps the next one
+        result = split_frames(b"9999 <40>1 x" + frame, self.conf)
+        self.assertEqual((result.lines, result.quarantined), ([line], [b"9999 <40>1 x"]))
+        # octet count not a number
+        result = split_frames(frame.replace(b"83", b"8a") + frame, self.conf)
+        self.assertEqual((result.lines, result.quarantined), ([line], [frame.replace(b"83", b"8a")]))
+        # garbage between frames
+        result = split_frames(frame + b"garbage" + frame, self.conf)
+        self.assertEqual((result.lines, result.quarantined), ([line, line], [b"garbage"]))
+        # no frame at all
+        self.assertEqual(split_frames(b"12 <40", self.conf).quarantined, [b"12 <40"])
+        self.assertEqual(split(b"12 <40", self.conf), [])
+
+    def test_iterFrames(self):
+        frame = b"83 <40>1 2017-06-14T13:52:29+00:00 host app web.3 - State changed from starting to up\n"
+        data = frame + frame.replace(b"83", b"8a") + frame + b"garbage" + frame[:40]
+        frames = list(iter_frames(data))
+        self.assertEqual([kind for kind, start, end in frames], [VALID, QUARANTINED, VALID, QUARANTINED, TRUNCATED])
+        self.assertEqual([data[start:end] for kind, start, end in frames],
+                         [frame[3:], frame.replace(b"83", b"8a"), frame[3:], b"garbage", frame[3:40]])
+        # resumed from the end of a frame, as the frames left
+        self.assertEqual(list(iter_frames(data, frames[1][2])), frames[2:])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,120 @@
+import json
+import os
+import tempfile
+from unittest.mock import Mock, patch
+
+import tornado.web
+from tornado import gen
+from tornado.concurrent import Future
+from tornado.testing import AsyncHTTPTestCase, AsyncTestCase, gen_test
+
+from src.config import TracingConfig
+from src.handlers.mobile import MobileHandler
+from src.lib.tracing import Collector, Trace
+
+
+class TracingConfigTest:
+    sample_rate = 1
+    slow_threshold_ms = 0
+
+
+class TestTrace(AsyncTestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'traces.jsonl')
+        self.collector = Collector(self.path)
+        self.request = Mock(headers={'Logplex-Frame-Id': 'frame', 'Logplex-Drain-Token': 'd.token'})
+
+    def tearDown(self):
+        self.collector.close()
+        self.tmp.cleanup()
+        super().tearDown()
+
+    def traces(self):
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_headers(self):
+        trace = Trace(self.request, 'heroku', TracingConfigTest, self.collector)
+        self.assertEqual(trace.headers['x-logplex-frame-id'], 'frame')
+        self.assertEqual(trace.headers['x-logplex-drain-token'], 'd.token')
+        self.assertEqual(len(trace.headers['x-request-id']), 32)
+        self.assertIsInstance(trace.headers['x-received-at'], int)
+
+        trace = Trace(Mock(headers={'X-Request-ID': 'abc'}), 'mobile', TracingConfigTest, self.collector)
+        self.assertEqual(trace.headers, {'x-request-id': 'abc', 'x-received-at': trace.headers['x-received-at']})
+
+    @gen_test
+    def test_emit_once_confirmed(self):
+        trace = Trace(self.request, 'heroku', TracingConfigTest, self.collector)
+        trace.span('split', 0)
+        confirmations = [Future(), Future()]
+        trace.published(confirmations)
+        trace.finish(200)
+        self.assertEqual(self.traces(), [])
+
+        for confirmation in confirmations:
+            confirmation.set_result(True)
+        yield gen.moment
+        traces = self.traces()
+        self.assertEqual(len(traces), 1)
+        self.assertEqual(traces[0]['frame_id'], 'frame')
+        self.assertEqual(traces[0]['messages'], 2)
+        self.assertEqual(traces[0]['status'], 200)
+        self.assertEqual(sorted(traces[0]['spans_ms']), ['confirm', 'request', 'split'])
+
+    def test_no_message(self):
+        trace = Trace(self.request, 'heroku', TracingConfigTest, self.collector)
+        trace.finish(500)
+        self.assertEqual(self.traces()[0]['status'], 500)
+
+    def test_sampling(self):
+        class NotSampled(TracingConfigTest):
+            sample_rate = 0
+            slow_threshold_ms = 1000
+        Trace(self.request, 'heroku', NotSampled, self.collector).finish(200)
+        self.assertEqual(self.traces(), [])
+
+        class Slow(NotSampled):
+            slow_threshold_ms = 0.000001
+        Trace(self.request, 'heroku', Slow, self.collector).finish(200)
+        self.assertEqual(self.traces()[0]['reason'], 'slow')
+
+
+class TestHandlerTrace(AsyncHTTPTestCase):
+    def get_app(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'traces.jsonl')
+        self.amqp_con = Mock(is_open=True)
+        self.amqp_con.publish = Mock(side_effect=self._publish)
+        return tornado.web.Application([
+            (r"/mobile/.*", MobileHandler, dict(amqp_con=self.amqp_con)),
+        ])
+
+    def tearDown(self):
+        super().tearDown()
+        self.tmp.cleanup()
+
+    @staticmethod
+    def _publish(*args, **kwargs):
+        confirmation = Future()
+        confirmation.set_result(True)
+        return confirmation
+
+    def test_trace_written(self):
+        with patch.object(TracingConfig, 'sample_rate', 1), patch.object(TracingConfig, 'collector_file', self.path):
+            response = self.fetch('/mobile/v1/integration', method='POST', body='{"message": "log"}',
+                                  headers={'X-Request-ID': 'abc', 'Content-Encoding': 'identity'})
+            self.assertEqual(response.code, 200)
+            self.io_loop.run_sync(lambda: gen.sleep(0.01))
+
+        with open(self.path) as f:
+            traces = [json.loads(line) for line in f]
+        self.assertEqual(len(traces), 1)
+        self.assertEqual((traces[0]['request_id'], traces[0]['route'], traces[0]['status'], traces[0]['messages']),
+                         ('abc', 'mobile', 200, 1))
+        self.assertEqual(sorted(traces[0]['spans_ms']), ['confirm', 'publish', 'request'])
+        self.assertEqual(self.amqp_con.publish.call_args[1]['headers']['x-request-id'], 'abc')
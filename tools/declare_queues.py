@@ -0,0 +1,50 @@
+"""
+Declare the AMQP queues of the enabled routes, and bind them to their routing keys.
+Run once per deployment, before the workers start:
+
+    python -m tools.declare_queues
+    python -m tools.declare_queues --routes heroku mobile cloudtrail
+"""
+import argparse
+import logging
+import sys
+
+from tornado import gen
+from tornado.ioloop import IOLoop
+
+from src.config import RoutesConfig
+from src.lib.AMQPConnection import AMQPConnection
+from src.lib.routing import DEFAULTS, Route, load_routes
+
+
+@gen.coroutine
+def declare_queues(routes):
+    """
+    :param routes: the Routes whose queues are declared
+    :return: True if every queue has been declared
+    """
+    amqp_con = AMQPConnection()
+    res = yield amqp_con.connect(IOLoop.current())
+    if not res:
+        return False
+    for route in routes:
+        for queue, routing_key in route.queues:
+            yield amqp_con.declare_queue(queue)
+            yield amqp_con.bind_queue(queue, routing_key)
+    yield amqp_con.disconnect()
+    return True
+
+
+def main():
+    definitions = load_routes()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--routes', nargs='*', default=RoutesConfig.enabled, choices=sorted(definitions))
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    routes = [Route(name, **dict(DEFAULTS, **definitions[name])) for name in args.routes]
+    if not IOLoop.current().run_sync(lambda: declare_queues(routes)):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,36 +1,21 @@
 from logging import getLogger
-from linecache import getline
-from os import sep
-from tracemalloc import start, Filter, take_snapshot
+
+from src.lib.profiling import MemoryProfiler
 
 
 def record_top(key_type='lineno', limit=10):
     '''see https://docs.python.org/3.5/library/tracemalloc.html#pretty-top
-    Requires python 3.4+.'''
-    kb = 2**10
+    Requires python 3.4+, and tracemalloc to be started.'''
     logger = getLogger("tornado.application")
     record = logger.info
-    snapshot = take_snapshot()
-    snapshot = snapshot.filter_traces((
-        Filter(False, "<frozen importlib._bootstrap>"),
-        Filter(False, "<unknown>"),
-    ))
-    top_stats = snapshot.statistics(key_type)
+    top = MemoryProfiler().top(key_type, limit)
 
     record("Top %s lines" % limit)
-    for index, stat in enumerate(top_stats[:limit], 1):
-        frame = stat.traceback[0]
-        # replace "/path/to/module/file.py" with "module/file.py"
-        filename = sep.join(frame.filename.split(sep)[-2:])
-        record("#%s: %s:%s: %.1f KiB" % (index, filename, frame.lineno,
-                                         stat.size / kb))
-        line = getline(frame.filename, frame.lineno).strip()
-        if line:
-            record('    %s' % line)
+    for index, stat in enumerate(top['top'], 1):
+        record("#%s: %s:%s: %.1f KiB" % (index, stat['file'], stat['line'], stat['size_kb']))
+        if stat['code']:
+            record('    %s' % stat['code'])
 
-    other = top_stats[limit:]
-    if other:
-        size = sum(stat.size for stat in other)
-        record("%s other: %.1f KiB" % (len(other), size / kb))
-    total = sum(stat.size for stat in top_stats)
-    record("Total allocated size: %.1f KiB" % (total / kb))
+    if top['other_count']:
+        record("%s other: %.1f KiB" % (top['other_count'], top['other_kb']))
+    record("Total allocated size: %.1f KiB" % top['total_kb'])
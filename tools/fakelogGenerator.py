@@ -1,141 +1,311 @@
-import requests
+"""
+Fake log load generator.
+
+Payloads are generated once, before the load starts, so the generator does not
+compete with the service for CPU: Heroku octet-framed drains, gzipped mobile
+JSON logs (`--mobile-events` per NDJSON request) and gzipped CloudTrail Records.
+
+Two modes:
+ * closed-loop (default): `--concurrency` clients send a request as soon as the previous one is answered
+ * open-loop: `--rate` requests per second are sent whatever the response time, at most `--concurrency`
+   in flight. The latency is measured from the scheduled send time.
+
+Connections are kept alive between requests, `--no-keep-alive` opens a new one per request.
+
+Every second it prints the number of requests, the error rate, the latency percentiles, the bytes sent
+and the connection reuse ratio.
+
+    python -m tools.fakelogGenerator --url http://127.0.0.1:8080 --kind heroku --concurrency 1000
+    python -m tools.fakelogGenerator --url http://127.0.0.1:8080 --kind mix --rate 5000 --duration 60
+"""
+import argparse
 import datetime
-from loremipsum import get_sentence
+import gzip
+import json
 import random
 import uuid
-import threading
-import time
-import pytz
+from time import perf_counter
+
+from tornado import gen
+from tornado.httpclient import AsyncHTTPClient, HTTPRequest
+from tornado.ioloop import IOLoop, PeriodicCallback
+
+from src.lib.keepAliveClient import KeepAliveHTTPClient
 
+WORDS = ('lorem', 'ipsum', 'dolor', 'sit', 'amet', 'consecteteur', 'adipiscing', 'elit', 'quis', 'ad',
+         'odio', 'ut', 'arcu', 'mi', 'et', 'vel', 'taciti', 'facilisi', 'nunc', 'porta', 'morbi', 'justo')
+DYNOS = ('web.1', 'web.2', 'worker.1', 'router')
+LEVELS = ('debug', 'info', 'warn', 'error')
+EVENTS = (('ec2.amazonaws.com', 'DescribeInstances', True), ('s3.amazonaws.com', 'GetObject', True),
+          ('s3.amazonaws.com', 'PutObject', False), ('iam.amazonaws.com', 'ListRoles', True),
+          ('signin.amazonaws.com', 'ConsoleLogin', False), ('ec2.amazonaws.com', 'RunInstances', False))
 
-class HerokuRequestGenerator:
+
+def sentence(rng, min_words=3, max_words=30):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(min_words, max_words))).capitalize() + '.'
+
+
+def timestamp():
+    return datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0).isoformat()
+
+
+def heroku_line(rng, app, date):
     """
-    Generates and send a fake request (aggregating n fake log lines)
+    :return: a syslog line, prefixed with its length (octet counting framing)
     """
-    def __init__(self, url):
-        self.url = url
-        self.frameCount = 0
-        self.drainId = uuid.uuid4()
-        self.headers = {
-            'Content-type': 'application/logplex-1',
-            'Logplex-Drain-Token': str(self.drainId),
-            'User-Agent': 'Logplex/v72'
-        }
-
-    def send_random_request(self):
-        """
-        send a fake request using a random number of logs in the payload
-        """
-        msg_count = random.randrange(1, 10)
-        payload = bytes()
-        for n in range(msg_count):
-            payload += FakeHerokuLog().encode()
-
-        self.headers['Logplex-Msg-Count'] = str(msg_count)
-        self.headers['Logplex-Frame-Id'] = str(self.frameCount)
-        self.frameCount += 1
-        try:
-            return requests.post(self.url, data=payload, headers=self.headers), payload
-        except requests.exceptions.Timeout:
-            return None, payload
+    msg = '<40>1 {} host {} {} - {}\n'.format(date, app, rng.choice(DYNOS), sentence(rng)).encode('utf-8')
+    return b'%d %s' % (len(msg), msg)
 
 
-class FakeHerokuLog:
+def heroku_payload(rng, app='DummyAppName', max_lines=10):
     """
-    Generates a fake log line
+    :return: a tuple (body, msg_count) of a Logplex drain request
     """
-    def __init__(self):
-        self.date = datetime.datetime.now().replace(microsecond=0, tzinfo=pytz.utc)
-        self.text = get_sentence(True)
-        self.app = 'DummyAppName'
-        self.dyno = 'web.1'
-        self.msg = '<40>1 {} host {} {} - {}\n'.format(self.date.isoformat(), self.app, self.dyno, self.text)
+    date = timestamp()
+    msg_count = rng.randint(1, max_lines)
+    return b''.join(heroku_line(rng, app, date) for _ in range(msg_count)), msg_count
+
 
-    def encode(self):
-        msg = self.msg.encode('utf-8')
-        size = len(msg)
-        msg_header = '{} '.format(size).encode('utf-8')
-        return msg_header + msg
+def mobile_event(rng):
+    return {'message': sentence(rng), 'level': rng.choice(LEVELS), 'userId': rng.randint(1, 100000),
+            'requestId': str(uuid.UUID(int=rng.getrandbits(128))), 'timestamp': timestamp()}
 
 
-class GenWorker:
+def mobile_payload(rng, events=1):
     """
-    Infinite message generation worker
+    :return: a gzipped JSON mobile log, NDJSON logs for several events
     """
-    def __init__(self, url):
-        self.shouldStop = False
-        self.stats = {'sent': 0, 'timeout': 0}
-        self.url = url
-
-    def get_stats(self):
-        return self.stats
-
-    def run(self):
-        gen = HerokuRequestGenerator(self.url)
-        while self.shouldStop is False:
-            self.stats['sent'] += 1
-            r, msg = gen.send_random_request()
-            if not r:
-                self.stats['timeout'] += 1
-                continue
-            if r.status_code != 200:
-                print('status_code != 200', r, msg)
-
-
-def start_thread(obj):
+    return gzip.compress('\n'.join(json.dumps(mobile_event(rng)) for _ in range(events)).encode('utf-8'))
+
+
+def cloudtrail_record(rng):
+    source, name, read_only = rng.choice(EVENTS)
+    return {'eventVersion': '1.05', 'eventSource': source, 'eventName': name, 'readOnly': read_only,
+            'eventTime': timestamp(), 'awsRegion': 'eu-west-1',
+            'sourceIPAddress': '10.0.0.{}'.format(rng.randint(1, 254)),
+            'userIdentity': {'type': 'IAMUser', 'userName': rng.choice(WORDS)},
+            'requestParameters': {'description': sentence(rng)},
+            'responseElements': {'items': [sentence(rng) for _ in range(rng.randint(0, 5))]}}
+
+
+def cloudtrail_payload(rng, max_records=50):
     """
-    helper func to create and start a thread
-    :param obj: the target object
-    :return: a tuple with the worker, and the created started thread
+    :return: a gzipped CloudTrail log file content
     """
-    sender = threading.Thread(target=obj.run)
-    sender.start()
-    return obj, sender
+    records = [cloudtrail_record(rng) for _ in range(rng.randint(1, max_records))]
+    return gzip.compress(json.dumps({'Records': records}).encode('utf-8'))
 
 
-def stop_thread(o):
+class Corpus:
     """
-    helper func to stop a dedicated thread
-    :param o: a tuple containing the worker and the thread
-    :return:
+    Pre-generated requests (path, body, headers) for the given kinds of payload
     """
-    obj, t = o
-    obj.shouldStop = True
-    t.join()
+    PATHS = {
+        'heroku': '/heroku/v1/{}/DummyAppName',
+        'mobile': '/mobile/v1/{}',
+        'cloudtrail': '/cloudtrail/v1/{}',
+    }
+
+    def __init__(self, kinds, size=1000, env='integration', seed=0, mobile_events=1):
+        rng = random.Random(seed)
+        self.mobile_events = mobile_events
+        self.requests = []
+        for n in range(size):
+            kind = kinds[n % len(kinds)]
+            self.requests.append(self._make(kind, rng, self.PATHS[kind].format(env)))
+
+    def _make(self, kind, rng, path):
+        if kind == 'heroku':
+            body, msg_count = heroku_payload(rng)
+            return path, body, {'Content-Type': 'application/logplex-1', 'Logplex-Msg-Count': str(msg_count),
+                                'Logplex-Drain-Token': 'd.{}'.format(uuid.UUID(int=rng.getrandbits(128))),
+                                'User-Agent': 'Logplex/v72'}
+        if kind == 'mobile':
+            content_type = 'application/x-ndjson' if self.mobile_events > 1 else 'application/json'
+            return path, mobile_payload(rng, self.mobile_events), {'Content-Type': content_type,
+                                                                   'Content-Encoding': 'gzip'}
+        return path, cloudtrail_payload(rng), {'Content-Type': 'application/json', 'Content-Encoding': 'gzip',
+                                               'Accept-Encoding': 'gzip'}
+
+    def __len__(self):
+        return len(self.requests)
 
+    def __getitem__(self, index):
+        return self.requests[index % len(self.requests)]
 
-def get_stats(worker):
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else 0
+
+
+class Stats:
     """
-    generate statistics on a given worker and return them
-    :param worker: a worker object
-    :return:
+    Latencies and status codes recorded since the last report
     """
-    stats = worker.get_stats()
-    return stats['sent'], stats['timeout']
 
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.dropped = 0
+        self.bytes = 0
+        self.total = 0
+        self.total_errors = 0
+
+    def record(self, latency, code, size=0):
+        self.latencies.append(latency)
+        self.bytes += size
+        if code != 200:
+            self.errors += 1
+
+    def pop(self):
+        latencies, errors, dropped, sent = sorted(self.latencies), self.errors, self.dropped, self.bytes
+        self.latencies, self.errors, self.dropped, self.bytes = [], 0, 0, 0
+        self.total += len(latencies)
+        self.total_errors += errors
+        return {
+            'requests': len(latencies),
+            'errors': errors,
+            'error_rate': errors / len(latencies) if latencies else 0,
+            'dropped': dropped,
+            'p50_ms': percentile(latencies, 50) * 1000,
+            'p90_ms': percentile(latencies, 90) * 1000,
+            'p99_ms': percentile(latencies, 99) * 1000,
+            'max_ms': latencies[-1] * 1000 if latencies else 0,
+            'sent_kb': sent / 1024,
+        }
 
-def run(url, client_count):
+
+class LoadGenerator:
     """
-    run the fake log generator targeting the given 'url' with 'clientCount' clients
-    :param url: the target url
-    :param client_count: number of client to create (nb of threads)
-    :return:
+    Send the corpus requests to the target, in closed-loop or open-loop mode
     """
-    workers = [GenWorker(url) for _ in range(client_count)]
-    threads = list(map(start_thread, workers))
 
-    try:
-        last_sent = 0
-        last_timeout = 0
-        while True:
-            time.sleep(1)
-            [total_sent, total_timeout] = [sum(el) for el in zip(*map(get_stats, workers))]
-            print('last second stats, sent:', total_sent - last_sent, 'timeout:', total_timeout - last_timeout)
-            last_sent, last_timeout = total_sent, total_timeout
+    def __init__(self, url, corpus, concurrency=100, rate=None, timeout=30, keep_alive=True):
+        self.url = url.rstrip('/')
+        self.corpus = corpus
+        self.concurrency = concurrency
+        self.rate = rate
+        self.timeout = timeout
+        self.keep_alive = keep_alive
+        self.stats = Stats()
+        self.in_flight = 0
+        self.frame_id = 0
+        self.connections = 0
+        self.should_stop = False
+        if keep_alive:
+            self.client = KeepAliveHTTPClient(self.url, max_connections=concurrency, connect_timeout=timeout,
+                                              request_timeout=timeout)
+        else:
+            # tornado's simple client opens a new connection for each request
+            self.client = AsyncHTTPClient(max_clients=concurrency)
+
+    def _request(self):
+        path, body, headers = self.corpus[self.frame_id]
+        if 'Logplex-Msg-Count' in headers:
+            headers = dict(headers, **{'Logplex-Frame-Id': str(self.frame_id)})
+        self.frame_id += 1
+        return path, body, headers
+
+    @gen.coroutine
+    def fetch(self, path, body, headers):
+        """
+        :return: the response status code
+        """
+        if self.keep_alive:
+            response = yield self.client.fetch('POST', path, body, headers)
+        else:
+            request = HTTPRequest(self.url + path, method='POST', body=body, headers=headers,
+                                  decompress_response=False, connect_timeout=self.timeout,
+                                  request_timeout=self.timeout)
+            response = yield self.client.fetch(request, raise_error=False)
+        return response.code
 
+    @gen.coroutine
+    def send(self, start):
+        self.in_flight += 1
+        path, body, headers = self._request()
+        try:
+            code = yield self.fetch(path, body, headers)
+        except Exception:
+            code = 599
+        finally:
+            self.in_flight -= 1
+        self.stats.record(perf_counter() - start, code, len(body))
+
+    @gen.coroutine
+    def closed_loop_client(self):
+        while not self.should_stop:
+            yield self.send(perf_counter())
+
+    @gen.coroutine
+    def open_loop(self, tick=0.005):
+        """
+        send `rate` requests per second, measuring the latency from the scheduled send time
+        """
+        start = perf_counter()
+        scheduled = 0
+        while not self.should_stop:
+            now = perf_counter()
+            due = int((now - start) * self.rate)
+            while scheduled < due:
+                send_time = start + scheduled / self.rate
+                scheduled += 1
+                if self.in_flight >= self.concurrency:
+                    self.stats.dropped += 1
+                    continue
+                IOLoop.current().add_future(self.send(send_time), lambda f: f.result())
+            yield gen.sleep(tick)
+
+    def report(self):
+        stats = self.stats.pop()
+        if self.keep_alive:
+            opened, self.connections = self.client.connections - self.connections, self.client.connections
+        else:
+            opened = stats['requests']
+        stats['reuse'] = 1 - opened / stats['requests'] if stats['requests'] else 0
+        print('requests: {requests:>7} errors: {errors:>5} ({error_rate:.2%}) dropped: {dropped:>5} '
+              'p50: {p50_ms:.1f}ms p90: {p90_ms:.1f}ms p99: {p99_ms:.1f}ms max: {max_ms:.1f}ms sent: {sent_kb:.0f}kB '
+              'connection reuse: {reuse:.1%}'.format(**stats))
+
+    @gen.coroutine
+    def run(self, duration=None):
+        reporter = PeriodicCallback(self.report, 1000)
+        reporter.start()
+        if self.rate:
+            load = self.open_loop()
+        else:
+            load = gen.multi([self.closed_loop_client() for _ in range(self.concurrency)])
+        if duration:
+            yield gen.sleep(duration)
+            self.should_stop = True
+        yield load
+        reporter.stop()
+        self.report()
+        print('total requests: {} errors: {}'.format(self.stats.total, self.stats.total_errors))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:8080', help='the service base url')
+    parser.add_argument('--kind', choices=('heroku', 'mobile', 'cloudtrail', 'mix'), default='heroku')
+    parser.add_argument('--env', default='integration', help='the env segment of the routes')
+    parser.add_argument('--concurrency', type=int, default=100, help='maximum number of concurrent requests')
+    parser.add_argument('--rate', type=float, help='open-loop mode, requests per second')
+    parser.add_argument('--duration', type=float, help='seconds, run until interrupted by default')
+    parser.add_argument('--corpus-size', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--mobile-events', type=int, default=1, help='mobile events per NDJSON request')
+    parser.add_argument('--no-keep-alive', action='store_true', help='open a new connection per request')
+    args = parser.parse_args()
+
+    kinds = ('heroku', 'mobile', 'cloudtrail') if args.kind == 'mix' else (args.kind,)
+    corpus = Corpus(kinds, args.corpus_size, args.env, args.seed, args.mobile_events)
+    generator = LoadGenerator(args.url, corpus, args.concurrency, args.rate, keep_alive=not args.no_keep_alive)
+    try:
+        IOLoop.current().run_sync(lambda: generator.run(args.duration))
     except KeyboardInterrupt:
-        list(map(stop_thread, threads))
+        generator.report()
+
 
 if __name__ == '__main__':
-    run('http://127.0.0.1:8000/heroku/v1/production/DummyAppName', 1)
-    #run('http://127.0.0.1:8080/mobile/v1/production', 1)
+    main()
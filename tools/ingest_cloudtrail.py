@@ -0,0 +1,68 @@
+"""
+Ingest CloudTrail log files from an object store, to backfill the log files
+S3 notified while the service was down, or downloaded ones:
+
+    # every log file of a bucket, under a prefix
+    python -m tools.ingest_cloudtrail --bucket my-trail --prefix AWSLogs/123456789012/CloudTrail/eu-west-1/2017/06/
+    # the objects of saved notifications, one JSON notification per line
+    python -m tools.ingest_cloudtrail --notifications notifications.jsonl
+
+The objects are read from the CLOUDTRAIL_S3_STORE object store, S3 by default, or
+CLOUDTRAIL_S3_DIRECTORY/<bucket> for the local one; the objects of
+CLOUDTRAIL_S3_CHECKPOINT_FILE are skipped.
+"""
+import argparse
+import logging
+import sys
+
+from tornado import gen
+from tornado.ioloop import IOLoop
+
+from src.lib.AMQPConnection import AMQPConnection
+from src.lib.cloudtrailS3 import default_ingester, parse_notification
+
+
+@gen.coroutine
+def ingest(objects, routing_key):
+    """
+    :param objects: the (bucket, key) of the log files
+    :return: True if every log file has been ingested
+    """
+    amqp_con = AMQPConnection()
+    res = yield amqp_con.connect(IOLoop.current())
+    if not res:
+        return False
+    try:
+        count = yield default_ingester().ingest(objects, lambda record: amqp_con.publish(routing_key, record))
+        logging.info("{} records of {} log files published".format(count, len(objects)))
+        return True
+    except Exception as e:
+        logging.error("CloudTrail ingestion failed: {}".format(e))
+        return False
+    finally:
+        yield amqp_con.disconnect()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bucket', help='ingest the objects of this bucket')
+    parser.add_argument('--prefix', default='', help='the key prefix of the objects of the bucket')
+    parser.add_argument('--notifications', help='a file of JSON notifications, one per line')
+    parser.add_argument('--routing-key', default='cloudtrail.v1.production')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.notifications:
+        with open(args.notifications) as f:
+            objects = [item for line in f if line.strip() for item in parse_notification(line)]
+    elif args.bucket:
+        keys = IOLoop.current().run_sync(lambda: default_ingester().store.list(args.bucket, args.prefix))
+        objects = [(args.bucket, key) for key in keys]
+    else:
+        parser.error('--bucket or --notifications is required')
+    if not IOLoop.current().run_sync(lambda: ingest(objects, args.routing_key)):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,325 @@
+"""
+Replay archived logs to RabbitMQ, without going through the HTTP layer:
+the messages are transformed as the handlers do, and published in batches.
+
+Inputs, by --kind:
+ * heroku: raw Logplex drain bodies (octet-counted syslog frames), split as the Heroku handler does
+ * mobile: NDJSON files, one event per line, normalized when MOBILE_NORMALIZE is set
+ * cloudtrail: CloudTrail log files, gzipped or not, through the CloudTrail filter
+ * appendlog: append log directories (APPEND_LOG_DIRECTORY), published with their own routing keys
+
+The files are memory mapped. The offset reached in each file is saved in the --state file once
+its messages are confirmed, a replay interrupted then started again resumes from there.
+
+    python -m tools.replay --kind heroku --path /heroku/v1/production/myapp drains/*.log
+    python -m tools.replay --kind cloudtrail --path /cloudtrail/v1/production --rate 2000 trail/*.json.gz
+    python -m tools.replay --kind appendlog /tmp/heroku2elk-log --state replay.state
+"""
+import argparse
+import json
+import logging
+import mmap
+import os
+import sys
+from time import perf_counter
+
+from tornado import gen
+from tornado.ioloop import IOLoop
+
+from src.config import TruncateConfig
+from src.handlers.heroku import drain_format
+from src.lib.AMQPConnection import AMQPConnection
+from src.lib.BatchPublisher import BatchPublisher
+from src.lib.appendLog import PartitionReader, list_partitions
+from src.lib.cloudtrailFilter import default_filter
+from src.lib.cloudtrailS3 import RecordStream
+from src.lib.mobileSchema import default_normalizer
+from src.lib.routing import default_route
+from src.lib.syslogSplitter import QUARANTINED, decode, iter_frames
+
+CHUNK_SIZE = 64 * 1024
+
+
+def map_file(path):
+    """
+    :return: a read-only mmap of the file, None if it is empty
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return None
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class HerokuSource:
+    """
+    A file of Logplex drain bodies, the offset is the position of the next frame
+    """
+
+    def __init__(self, path, uri):
+        self.path = path
+        self.uri = uri
+        self.size = os.path.getsize(path)
+        self.route = default_route('heroku')
+
+    def batches(self, offset, batch_size):
+        data = map_file(self.path)
+        if data is None:
+            return
+        drain = drain_format(self.uri)
+        routing_key = self.route.routing_key(self.uri, self.route.shard({}))
+        try:
+            # the frame boundaries are found as the Heroku handler does, resynchronizing on malformed frames
+            messages = []
+            for kind, start, end in iter_frames(data, offset):
+                if kind == QUARANTINED:
+                    messages.append((routing_key, drain.format(data[start:end].decode('utf-8', 'replace'), True)))
+                else:
+                    messages.append((routing_key, drain.format(decode(data[start:end], TruncateConfig))))
+                if len(messages) == batch_size:
+                    yield messages, end, end
+                    messages = []
+            if messages:
+                yield messages, len(data), len(data)
+        finally:
+            data.close()
+
+
+class MobileSource:
+    """
+    A NDJSON file of mobile events, the offset is the position of the next line
+    """
+
+    def __init__(self, path, uri):
+        self.path = path
+        self.uri = uri
+        self.size = os.path.getsize(path)
+        self.route = default_route('mobile')
+        self.normalizer = default_normalizer()
+
+    def batches(self, offset, batch_size):
+        data = map_file(self.path)
+        if data is None:
+            return
+        version = self.uri.split('/', 3)[2]
+        try:
+            position = offset
+            while position < len(data):
+                events = []
+                while position < len(data) and len(events) < batch_size:
+                    end = data.find(b'\n', position)
+                    end = len(data) if end < 0 else end + 1
+                    line = data[position:end].strip()
+                    if line:
+                        events.append(line)
+                    position = end
+                if self.normalizer is not None:
+                    events = self.normalizer.normalize(version, events)
+                routing_key = self.route.routing_key(self.uri, self.route.shard({}))
+                yield [(routing_key, event) for event in events], position, position
+        finally:
+            data.close()
+
+
+class CloudTrailSource:
+    """
+    A CloudTrail log file, the offset is the number of records already read
+    """
+
+    def __init__(self, path, uri):
+        self.path = path
+        self.uri = uri
+        self.size = os.path.getsize(path)
+        self.route = default_route('cloudtrail')
+        self.record_filter = default_filter()
+
+    def batches(self, offset, batch_size):
+        data = map_file(self.path)
+        if data is None:
+            return
+        try:
+            stream = RecordStream()
+            read = 0
+            messages = []
+            for position in range(0, len(data), CHUNK_SIZE):
+                for record in stream.feed(data[position:position + CHUNK_SIZE]):
+                    read += 1
+                    if read <= offset:
+                        continue
+                    if self.record_filter is not None:
+                        record = self.record_filter.apply(record)
+                        if record is None:
+                            continue
+                    messages.append((self.route.routing_key(self.uri, self.route.shard({})), json.dumps(record)))
+                    if len(messages) >= batch_size:
+                        yield messages, read, min(position + CHUNK_SIZE, len(data))
+                        messages = []
+            stream.close()
+            yield messages, read, len(data)
+        finally:
+            data.close()
+
+
+class AppendLogSource:
+    """
+    An append log partition, the offset is the offset of the next record
+    """
+
+    def __init__(self, path, uri=None):
+        self.path = path
+        self.size = None
+        self.reader = PartitionReader(path)
+
+    def batches(self, offset, batch_size):
+        messages = []
+        for record in self.reader.read(offset):
+            messages.append((record.routing_key, record.body))
+            offset = record.offset + 1
+            if len(messages) >= batch_size:
+                yield messages, offset, None
+                messages = []
+        if messages:
+            yield messages, offset, None
+
+
+SOURCES = {
+    'heroku': HerokuSource,
+    'mobile': MobileSource,
+    'cloudtrail': CloudTrailSource,
+    'appendlog': AppendLogSource,
+}
+
+
+class State:
+    """
+    The offsets reached in the replayed files, saved as JSON
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.offsets = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.offsets = json.load(f)
+
+    def save(self):
+        if not self.path:
+            return
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump(self.offsets, f, indent=2, sort_keys=True)
+        os.replace(self.path + '.tmp', self.path)
+
+
+class Replay:
+    """
+    Publish the messages of the sources in batches, at most `rate` messages per second:
+    each batch is confirmed before the next one is read, then its offset is saved.
+    """
+
+    def __init__(self, publisher, state, batch_size=500, rate=None, save_interval=5):
+        self.publisher = publisher
+        self.state = state
+        self.batch_size = batch_size
+        self.rate = rate
+        self.save_interval = save_interval
+        self.published = 0
+        self.failed = 0
+        self.start = None
+        self._last_report = 0
+        self._last_save = 0
+
+    @gen.coroutine
+    def run(self, sources):
+        self.start = perf_counter()
+        for source in sources:
+            offset = self.state.offsets.get(source.path, 0)
+            for messages, offset, position in source.batches(offset, self.batch_size):
+                confirmed = yield [self.publisher.publish(routing_key, body) for routing_key, body in messages]
+                failed = confirmed.count(False)
+                if failed:
+                    self.failed += failed
+                    raise IOError("{}: {} messages not confirmed, replay stopped at offset {}"
+                                  .format(source.path, failed, self.state.offsets.get(source.path, 0)))
+                self.published += len(messages)
+                self.state.offsets[source.path] = offset
+                self._progress(source, position)
+                yield self._throttle()
+            self.state.save()
+        self.state.save()
+        self.report()
+
+    @gen.coroutine
+    def _throttle(self):
+        if self.rate:
+            delay = self.start + self.published / self.rate - perf_counter()
+            if delay > 0:
+                yield gen.sleep(delay)
+
+    def _progress(self, source, position):
+        now = perf_counter()
+        if now - self._last_save >= self.save_interval:
+            self._last_save = now
+            self.state.save()
+        if now - self._last_report >= 1:
+            self._last_report = now
+            done = ' {:.1%}'.format(position / source.size) if position is not None and source.size else ''
+            print('{}{} offset: {} published: {} ({:.0f} msg/s)'.format(
+                source.path, done, self.state.offsets[source.path], self.published,
+                self.published / (now - self.start)), flush=True)
+
+    def report(self):
+        elapsed = perf_counter() - self.start
+        print('published: {} messages in {:.1f}s ({:.0f} msg/s)'.format(
+            self.published, elapsed, self.published / elapsed if elapsed else 0), flush=True)
+
+
+class ReplayBatchConfig:
+    def __init__(self, batch_size, linger_ms):
+        self.batch_size = batch_size
+        self.linger_ms = linger_ms
+
+
+@gen.coroutine
+def replay(sources, state, batch_size, rate):
+    """
+    :return: True if every message has been published
+    """
+    amqp_con = AMQPConnection()
+    res = yield amqp_con.connect(IOLoop.current())
+    if not res:
+        return False
+    try:
+        publisher = BatchPublisher(amqp_con, ReplayBatchConfig(min(batch_size, 1000), 5))
+        yield Replay(publisher, state, batch_size, rate).run(sources)
+        return True
+    except Exception as e:
+        logging.error("Replay failed: {}".format(e))
+        state.save()
+        return False
+    finally:
+        yield amqp_con.disconnect()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('inputs', nargs='+', help='the archived files, append log directories for appendlog')
+    parser.add_argument('--kind', choices=sorted(SOURCES), required=True)
+    parser.add_argument('--path', help='the URL path the messages were sent to, e.g. /heroku/v1/production/myapp')
+    parser.add_argument('--batch-size', type=int, default=500, help='messages confirmed at once')
+    parser.add_argument('--rate', type=float, help='maximum messages per second')
+    parser.add_argument('--state', help='the file of the offsets reached, to resume an interrupted replay')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.kind == 'appendlog':
+        paths = [partition for directory in args.inputs for partition in list_partitions(directory)]
+    elif not args.path:
+        parser.error('--path is required for {}'.format(args.kind))
+    else:
+        paths = args.inputs
+    sources = [SOURCES[args.kind](path, args.path) for path in paths]
+    if not IOLoop.current().run_sync(lambda: replay(sources, State(args.state), args.batch_size, args.rate)):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()